@@ -0,0 +1,151 @@
+#Benchmarks of the law interpreter.
+#
+#to run the benchmarks use:
+#python3 benchmark.py
+
+import time
+
+import law
+
+########################################################################
+#  HELPERS
+# ######################################################################
+
+def parse(text, fn='<benchmark>'):
+    lexer=law.Lexer(fn, text)
+    tokens,error=lexer.make_tokens()
+    if error: raise Exception(error.as_string())
+
+    ast=law.Parser(tokens).parse()
+    if ast.error: raise Exception(ast.error.as_string())
+    return ast.node
+
+def time_it(label, func, repeat=5):
+    best=None
+    for _ in range(repeat):
+        start=time.perf_counter()
+        func()
+        elapsed=time.perf_counter()-start
+        if best is None or elapsed<best: best=elapsed
+    print(f'{label:<40} {best*1000:10.2f} ms')
+    return best
+
+########################################################################
+#  SHORT-CIRCUIT AND / OR
+# ######################################################################
+
+class EagerInterpreter(law.Interpreter):
+    """
+    Interpreter that always visits both sides of AND / OR, like before the short-circuit.
+    Only used as a reference point for the benchmark.
+    """
+
+    def visit_BinOpNode(self,node,context):
+        if not (node.op_tok.matches(law.TT_KEYWORD, 'AND') or node.op_tok.matches(law.TT_KEYWORD, 'OR')):
+            return super().visit_BinOpNode(node,context)
+
+        res=law.RTResult()
+        left=res.register(self.visit(node.left_node,context))
+        if res.error:return res
+        right=res.register(self.visit(node.right_node,context))
+        if res.error:return res
+
+        if node.op_tok.matches(law.TT_KEYWORD, 'AND'):
+            result,error=left.anded_by(right)
+        else:
+            result,error=left.ored_by(right)
+        if error: return res.failure(error)
+        return res.success(result.set_pos(node.pos_start,node.pos_end))
+
+def bench_short_circuit():
+    print('Short-circuit AND / OR (right operand skipped 99% of the time)')
+
+    # the guard is only true for the last 10 of the 1000 iterations
+    law.run('<benchmark>','FUN costly(n) -> (FOR i = 0 TO n THEN i) / 0')
+    node=parse('FOR balance = 0 TO 1000 THEN balance > 990 AND costly(200)')
+
+    def evaluate(interpreter):
+        context=law.Context('<program>')
+        context.symbol_table=law.global_symbol_table
+        result=interpreter.visit(node,context)
+        if result.error: raise Exception(result.error.as_string())
+        return result.value
+
+    assert str(evaluate(law.Interpreter()))==str(evaluate(EagerInterpreter()))
+
+    eager=time_it('eager AND', lambda: evaluate(EagerInterpreter()))
+    lazy=time_it('short-circuit AND', lambda: evaluate(law.Interpreter()))
+    print(f'{"speed-up":<40} {eager/lazy:10.1f} x')
+
+########################################################################
+#  ENGINES
+# ######################################################################
+
+ENGINE_LAWS=[
+    ('FUN fact(n) -> IF n <= 1 THEN 1 ELSE n * fact(n-1)', None),
+    ('FOR i = 0 TO 300 THEN fact(20)', 'factorial loop'),
+    ('FOR i = 0 TO 20000 THEN i * 2 + 1 > 100 AND i / 3 < 1000', 'arithmetic loop'),
+]
+
+def bench_engines():
+    print('Engines (same law on each engine given to run())')
+
+    for engine in law.ENGINES:
+        for text,label in ENGINE_LAWS:
+            if label is None:
+                law.run('<benchmark>',text,engine=engine)
+                continue
+
+            def evaluate():
+                result,error=law.run('<benchmark>',text,engine=engine)
+                if error: raise Exception(error.as_string())
+            time_it(f'{engine}: {label}', evaluate)
+
+########################################################################
+#  SHORT LAWS
+# ######################################################################
+
+def bench_short_laws(runs=1000):
+    print(f'Short law run {runs} times (lexed, parsed and compiled once, then taken from the cache)')
+    text='FOR i = 0 TO 3 THEN i * 2 + 1 > 5 AND i < 1000'
+
+    def evaluate(engine, cached=True):
+        for _ in range(runs):
+            if not cached: law.closure_cache.clear()
+            result,error=law.run('<benchmark>',text,engine=engine)
+            if error: raise Exception(error.as_string())
+
+    uncached=time_it('closure: compiled at each run', lambda: evaluate('closure', cached=False))
+    cached=time_it('closure: cached', lambda: evaluate('closure'))
+    print(f'{"speed-up":<40} {uncached/cached:10.1f} x')
+    for engine in ('interpreter','jit','tiered'):
+        time_it(f'{engine}', lambda: evaluate(engine))
+
+    # the cache keeps the JIT_CACHE_SIZE laws run last
+    for i in range(law.JIT_CACHE_SIZE+10):
+        law.run('<benchmark>',f'{i} + 1',engine='closure')
+    assert len(law.closure_cache)==law.JIT_CACHE_SIZE, len(law.closure_cache)
+
+########################################################################
+#  STEP BUDGET AND TIMEOUT
+# ######################################################################
+
+def bench_budget():
+    print('Overhead of the step budget and timeout checks (hot loop)')
+    text='FOR i = 0 TO 20000 THEN i * 2 + 1 > 100 AND i / 3 < 1000'
+
+    for engine in law.ENGINES:
+        def evaluate(**limits):
+            result,error=law.run('<benchmark>',text,engine=engine,**limits)
+            if error: raise Exception(error.as_string())
+        # a few % to measure: more runs than the other benchmarks, the best one is kept
+        free=time_it(f'{engine}: no limits', evaluate, repeat=25)
+        limited=time_it(f'{engine}: max_steps and timeout', lambda: evaluate(max_steps=10**9,timeout=60), repeat=25)
+        print(f'{"overhead":<40} {(limited/free-1)*100:10.1f} %')
+
+
+if __name__ == "__main__":
+    bench_short_circuit()
+    bench_engines()
+    bench_short_laws()
+    bench_budget()
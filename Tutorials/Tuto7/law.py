@@ -5,6 +5,11 @@
 from strings_with_arrows import *
 
 import string
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
 ########################################################################
 #  CONSTANTS
 # ######################################################################
@@ -71,6 +76,54 @@ class RTError(Error):
 
         return 'Traceback (most recent call last):\n '+ result
 
+class LimitError(RTError):
+    """
+    Runtime error given when a law goes over the step budget or the deadline of its run()
+    the position is the one of the loop or call reached, steps: the steps counted so far
+    """
+    def __init__(self,pos_start, pos_end, details,context,steps):
+        super().__init__(pos_start, pos_end, details,context)
+        self.error_name='Limit Exceeded'
+        self.steps=steps
+
+class Budget:
+    """
+    Limits of one run(): a step is counted at each loop iteration and each function call
+    max_steps: maximum number of steps
+    timeout: maximum duration in seconds, the clock is only read every CLOCK_STEPS steps
+    the engines count the steps down inline in left and only call check() when it goes below 0,
+    so a loop iteration costs a decrement and a comparison, not a call
+    """
+    CLOCK_STEPS=1024
+
+    def __init__(self,max_steps=None,timeout=None):
+        self.max_steps=max_steps if max_steps is not None else float('inf')
+        self.deadline=time.monotonic()+timeout if timeout else None
+        self.steps=0    # steps counted up to the last check()
+        self.chunk=min(self.CLOCK_STEPS,self.max_steps)
+        self.left=self.chunk   # steps before the next check()
+
+    def check(self,node,context):
+        """called at the step after the chunk of steps given by the last check()"""
+        self.steps+=self.chunk+1
+        if self.steps>self.max_steps:
+            return LimitError(node.pos_start,node.pos_end,f'Step budget of {self.max_steps} exceeded',context,self.steps)
+        if self.deadline and time.monotonic()>self.deadline:
+            return LimitError(node.pos_start,node.pos_end,'Timeout exceeded',context,self.steps)
+        self.chunk=min(self.CLOCK_STEPS,self.max_steps-self.steps)
+        self.left=self.chunk
+        return None
+
+class RTException(Exception):
+    """
+    Raised by the compiled engines (which have no RTResult to propagate errors)
+    it carries the RTError with the position of the node that failed
+    """
+
+    def __init__(self,error):
+        super().__init__(error.details)
+        self.error=error
+
 
 
 ########################################################################
@@ -1272,7 +1325,7 @@ class Value:
     def is_true(self):
         return None, self.illegal_operation(other)
 
-    def execute(self,args):
+    def execute(self,args,budget=None):
         return None, self.illegal_operation(other)
 
     def copy(self):
@@ -1505,11 +1558,12 @@ class Function(Value):
         self.body_node=body_node
         self.arg_names=arg_names
 
-    def execute(self, args):
+    def execute(self, args,budget=None):
         res=RTResult()
         interpreter=Interpreter()
         new_context=Context(self.name, self.context, self.pos_start)
         new_context.symbol_table=SymbolTable(new_context.parent.symbol_table)
+        new_context.budget=budget
 
         if len(args) > len(self.arg_names):
             return res.failure(RTError(
@@ -1554,6 +1608,7 @@ class Context:
         self.parent=parent
         self.parent_entry_pos=parent_entry_pos
         self.symbol_table=None
+        self.budget=None    # Budget of the run(), given from the caller to each function call
 
 ########################################################################
 #  SYMBOL TABLE
@@ -1681,6 +1736,18 @@ proper way to run:
         res=RTResult()
         left=res.register(self.visit(node.left_node,context))
         if res.error:return res
+
+        # AND / OR: the right node is only visited when the left value does not already decide the result
+        if isinstance(left,Number):
+            if node.op_tok.matches(TT_KEYWORD, 'AND') and not left.is_true():
+                return res.success(
+                    Number(0).set_context(left.context).set_pos(node.pos_start,node.pos_end)
+                )
+            if node.op_tok.matches(TT_KEYWORD, 'OR') and left.is_true():
+                return res.success(
+                    Number(int(left.value)).set_context(left.context).set_pos(node.pos_start,node.pos_end)
+                )
+
         right=res.register(self.visit(node.right_node,context))
         if res.error:return res
 
@@ -1776,7 +1843,13 @@ proper way to run:
 
 #        print(f"Initial i: {i}, end_value: {end_value.value}, step_value: {step_value.value}")  # Debug print
 
+        budget=context.budget
         while condition():
+            if budget:
+                budget.left-=1
+                if budget.left<0:
+                    error=budget.check(node,context)
+                    if error: return res.failure(error)
             context.symbol_table.set(node.var_name_tok.value,Number(i))
  #           print(f"Loop variable i: {i}")  # Debug print
             i+= step_value.value
@@ -1795,7 +1868,13 @@ proper way to run:
     def visit_WhileNode(self,node,context):
         res=RTResult()
         elements=[]
+        budget=context.budget
         while True:
+            if budget:
+                budget.left-=1
+                if budget.left<0:
+                    error=budget.check(node,context)
+                    if error: return res.failure(error)
             condition=res.register(self.visit(node.condition_node,context))
             if res.error:return res
 
@@ -1832,9 +1911,706 @@ proper way to run:
             args.append(res.register(self.visit(arg_node,context)))
             if res.error: return res
 
-        return_value=res.register(value_to_call.execute(args))
+        budget=context.budget
+        if budget:
+            budget.left-=1
+            if budget.left<0:
+                error=budget.check(node,context)
+                if error: return res.failure(error)
+
+        return_value=res.register(value_to_call.execute(args,budget))
         if res.error: return res
         return res.success(return_value)
+
+########################################################################
+#  CLOSURE COMPILER
+# ######################################################################
+# The values handled by the compiled closures are plain python values:
+#   Number -> int or float, String -> str, List -> list, Function -> CompiledFunction
+
+NUMBER_TYPES=(int,float)
+
+class CompiledFunction:
+    """
+    Function produced by the ClosureCompiler, the body is compiled only once when the FUN is defined.
+    context: is the context where the function was defined (the parent of each call context)
+    """
+
+    def __init__(self, name, body, arg_names, context, pos_start, pos_end):
+        self.name=name or "<anonymous>"
+        self.body=body
+        self.arg_names=arg_names
+        self.context=context
+        self.pos_start=pos_start
+        self.pos_end=pos_end
+
+    def __repr__(self) -> str:
+        return f"<function {self.name}>"
+
+def illegal_operation(node,context):
+    return RTException(RTError(node.pos_start,node.pos_end,'Illegal Operation',context))
+
+def closure_added_to(left,right,node,context):
+    if type(left) in NUMBER_TYPES and type(right) in NUMBER_TYPES: return left+right
+    if type(left) is str and type(right) is str: return left+right
+    if type(left) is list: return left+[right]
+    raise illegal_operation(node,context)
+
+def closure_subbed_by(left,right,node,context):
+    if type(left) in NUMBER_TYPES and type(right) in NUMBER_TYPES: return left-right
+    raise illegal_operation(node,context)
+
+def closure_multed_by(left,right,node,context):
+    if type(left) in NUMBER_TYPES and type(right) in NUMBER_TYPES: return left*right
+    if type(left) is str and type(right) in NUMBER_TYPES: return left*right
+    if type(left) is list and type(right) is list: return left+right
+    raise illegal_operation(node,context)
+
+def closure_dived_by(left,right,node,context):
+    if type(left) in NUMBER_TYPES and type(right) in NUMBER_TYPES:
+        if right==0:
+            raise RTException(RTError(
+                node.right_node.pos_start,node.right_node.pos_end, "Division by zero",
+                context
+            ))
+        return left/right
+    if type(left) is list and type(right) in NUMBER_TYPES:
+        try:
+            return left[right]
+        except (IndexError,TypeError):
+            raise RTException(RTError(
+                node.right_node.pos_start,node.right_node.pos_end,
+                'Element at this index could not be retrived from the list because index is out of bounds',
+                context
+            ))
+    raise illegal_operation(node,context)
+
+def closure_powed_by(left,right,node,context):
+    if type(left) in NUMBER_TYPES and type(right) in NUMBER_TYPES: return left**right
+    raise illegal_operation(node,context)
+
+def closure_comparison(compare):
+    def comparison(left,right,node,context):
+        if type(left) in NUMBER_TYPES and type(right) in NUMBER_TYPES: return int(compare(left,right))
+        raise illegal_operation(node,context)
+    return comparison
+
+def closure_is_true(value,node,context):
+    if type(value) in NUMBER_TYPES: return value!=0
+    if type(value) is str: return len(value)>0
+    raise illegal_operation(node,context)
+
+CLOSURE_BIN_OPS={
+    TT_PLUS: closure_added_to,
+    TT_MINUS: closure_subbed_by,
+    TT_MUL: closure_multed_by,
+    TT_DIV: closure_dived_by,
+    TT_POW: closure_powed_by,
+    TT_EE: closure_comparison(lambda a,b: a==b),
+    TT_NE: closure_comparison(lambda a,b: a!=b),
+    TT_LT: closure_comparison(lambda a,b: a<b),
+    TT_GT: closure_comparison(lambda a,b: a>b),
+    TT_LTE: closure_comparison(lambda a,b: a<=b),
+    TT_GTE: closure_comparison(lambda a,b: a>=b),
+}
+
+def call_compiled_function(func,args,node,context):
+    if not isinstance(func,CompiledFunction): raise illegal_operation(node,context)
+
+    if len(args) > len(func.arg_names):
+        raise RTException(RTError(
+            node.pos_start, node.pos_end,
+            f"{len(args)-len(func.arg_names)} too many args  passed into '{func.name}'",
+            func.context
+        ))
+
+    if len(args) < len(func.arg_names):
+        raise RTException(RTError(
+            node.pos_start, node.pos_end,
+            f"{len(func.arg_names)-len(args)} too few args  passed into '{func.name}'",
+            func.context
+        ))
+
+    budget=context.budget
+    if budget:
+        budget.left-=1
+        if budget.left<0: check_budget(budget,node,context)
+
+    new_context=Context(func.name, func.context, node.pos_start)
+    new_context.symbol_table=SymbolTable(func.context.symbol_table)
+    new_context.symbol_table.symbols=dict(zip(func.arg_names,args))
+    new_context.budget=budget
+    return func.body(new_context)
+
+def check_budget(budget,node,context):
+    """slow path of a step of the compiled engines, once budget.left went below 0"""
+    error=budget.check(node,context)
+    if error: raise RTException(error)
+
+def lookup_symbol(context,var_name,node):
+    symbol_table=context.symbol_table
+    while symbol_table:
+        value=symbol_table.symbols.get(var_name)
+        if value is not None: return value
+        symbol_table=symbol_table.parent
+    raise RTException(RTError(
+        node.pos_start,node.pos_end,
+        f" '{var_name}' is not defined",
+        context
+    ))
+
+def closure_runtime_error(exception):
+    """
+    give a python error raised inside the closures (ZeroDivisionError of 0^-1, TypeError of FOR i=0 TO "a",
+    RecursionError of a too deep recursion...) as an RTError at the position of the innermost node
+    of the law in the traceback, like jit_runtime_error does for the jit engine
+    """
+    node=None
+    context=None
+    tb=exception.__traceback__
+    while tb:
+        frame_locals=tb.tb_frame.f_locals
+        if hasattr(frame_locals.get('node'),'pos_start') and isinstance(frame_locals.get('context'),Context):
+            node=frame_locals['node']
+            context=frame_locals['context']
+        tb=tb.tb_next
+
+    if node is None: raise exception
+    return RTError(node.pos_start,node.pos_end,str(exception) or type(exception).__name__,context)
+
+def to_value(value,context):
+    """
+    convert a python value given by the compiled closures back to the Values of the interpreter
+    so both engines give the same kind of result to run()
+    """
+    if value is None or isinstance(value,(Value,CompiledFunction)): return value
+    if type(value) is str: return String(value).set_context(context)
+    if type(value) is list: return List([to_value(x,context) for x in value]).set_context(context)
+    return Number(value).set_context(context)
+
+
+class ClosureCompiler:
+    """
+    The ClosureCompiler is an alternative to the Interpreter. Instead of visiting the AST each time
+    the program is evaluated, it turns each node once into a python closure taking the context:
+
+        BinOpNode(PLUS)   gives    lambda context: closure_added_to(left(context), right(context), node, context)
+
+    Evaluating the program is then only calls of closures, without RTResult and without the
+    getattr dispatch of the visitor. The errors are raised as RTException carrying the RTError.
+
+proper way to run:
+
+    fn='<stdin>',
+    text=1+2+4
+    lexer=Lexer(fn, text)
+    tokens,error=lexer.make_tokens()
+    if error: return None, error
+
+    #Generate AST
+    parser=Parser(tokens)
+    ast= parser.parse()
+    if ast.error: return None, ast.error
+
+    #Compile and run program
+    program=ClosureCompiler().compile(ast.node)
+    context=Context('<program>')
+    context.symbol_table=SymbolTable()
+    result=program(context)
+
+    """
+
+    def compile(self,node):
+        method_name=f'compile_{type(node).__name__}'
+        method=getattr(self,method_name,self.no_compile_method)
+        return method(node)
+
+    def no_compile_method(self,node):
+        raise Exception(f'No compile_{type(node).__name__} method defined')
+
+    ################################
+
+    def compile_NumberNode(self,node):
+        value=node.tok.value
+        return lambda context: value
+
+    def compile_StringNode(self,node):
+        value=node.tok.value
+        return lambda context: value
+
+    def compile_ListNode(self,node):
+        element_closures=[self.compile(element_node) for element_node in node.element_nodes]
+        return lambda context: [element(context) for element in element_closures]
+
+    def compile_VarAccessNode(self,node):
+        var_name=node.var_name_tok.value
+
+        def var_access(context):
+            value=context.symbol_table.symbols.get(var_name)
+            if value is not None: return value
+            return lookup_symbol(context,var_name,node)
+        return var_access
+
+    def compile_VarAssignNode(self,node):
+        var_name=node.var_name_tok.value
+        value_closure=self.compile(node.value_node)
+
+        def var_assign(context):
+            value=value_closure(context)
+            context.symbol_table.symbols[var_name]=value
+            return value
+        return var_assign
+
+    def compile_BinOpNode(self,node):
+        left=self.compile(node.left_node)
+        right=self.compile(node.right_node)
+
+        if node.op_tok.matches(TT_KEYWORD, 'AND'):
+            def anded_by(context):
+                left_value=left(context)
+                if type(left_value) not in NUMBER_TYPES: raise illegal_operation(node,context)
+                if not left_value: return 0
+                right_value=right(context)
+                if type(right_value) not in NUMBER_TYPES: raise illegal_operation(node,context)
+                return int(left_value and right_value)
+            return anded_by
+
+        if node.op_tok.matches(TT_KEYWORD, 'OR'):
+            def ored_by(context):
+                left_value=left(context)
+                if type(left_value) not in NUMBER_TYPES: raise illegal_operation(node,context)
+                if left_value: return int(left_value)
+                right_value=right(context)
+                if type(right_value) not in NUMBER_TYPES: raise illegal_operation(node,context)
+                return int(right_value)
+            return ored_by
+
+        op=CLOSURE_BIN_OPS[node.op_tok.type]
+        return lambda context: op(left(context),right(context),node,context)
+
+    def compile_UnaryOpNode(self,node):
+        operand=self.compile(node.node)
+
+        if node.op_tok.type== TT_MINUS:
+            return lambda context: closure_multed_by(operand(context),-1,node,context)
+
+        if node.op_tok.matches(TT_KEYWORD,'NOT'):
+            def notted(context):
+                value=operand(context)
+                if type(value) not in NUMBER_TYPES: raise illegal_operation(node,context)
+                return 1 if value==0 else 0
+            return notted
+
+        return operand
+
+    def compile_IfNode(self,node):
+        cases=[(self.compile(condition),self.compile(expr),condition) for condition,expr in node.cases]
+        else_case=self.compile(node.else_case) if node.else_case else None
+
+        def if_expr(context):
+            for condition,expr,condition_node in cases:
+                if closure_is_true(condition(context),condition_node,context):
+                    return expr(context)
+            if else_case: return else_case(context)
+            return None
+        return if_expr
+
+    def compile_ForNode(self,node):
+        var_name=node.var_name_tok.value
+        start_value=self.compile(node.start_value_node)
+        end_value=self.compile(node.end_value_node)
+        step_value=self.compile(node.step_value_node) if node.step_value_node else None
+        body=self.compile(node.body_node)
+
+        def for_expr(context):
+            elements=[]
+            i=start_value(context)
+            end=end_value(context)
+            step=step_value(context) if step_value else 1
+            symbols=context.symbol_table.symbols
+            budget=context.budget
+
+            if step>=0:
+                while i<end:
+                    if budget:
+                        budget.left-=1
+                        if budget.left<0: check_budget(budget,node,context)
+                    symbols[var_name]=i
+                    i+=step
+                    elements.append(body(context))
+            else:
+                while i>end:
+                    if budget:
+                        budget.left-=1
+                        if budget.left<0: check_budget(budget,node,context)
+                    symbols[var_name]=i
+                    i+=step
+                    elements.append(body(context))
+            return elements
+        return for_expr
+
+    def compile_WhileNode(self,node):
+        condition=self.compile(node.condition_node)
+        body=self.compile(node.body_node)
+        condition_node=node.condition_node
+
+        def while_expr(context):
+            elements=[]
+            budget=context.budget
+            while True:
+                if budget:
+                    budget.left-=1
+                    if budget.left<0: check_budget(budget,node,context)
+                if not closure_is_true(condition(context),condition_node,context): break
+                elements.append(body(context))
+            return elements
+        return while_expr
+
+    def compile_FunDefNode(self,node):
+        func_name=node.var_name_tok.value if node.var_name_tok else None
+        arg_names=[arg_name.value for arg_name in node.arg_name_toks]
+        body=self.compile(node.body_node)
+
+        def func_def(context):
+            func_value=CompiledFunction(func_name,body,arg_names,context,node.pos_start,node.pos_end)
+            if func_name:
+                context.symbol_table.symbols[func_name]=func_value
+            return func_value
+        return func_def
+
+    def compile_CallNode(self,node):
+        value_to_call=self.compile(node.node_to_call)
+        arg_closures=[self.compile(arg_node) for arg_node in node.arg_nodes]
+
+        def call(context):
+            func=value_to_call(context)
+            return call_compiled_function(func,[arg(context) for arg in arg_closures],node,context)
+        return call
+
+########################################################################
+#  SOURCE COMPILER (JIT)
+# ######################################################################
+# Tier for the hottest (trusted) laws: the AST is translated into python source,
+# compiled once with compile() and cached by the hash of the law.
+# It works on the same python values and CompiledFunction as the closure compiler.
+
+class JitLaw:
+    """
+    A law translated by the SourceCompiler.
+    source: the generated python source
+    line_map: gives for each line of the generated source the node of the law it comes from,
+              so the python errors of the generated code can be given back at the position of the law
+    """
+
+    def __init__(self, law_hash, source, line_map, nodes):
+        self.law_hash=law_hash
+        self.source=source
+        self.line_map=line_map
+        self.filename=f'<law-jit:{law_hash[:12]}>'
+        self.code=compile(source,self.filename,'exec')
+
+        namespace=dict(JIT_NAMESPACE)
+        for i,node in enumerate(nodes):
+            namespace[f'_n{i}']=node
+        exec(self.code,namespace)
+        self.function=namespace['__law__']
+        jit_laws_by_filename[self.filename]=self
+
+    def run(self,context):
+        try:
+            return self.function(context)
+        except RTException:
+            raise
+        except Exception as e:
+            raise RTException(jit_runtime_error(e))
+
+# the compiled laws still in use (in jit_cache or running), for the errors of their generated source
+jit_laws_by_filename=weakref.WeakValueDictionary()
+
+def jit_runtime_error(exception):
+    """
+    Find the innermost line of generated source in the traceback of the exception
+    and give the RTError at the position of the corresponding node of the law
+    """
+    node=None
+    context=None
+    tb=exception.__traceback__
+    while tb:
+        jit_law=jit_laws_by_filename.get(tb.tb_frame.f_code.co_filename)
+        if jit_law and tb.tb_lineno in jit_law.line_map:
+            node=jit_law.line_map[tb.tb_lineno]
+            context=tb.tb_frame.f_locals.get('context',context)
+        tb=tb.tb_next
+
+    if node is None: raise exception
+    return RTError(node.pos_start,node.pos_end,str(exception) or type(exception).__name__,context)
+
+
+class SourceCompiler:
+    """
+    The SourceCompiler translates the AST of a law into the source of a python function __law__(context).
+    Each node gives some lines of python storing its value in a temporary variable (_t1, _t2, ...),
+    the numbers are computed inline and the other values go through the helpers of the closure compiler.
+    The nodes used for the errors are given to the generated code as _n0, _n1, ...
+
+        1+2*x   gives:
+                def __law__(context):
+                    symbols=context.symbol_table.symbols
+                    budget=context.budget
+                    _t1=symbols.get('x')
+                    if _t1 is None: _t1=lookup_symbol(context,'x',_n0)
+                    _t2=(2 * _t1) if type(2) in _NUM and type(_t1) in _NUM else CLOSURE_BIN_OPS['MUL'](2,_t1,_n1,context)
+                    _t3=(1 + _t2) if type(1) in _NUM and type(_t2) in _NUM else CLOSURE_BIN_OPS['PLUS'](1,_t2,_n2,context)
+                    return _t3
+
+proper way to run:
+
+    #Generate AST
+    parser=Parser(tokens)
+    ast= parser.parse()
+    if ast.error: return None, ast.error
+
+    #Compile and run program
+    jit_law=SourceCompiler().compile(ast.node,law_hash(fn,text))
+    context=Context('<program>')
+    context.symbol_table=SymbolTable()
+    result=jit_law.run(context)
+
+    """
+
+    def __init__(self):
+        self.lines=[]
+        self.line_map={}
+        self.nodes=[]
+        self.indent=0
+        self.temp_count=0
+        self.func_count=0
+
+    def emit(self,line,node):
+        self.lines.append('    '*self.indent+line)
+        self.line_map[len(self.lines)]=node
+
+    def new_temp(self):
+        self.temp_count+=1
+        return f'_t{self.temp_count}'
+
+    def node_name(self,node):
+        self.nodes.append(node)
+        return f'_n{len(self.nodes)-1}'
+
+    def emit_budget_step(self,node):
+        self.emit('if budget:',node)
+        self.indent+=1
+        self.emit('budget.left-=1',node)
+        self.emit(f'if budget.left<0: check_budget(budget,{self.node_name(node)},context)',node)
+        self.indent-=1
+
+    def truth(self,value,node):
+        return f'({value} != 0 if type({value}) in _NUM else closure_is_true({value},{self.node_name(node)},context))'
+
+    def compile(self,node,law_hash):
+        self.emit('def __law__(context):',node)
+        self.indent+=1
+        self.emit('symbols=context.symbol_table.symbols',node)
+        self.emit('budget=context.budget',node)
+        result=self.generate(node)
+        self.emit(f'return {result}',node)
+        self.indent-=1
+        return JitLaw(law_hash,'\n'.join(self.lines)+'\n',self.line_map,self.nodes)
+
+    def generate(self,node):
+        method_name=f'generate_{type(node).__name__}'
+        method=getattr(self,method_name,self.no_generate_method)
+        return method(node)
+
+    def no_generate_method(self,node):
+        raise Exception(f'No generate_{type(node).__name__} method defined')
+
+    ################################
+
+    def generate_NumberNode(self,node):
+        return repr(node.tok.value)
+
+    def generate_StringNode(self,node):
+        return repr(node.tok.value)
+
+    def generate_ListNode(self,node):
+        elements=[self.generate(element_node) for element_node in node.element_nodes]
+        result=self.new_temp()
+        self.emit(f'{result}=[{",".join(elements)}]',node)
+        return result
+
+    def generate_VarAccessNode(self,node):
+        var_name=node.var_name_tok.value
+        result=self.new_temp()
+        self.emit(f'{result}=symbols.get({var_name!r})',node)
+        self.emit(f'if {result} is None: {result}=lookup_symbol(context,{var_name!r},{self.node_name(node)})',node)
+        return result
+
+    def generate_VarAssignNode(self,node):
+        value=self.generate(node.value_node)
+        self.emit(f'symbols[{node.var_name_tok.value!r}]={value}',node)
+        return value
+
+    def generate_BinOpNode(self,node):
+        if node.op_tok.matches(TT_KEYWORD, 'AND') or node.op_tok.matches(TT_KEYWORD, 'OR'):
+            return self.generate_logical(node)
+
+        left=self.generate(node.left_node)
+        right=self.generate(node.right_node)
+        op_type=node.op_tok.type
+        result=self.new_temp()
+        fallback=f'CLOSURE_BIN_OPS[{op_type!r}]({left},{right},{self.node_name(node)},context)'
+        numbers=f'type({left}) in _NUM and type({right}) in _NUM'
+
+        if op_type==TT_DIV:
+            self.emit(f'{result}=({left} / {right}) if {numbers} and {right} != 0 else {fallback}',node)
+        elif op_type in JIT_ARITHMETIC_OPS:
+            self.emit(f'{result}=({left} {JIT_ARITHMETIC_OPS[op_type]} {right}) if {numbers} else {fallback}',node)
+        else:
+            self.emit(f'{result}=(1 if {left} {JIT_COMPARISON_OPS[op_type]} {right} else 0) if {numbers} else {fallback}',node)
+        return result
+
+    def generate_logical(self,node):
+        is_and=node.op_tok.matches(TT_KEYWORD, 'AND')
+        n=self.node_name(node)
+        result=self.new_temp()
+
+        left=self.generate(node.left_node)
+        self.emit(f'if type({left}) not in _NUM: raise illegal_operation({n},context)',node)
+        # the right node is only evaluated when the left value does not decide the result
+        self.emit(f'if {"not " if is_and else ""}{left}:',node)
+        self.indent+=1
+        self.emit(f'{result}={0 if is_and else f"int({left})"}',node)
+        self.indent-=1
+        self.emit('else:',node)
+        self.indent+=1
+        right=self.generate(node.right_node)
+        self.emit(f'if type({right}) not in _NUM: raise illegal_operation({n},context)',node)
+        self.emit(f'{result}=int({right})',node)
+        self.indent-=1
+        return result
+
+    def generate_UnaryOpNode(self,node):
+        value=self.generate(node.node)
+
+        if node.op_tok.type== TT_MINUS:
+            result=self.new_temp()
+            self.emit(f'{result}=-{value} if type({value}) in _NUM else closure_multed_by({value},-1,{self.node_name(node)},context)',node)
+            return result
+
+        if node.op_tok.matches(TT_KEYWORD,'NOT'):
+            result=self.new_temp()
+            self.emit(f'if type({value}) not in _NUM: raise illegal_operation({self.node_name(node)},context)',node)
+            self.emit(f'{result}=1 if {value} == 0 else 0',node)
+            return result
+
+        return value
+
+    def generate_IfNode(self,node):
+        result=self.new_temp()
+        self.emit(f'{result}=None',node)
+
+        for condition,expr in node.cases:
+            condition_value=self.generate(condition)
+            self.emit(f'if {self.truth(condition_value,condition)}:',condition)
+            self.indent+=1
+            self.emit(f'{result}={self.generate(expr)}',expr)
+            self.indent-=1
+            self.emit('else:',node)
+            self.indent+=1
+
+        if node.else_case:
+            self.emit(f'{result}={self.generate(node.else_case)}',node.else_case)
+        else:
+            self.emit('pass',node)
+        self.indent-=len(node.cases)
+        return result
+
+    def generate_ForNode(self,node):
+        start_value=self.generate(node.start_value_node)
+        end_value=self.generate(node.end_value_node)
+        step_value=self.generate(node.step_value_node) if node.step_value_node else '1'
+        result=self.new_temp()
+        i=self.new_temp()
+
+        self.emit(f'{result}=[]',node)
+        self.emit(f'{i}={start_value}',node)
+
+        # when the step is a constant the direction of the loop is known at compile time
+        step_node=node.step_value_node
+        if step_node and isinstance(step_node,UnaryOpNode) and step_node.op_tok.type==TT_MINUS and isinstance(step_node.node,NumberNode):
+            self.emit(f'while {i} > {end_value}:',node)
+        elif step_node is None or isinstance(step_node,NumberNode):
+            self.emit(f'while {i} < {end_value}:',node)
+        else:
+            self.emit(f'while (({i} < {end_value}) if {step_value} >= 0 else ({i} > {end_value})):',node)
+
+        self.indent+=1
+        self.emit_budget_step(node)
+        self.emit(f'symbols[{node.var_name_tok.value!r}]={i}',node)
+        self.emit(f'{i}+={step_value}',node)
+        body=self.generate(node.body_node)
+        self.emit(f'{result}.append({body})',node.body_node)
+        self.indent-=1
+        return result
+
+    def generate_WhileNode(self,node):
+        result=self.new_temp()
+        self.emit(f'{result}=[]',node)
+        self.emit('while True:',node)
+        self.indent+=1
+        self.emit_budget_step(node)
+        condition=self.generate(node.condition_node)
+        self.emit(f'if not {self.truth(condition,node.condition_node)}: break',node.condition_node)
+        body=self.generate(node.body_node)
+        self.emit(f'{result}.append({body})',node.body_node)
+        self.indent-=1
+        return result
+
+    def generate_FunDefNode(self,node):
+        func_name=node.var_name_tok.value if node.var_name_tok else None
+        arg_names=[arg_name.value for arg_name in node.arg_name_toks]
+        self.func_count+=1
+        body_function=f'_f{self.func_count}'
+
+        self.emit(f'def {body_function}(context):',node)
+        self.indent+=1
+        self.emit('symbols=context.symbol_table.symbols',node)
+        self.emit('budget=context.budget',node)
+        self.emit(f'return {self.generate(node.body_node)}',node.body_node)
+        self.indent-=1
+
+        result=self.new_temp()
+        n=self.node_name(node)
+        self.emit(f'{result}=CompiledFunction({func_name!r},{body_function},{arg_names!r},context,{n}.pos_start,{n}.pos_end)',node)
+        if func_name:
+            self.emit(f'symbols[{func_name!r}]={result}',node)
+        return result
+
+    def generate_CallNode(self,node):
+        value_to_call=self.generate(node.node_to_call)
+        args=[self.generate(arg_node) for arg_node in node.arg_nodes]
+        result=self.new_temp()
+        self.emit(f'{result}=call_compiled_function({value_to_call},[{",".join(args)}],{self.node_name(node)},context)',node)
+        return result
+
+JIT_ARITHMETIC_OPS={TT_PLUS:'+', TT_MINUS:'-', TT_MUL:'*', TT_POW:'**'}
+JIT_COMPARISON_OPS={TT_EE:'==', TT_NE:'!=', TT_LT:'<', TT_GT:'>', TT_LTE:'<=', TT_GTE:'>='}
+
+# names the generated source can use
+JIT_NAMESPACE={
+    '_NUM': frozenset(NUMBER_TYPES),
+    'CLOSURE_BIN_OPS': CLOSURE_BIN_OPS,
+    'CompiledFunction': CompiledFunction,
+    'call_compiled_function': call_compiled_function,
+    'check_budget': check_budget,
+    'closure_is_true': closure_is_true,
+    'closure_multed_by': closure_multed_by,
+    'illegal_operation': illegal_operation,
+    'lookup_symbol': lookup_symbol,
+}
+
 ########################################################################
 #  RUN
 # ######################################################################
@@ -1845,7 +2621,72 @@ global_symbol_table.set("NULL",Number(0))
 global_symbol_table.set("TRUE",Number(1))
 global_symbol_table.set("FALSE",Number(0))
 
-def run(fn,text):
+# the closure and jit engines work on python values so they keep their own global symbol table
+closure_global_symbol_table = SymbolTable()
+closure_global_symbol_table.set("NULL",0)
+closure_global_symbol_table.set("TRUE",1)
+closure_global_symbol_table.set("FALSE",0)
+
+ENGINES=('interpreter','closure','jit','tiered')
+
+# number of evaluations of a law after which the 'tiered' engine promotes it to the jit tier
+JIT_THRESHOLD=20
+# laws kept by the caches, the least recently run are dropped first
+JIT_CACHE_SIZE=1024
+LAW_EVALUATIONS_SIZE=4096
+law_evaluations=OrderedDict()
+jit_cache=OrderedDict()
+closure_cache=OrderedDict()   # law hash -> program of the ClosureCompiler, bounded by JIT_CACHE_SIZE too
+jit_lock=threading.Lock()   # guards law_evaluations, jit_cache, closure_cache and the promotions
+
+def law_hash(fn,text):
+    return hashlib.sha256(f'{fn}\0{text}'.encode()).hexdigest()
+
+def run_compiled(program,budget=None):
+    context=Context('<program>')
+    context.symbol_table=closure_global_symbol_table
+    context.budget=budget
+    try:
+        result=program(context)
+    except RTException as e:
+        return None, e.error
+    except Exception as e:
+        return None, closure_runtime_error(e)
+    return to_value(result,context), None
+
+def run(fn,text,engine='interpreter',max_steps=None,timeout=None):
+    """
+    engine: 'interpreter' visits the AST with the Interpreter,
+            'closure' compiles the AST into python closures with the ClosureCompiler (cached by law hash),
+            'jit' translates the AST into python source with the SourceCompiler (cached by law hash),
+            'tiered' uses the closure engine and promotes the law to 'jit' after JIT_THRESHOLD evaluations
+    max_steps: maximum number of loop iterations and function calls of the law
+    timeout: maximum duration of the law in seconds
+    when a limit is exceeded the error is a LimitError at the position of the loop or call reached
+    """
+    if engine not in ENGINES:
+        raise Exception(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    budget=Budget(max_steps,timeout) if max_steps is not None or timeout else None
+
+    key=None
+    if engine!='interpreter':
+        key=law_hash(fn,text)
+        jit_law=program=None
+        with jit_lock:
+            if engine!='closure':
+                jit_law=jit_cache.get(key)
+                if jit_law:
+                    jit_cache.move_to_end(key)
+                else:
+                    evaluations=law_evaluations.pop(key,0)+1
+                    law_evaluations[key]=evaluations
+                    if len(law_evaluations)>LAW_EVALUATIONS_SIZE: law_evaluations.popitem(last=False)
+            if engine=='closure' or (engine=='tiered' and not jit_law and evaluations<JIT_THRESHOLD):
+                program=closure_cache.get(key)
+                if program: closure_cache.move_to_end(key)
+        if jit_law: return run_compiled(jit_law.run,budget)
+        if program: return run_compiled(program,budget)
+
     lexer=Lexer(fn, text)  # break down the source code into meaningful tokens
     tokens,error=lexer.make_tokens()
    # print (tokens)
@@ -1857,10 +2698,30 @@ def run(fn,text):
    # print( ast.node)
     if ast.error: return None, ast.error
 
+    if engine=='jit' or (engine=='tiered' and evaluations>=JIT_THRESHOLD):
+        with jit_lock:
+            # another thread may have promoted the law in the meantime
+            jit_law=jit_cache.get(key)
+            if jit_law is None:
+                jit_law=SourceCompiler().compile(ast.node,key)
+                jit_cache[key]=jit_law
+                if len(jit_cache)>JIT_CACHE_SIZE: jit_cache.popitem(last=False)
+            law_evaluations.pop(key,None)
+            closure_cache.pop(key,None)
+        return run_compiled(jit_law.run,budget)
+
+    if engine in ('closure','tiered'):
+        program=ClosureCompiler().compile(ast.node)
+        with jit_lock:
+            closure_cache[key]=program
+            if len(closure_cache)>JIT_CACHE_SIZE: closure_cache.popitem(last=False)
+        return run_compiled(program,budget)
+
     #Run program
     interpreter=Interpreter()
     context=Context('<program>')
     context.symbol_table=global_symbol_table
+    context.budget=budget
     result=interpreter.visit(ast.node,context)
 
     return result.value,result.error
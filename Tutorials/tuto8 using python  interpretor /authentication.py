@@ -1,21 +1,132 @@
-from database import accounts_db
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import accounts_db, find_user_id, print_database
+from passwords import hash_password, verify_password
+from session import Session
+
+# Logins verified at the same time: the KDF releases the GIL, so they run in parallel
+# without blocking the other sessions
+login_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="login")
+
+class LoginRateLimiter:
+    """
+    Blocks the logins to an account after too many failures.
+
+    Attributes:
+        max_failures (int): Number of failed logins allowed within window seconds.
+        window (float): Seconds after which a failed login is forgotten.
+        max_ids (int): Number of ID numbers remembered; past it the least recently tried are forgotten.
+    """
+    def __init__(self, max_failures=5, window=60, max_ids=100000):
+        self.max_failures = max_failures
+        self.window = window
+        self.max_ids = max_ids
+        self.failures = {}   # id_number -> times of the recent failed logins, least recently tried first
+        self.lock = threading.Lock()
+
+    def recent_failures(self, id_number, now):
+        failures = [t for t in self.failures.get(id_number, []) if now - t < self.window]
+        if failures:
+            self.failures[id_number] = failures
+        else:
+            self.failures.pop(id_number, None)
+        return failures
+
+    def forget(self, now):
+        # the ID numbers are in the order of their last login, so the expired ones come first
+        while self.failures:
+            id_number, failures = next(iter(self.failures.items()))
+            if now - failures[-1] < self.window and len(self.failures) <= self.max_ids:
+                break
+            del self.failures[id_number]
+
+    def is_blocked(self, id_number):
+        """
+        Returns:
+            bool: True if the account had max_failures failed logins within the window.
+        """
+        with self.lock:
+            return len(self.recent_failures(id_number, time.monotonic())) >= self.max_failures
+
+    def try_acquire(self, id_number):
+        """
+        Checks that the account is not blocked and counts the login as a failure, in one step:
+        logins run in parallel cannot all pass the check. A successful login calls reset().
+
+        Returns:
+            bool: False if the account is blocked.
+        """
+        with self.lock:
+            now = time.monotonic()
+            failures = self.recent_failures(id_number, now)
+            if len(failures) >= self.max_failures:
+                return False
+            self.failures.pop(id_number, None)
+            self.failures[id_number] = failures + [now]
+            self.forget(now)
+            return True
+
+    def reset(self, id_number):
+        with self.lock:
+            self.failures.pop(id_number, None)
+
+rate_limiter = LoginRateLimiter()
+
+# Hash checked when the ID number is unknown, so an unknown ID number takes as long as a wrong password
+unknown_account_hash = hash_password("unknown account")
 
 def user_login():
-    print_database("Initial")
+    """
+    Asks an ID number and a password.
+
+    Returns:
+        Session: The session of the user if the login succeeded, otherwise None.
+    """
+    print(print_database("Initial"))
     print("Welcome to the User Account System!")
     id_number = input("Please enter your ID number: ")
     password = input("Please enter your password: ")
 
-    user_account = authenticate_user(id_number, password)
-    if user_account:
+    if rate_limiter.is_blocked(id_number):   # spares the password check; authenticate_user checks again
+        print("Too many failed logins, try again later.")
+        return None
+    login = authenticate_user(id_number, password)
+    if login:
         print("Login successful!")
-        return user_account
+        return Session(*login)
     else:
         print("Invalid ID or password.")
         return None
 
 def authenticate_user(id_number, password):
-    for account in accounts_db.values():
-        if account["id_number"] == id_number and account["password"] == password:
-            return account
+    """
+    Checks an ID number and a password.
+
+    Args:
+        id_number (str): The ID number of the account.
+        password (str): The password given by the user.
+
+    Returns:
+        tuple: (user_id, account) if the password is right and the account is not blocked by the rate limiter, otherwise None.
+    """
+    if not rate_limiter.try_acquire(id_number):
+        return None
+    user_id = find_user_id(id_number)
+    account = accounts_db.get(user_id)
+    stored_hash = account["password"].value if account else unknown_account_hash
+    if verify_password(password, stored_hash) and account:
+        rate_limiter.reset(id_number)
+        return user_id, account
     return None
+
+def authenticate_user_async(id_number, password):
+    """
+    Runs authenticate_user in the login thread pool.
+
+    Returns:
+        concurrent.futures.Future: Its result is (user_id, account), or None.
+    """
+    return login_executor.submit(authenticate_user, id_number, password)
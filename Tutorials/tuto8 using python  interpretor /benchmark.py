@@ -0,0 +1,199 @@
+#Benchmarks of the account system of tuto8.
+#
+#to run the benchmarks use:
+#python3 benchmark.py
+
+import os
+import threading
+import time
+
+import database
+from database import Token, accounts_db, update_token
+from authentication import authenticate_user, login_executor
+from passwords import hash_password, verify_password
+from session import Session, compile_command, run_command
+
+########################################################################
+#  HELPERS
+# ######################################################################
+
+def time_it(label, func, repeat=5):
+    best=None
+    for _ in range(repeat):
+        start=time.perf_counter()
+        func()
+        elapsed=time.perf_counter()-start
+        if best is None or elapsed<best: best=elapsed
+    print(f'{label:<45} {best*1000:10.3f} ms')
+    return best
+
+# One cheap hash shared by the benchmark accounts: hashing a million passwords at the real cost would take hours
+BENCH_PASSWORD='bench'
+BENCH_HASH=hash_password(BENCH_PASSWORD, "pbkdf2_sha256", 1)
+
+def fill_accounts(count):
+    """count accounts with an id_number and a password (the other tokens are not needed to log in)"""
+    for i in range(len(accounts_db), count):
+        user_id=f'bench{i}'
+        accounts_db[user_id]={
+            "id_number": Token("id_number", f'B{i}', 0, 0),
+            "password": Token("password", BENCH_HASH, 0, 0),
+        }
+        database.index_account(user_id)
+
+########################################################################
+#  LOGIN BY ID NUMBER
+# ######################################################################
+
+def scan_authenticate_user(id_number, password):
+    """authenticate_user before the id_number index: scans every account"""
+    for account in accounts_db.values():
+        if account["id_number"].value == id_number and verify_password(password, account["password"].value):
+            return account
+    return None
+
+def bench_login(count=1_000_000):
+    print(f'Login by ID number with {count} accounts')
+    fill_accounts(count)
+    last=count-1   # the worst case of the scan
+
+    assert scan_authenticate_user(f'B{last}', BENCH_PASSWORD) is authenticate_user(f'B{last}', BENCH_PASSWORD)[1]
+    scan=time_it('scan of accounts_db', lambda: scan_authenticate_user(f'B{last}', BENCH_PASSWORD), repeat=3)
+    indexed=time_it('id_number index', lambda: authenticate_user(f'B{last}', BENCH_PASSWORD))
+    print(f'{"speed-up":<45} {scan/indexed:10.0f} x')
+
+    # user_session used to find the user_id of the logged in account again; the Session now carries it
+    account=accounts_db[f'bench{last}']
+    reverse=time_it('user_id by reverse lookup in accounts_db', lambda: [uid for uid, acc in accounts_db.items() if acc == account][0], repeat=3)
+    session=time_it('user_id from the login', lambda: Session(*authenticate_user(f'B{last}', BENCH_PASSWORD)).user_id)
+    print(f'{"speed-up":<45} {reverse/session:10.0f} x')
+
+########################################################################
+#  PASSWORD HASHING
+# ######################################################################
+
+HASHING_COSTS=[
+    ("scrypt", 2**12),
+    ("scrypt", 2**14),
+    ("scrypt", 2**15),
+    ("pbkdf2_sha256", 100_000),
+    ("pbkdf2_sha256", 600_000),
+]
+
+def logins_per_second(label, logins, func):
+    start=time.perf_counter()
+    func()
+    elapsed=time.perf_counter()-start
+    print(f'{label:<45} {logins/elapsed:10.1f} logins/s')
+    return logins/elapsed
+
+def bench_password_hashing(logins=32):
+    """Cost of a login for each KDF setting: one at a time, in the login thread pool, and from the verified cache"""
+    print(f'Password verification ({logins} logins, {os.cpu_count()} CPUs)')
+    for algorithm, cost in HASHING_COSTS:
+        stored=hash_password('password123', algorithm, cost)
+        verify=lambda _: verify_password('password123', stored, use_cache=False)
+        assert verify(None) and not verify_password('wrong', stored, use_cache=False)
+
+        print(f'{algorithm} {cost}')
+        sequential=logins_per_second('  sequential', logins, lambda: [verify(i) for i in range(logins)])
+        pooled=logins_per_second('  thread pool', logins, lambda: list(login_executor.map(verify, range(logins))))
+        verify_password('password123', stored)
+        cached=logins_per_second('  verified cache', logins*1000,
+                                 lambda: [verify_password('password123', stored) for _ in range(logins*1000)])
+        print(f'{"  thread pool speed-up":<45} {pooled/sequential:10.1f} x')
+        print(f'{"  cache speed-up":<45} {cached/sequential:10.0f} x')
+
+########################################################################
+#  SESSION COMMANDS
+# ######################################################################
+
+SESSION_COMMANDS=[
+    'amount_of_tokens = amount_of_tokens + 1',
+    'name = "Jane"',
+    'surname = surname + "" if len(surname) < 20 else "Smith"',
+    'amount_of_tokens -= 1',
+]
+
+def commands_per_second(label, commands, func):
+    start=time.perf_counter()
+    func()
+    elapsed=time.perf_counter()-start
+    print(f'{label:<45} {commands/elapsed:10.0f} commands/s')
+    return commands/elapsed
+
+def bench_session_commands(repeat=20000):
+    """Session commands run by exec() of the raw text (before) and by the checked, cached evaluator"""
+    commands=SESSION_COMMANDS*repeat
+    print(f'Session commands ({len(commands)} commands)')
+    session=Session(*authenticate_user('2', 'mypassword'))
+
+    user_vars=session.values()
+    def raw_exec():
+        for command in commands:
+            exec(command, globals(), user_vars)
+    before=commands_per_second('exec() of the raw text', len(commands), raw_exec)
+
+    user_vars=session.values()
+    def restricted():
+        for command in commands:
+            run_command(session, command, user_vars)
+    compile_command.cache_clear()
+    after=commands_per_second('checked and cached evaluator', len(commands), restricted)
+    assert user_vars==session.values()   # the commands leave the tokens as they were
+    print(f'{"speed-up":<45} {after/before:10.1f} x')
+    print(f'{"compiled commands cached":<45} {compile_command.cache_info().currsize:10d}')
+
+########################################################################
+#  LOCK CONTENTION
+# ######################################################################
+
+def cas_increments(user_id, count, retries):
+    """count compare-and-set increments of amount_of_tokens, retried when another thread changed it"""
+    token=accounts_db[user_id]["amount_of_tokens"]
+    for _ in range(count):
+        while True:
+            value=token.value
+            if update_token(user_id, "amount_of_tokens", value+1, 0, expected=value)=="Token updated successfully.":
+                break
+            retries.append(1)
+
+def run_increments(label, user_ids, threads, count):
+    """threads threads, thread i incrementing user_ids[i % len(user_ids)]; returns the increments/s"""
+    retries=[]
+    workers=[threading.Thread(target=cas_increments, args=(user_ids[i % len(user_ids)], count, retries)) for i in range(threads)]
+    start=time.perf_counter()
+    for worker in workers: worker.start()
+    for worker in workers: worker.join()
+    elapsed=time.perf_counter()-start
+    print(f'{label:<45} {threads*count/elapsed:10.0f} updates/s {len(retries):8d} retries')
+    return threads*count/elapsed
+
+def bench_contention(threads=8, count=20000):
+    """Compare-and-set updates from many threads: one hot account or one account per thread,
+    with the per-account locks and with one lock for the whole store (the reference point)"""
+    print(f'Lock contention ({threads} threads, {count} updates each)')
+    fill_accounts(len(accounts_db)+threads)
+    user_ids=[user_id for user_id in accounts_db if user_id.startswith('bench')][-threads:]
+    for user_id in user_ids:
+        accounts_db[user_id]["amount_of_tokens"]=Token("amount_of_tokens", 0, 0, 2)
+
+    # both variants go through account_lock and locked_account: only the locks in account_locks differ
+    run_increments('per-account locks, 1 hot account', user_ids[:1], threads, count)
+    run_increments('per-account locks, 1 account per thread', user_ids, threads, count)
+    per_account_locks={user_id: database.account_locks[user_id] for user_id in user_ids}
+    store_lock=threading.RLock()
+    database.account_locks.update(dict.fromkeys(user_ids, store_lock))
+    try:
+        run_increments('one lock for the store, 1 hot account', user_ids[:1], threads, count)
+        run_increments('one lock for the store, 1 account per thread', user_ids, threads, count)
+    finally:
+        database.account_locks.update(per_account_locks)
+    assert accounts_db[user_ids[0]]["amount_of_tokens"].value==(2*threads+2)*count   # no update lost
+
+
+if __name__ == "__main__":
+    bench_login()
+    bench_password_hashing()
+    bench_session_commands()
+    bench_contention()
@@ -9,7 +9,15 @@ Key Features:
 - Token class to encapsulate data with access levels.
 - Functions to create, read, update, and delete tokens and accounts.
 - Support for both general and self-access levels.
+- Index from id_number to user_id, so an account is found by its ID number without scanning accounts_db.
+- The password tokens hold salted hashes (see passwords.py), never the passwords themselves.
+- Thread safe: one lock per account for its tokens, a structural lock for creating and deleting accounts,
+  and a compare-and-set update_token (expected=...) for read-modify-write updates like balances.
+  Code reading then writing several tokens of an account (a session, a scheduled power) holds account_lock(user_id).
 """
+import threading
+
+from passwords import hash_password, is_password_hash
 
 class Token:
     """
@@ -34,6 +42,98 @@ class Token:
 # Global dictionary to store all user accounts
 accounts_db = {}
 
+# Index of the accounts by the value of their id_number token: id_number -> user_id
+id_number_index = {}
+
+# Locks of the store, always taken in this order:
+#   structure_lock (accounts created or deleted) -> the lock of an account -> index_lock (id_number_index)
+structure_lock = threading.RLock()
+account_locks = {}   # user_id -> lock of the tokens of the account
+account_locks_lock = threading.Lock()
+index_lock = threading.RLock()
+
+# Default of the expected argument of update_token: no compare-and-set
+ANY_VALUE = object()
+
+def account_lock(user_id):
+    """
+    Returns the lock of the tokens of an account (reentrant, created at its first use), used as: with account_lock(user_id): ...
+    delete_account removes the lock of the account, so a thread that was waiting for it holds a lock
+    that is no longer the one of the user_id: the functions writing tokens check it with locked_account.
+
+    Args:
+        user_id (str): The ID of the account.
+
+    Returns:
+        threading.RLock: The lock of the account.
+    """
+    lock = account_locks.get(user_id)
+    if lock is None:
+        with account_locks_lock:
+            lock = account_locks.setdefault(user_id, threading.RLock())
+    return lock
+
+def locked_account(user_id, lock):
+    """
+    Returns the tokens of an account, once the caller holds lock = account_lock(user_id).
+
+    Args:
+        user_id (str): The ID of the account.
+        lock (threading.RLock): The lock held by the caller.
+
+    Returns:
+        dict: The tokens of the account, or None if the account does not exist or was deleted
+        (and maybe created again, with a new lock) while the caller was waiting for the lock.
+    """
+    if account_locks.get(user_id) is not lock:
+        return None
+    return accounts_db.get(user_id)
+
+def index_account(user_id):
+    """
+    Adds an account to the id_number index.
+
+    Args:
+        user_id (str): The ID of the account.
+    """
+    token = accounts_db.get(user_id, {}).get("id_number")
+    if token is not None:
+        with index_lock:
+            id_number_index[token.value] = user_id
+
+def unindex_account(user_id):
+    """
+    Removes an account from the id_number index.
+
+    Args:
+        user_id (str): The ID of the account.
+    """
+    token = accounts_db.get(user_id, {}).get("id_number")
+    with index_lock:
+        if token is not None and id_number_index.get(token.value) == user_id:
+            del id_number_index[token.value]
+
+def rebuild_id_number_index():
+    """
+    Rebuilds the id_number index from accounts_db (after accounts_db was changed directly).
+    """
+    with structure_lock, index_lock:
+        id_number_index.clear()
+        for user_id in accounts_db:
+            index_account(user_id)
+
+def find_user_id(id_number):
+    """
+    Finds an account by its ID number.
+
+    Args:
+        id_number (str): The value of the id_number token.
+
+    Returns:
+        str: The ID of the account, or None if no account has this ID number.
+    """
+    return id_number_index.get(id_number)
+
 def print_database(title):
     """
     Returns a string representation of the entire database.
@@ -106,7 +206,7 @@ def self_get_token(requester_id, token_name, requester_access_level):
             return token.value
     return "Access denied or token not found."
 
-def update_token(user_id, token_name, new_value, requester_access_level):
+def update_token(user_id, token_name, new_value, requester_access_level, expected=ANY_VALUE):
     """
     Updates a token's value if the requester has sufficient access level.
 
@@ -115,22 +215,27 @@ def update_token(user_id, token_name, new_value, requester_access_level):
         token_name (str): The name of the token to update.
         new_value: The new value to set.
         requester_access_level (int): The access level of the requester.
+        expected: Compare-and-set: the token is only updated if its value is still expected
+            (read it again and retry otherwise).
 
     Returns:
         str: Success message if updated, otherwise an error message.
     """
-    account = accounts_db.get(user_id)
-    if account:
-        token = account.get(token_name)
-        if token and requester_access_level <= token.level:
-            token.value = new_value
-            return "Token updated successfully."
+    lock = account_lock(user_id)
+    with lock:
+        account = locked_account(user_id, lock)
+        if account:
+            token = account.get(token_name)
+            if token and requester_access_level <= token.level:
+                if expected is not ANY_VALUE and token.value != expected:
+                    return "Token value changed: update refused."
+                return set_token_value(user_id, token, new_value)
+            else:
+                return "Access denied: Insufficient user level."
         else:
-            return "Access denied: Insufficient user level."
-    else:
-        return "Account not found."
+            return "Account not found."
 
-def self_update_token(requester_id, token_name, new_value, requester_access_level):
+def self_update_token(requester_id, token_name, new_value, requester_access_level, expected=ANY_VALUE):
     """
     Updates a token's value for self-access if the requester has sufficient self-access level.
 
@@ -139,20 +244,50 @@ def self_update_token(requester_id, token_name, new_value, requester_access_leve
         token_name (str): The name of the token to update.
         new_value: The new value to set.
         requester_access_level (int): The access level of the requester.
+        expected: Compare-and-set: the token is only updated if its value is still expected.
 
     Returns:
         str: Success message if updated, otherwise an error message.
     """
-    account = accounts_db.get(requester_id)
-    if account:
-        token = account.get(token_name)
-        if token and requester_access_level <= token.self_level:
-            token.value = new_value
-            return "Token updated successfully."
+    lock = account_lock(requester_id)
+    with lock:
+        account = locked_account(requester_id, lock)
+        if account:
+            token = account.get(token_name)
+            if token and requester_access_level <= token.self_level:
+                if expected is not ANY_VALUE and token.value != expected:
+                    return "Token value changed: update refused."
+                return set_token_value(requester_id, token, new_value)
+            else:
+                return "Access denied: Insufficient user level for self update."
         else:
-            return "Access denied: Insufficient user level for self update."
+            return "Account not found."
+
+def set_token_value(user_id, token, new_value):
+    """
+    Sets the value of a token of an account, keeping the id_number index up to date
+    and hashing the new value of a password token.
+
+    Args:
+        user_id (str): The ID of the account holding the token.
+        token (Token): The token to update.
+        new_value: The new value to set.
+
+    Returns:
+        str: Success message if updated, otherwise an error message (an ID number already used by another account).
+    """
+    if token.name == "id_number":
+        with index_lock:
+            if id_number_index.get(new_value, user_id) != user_id:
+                return "An account with this ID number already exists."
+            unindex_account(user_id)
+            token.value = new_value
+            index_account(user_id)
+    elif token.name == "password" and not is_password_hash(new_value):
+        token.value = hash_password(new_value)
     else:
-        return "Account not found."
+        token.value = new_value
+    return "Token updated successfully."
 
 def create_token(user_id, token_name, value, level, self_level):
     """
@@ -168,11 +303,21 @@ def create_token(user_id, token_name, value, level, self_level):
     Returns:
         str: Success message if created, otherwise an error message.
     """
+    if token_name == "password" and not is_password_hash(value):
+        value = hash_password(value)
     token = Token(token_name, value, level, self_level)
-    if user_id in accounts_db:
-        accounts_db[user_id][token_name] = token
-    else:
-        accounts_db[user_id] = {token_name: token}
+    # The structural lock too, since the account is created if it does not exist
+    with structure_lock, account_lock(user_id), index_lock:
+        if token_name == "id_number":
+            if id_number_index.get(value, user_id) != user_id:
+                return "An account with this ID number already exists."
+            unindex_account(user_id)
+        if user_id in accounts_db:
+            accounts_db[user_id][token_name] = token
+        else:
+            accounts_db[user_id] = {token_name: token}
+        if token_name == "id_number":
+            index_account(user_id)
     return "Token created successfully."
 
 def delete_token(user_id, token_name):
@@ -186,12 +331,16 @@ def delete_token(user_id, token_name):
     Returns:
         str: Success message if deleted, otherwise an error message.
     """
-    account = accounts_db.get(user_id)
-    if account and token_name in account:
-        del account[token_name]
-        return "Token deleted successfully."
-    else:
-        return "Token not found."
+    lock = account_lock(user_id)
+    with lock:
+        account = locked_account(user_id, lock)
+        if account and token_name in account:
+            if token_name == "id_number":
+                unindex_account(user_id)
+            del account[token_name]
+            return "Token deleted successfully."
+        else:
+            return "Token not found."
 
 def create_account(account_details):
     """
@@ -201,10 +350,21 @@ def create_account(account_details):
         account_details (dict): A dictionary of tokens for the new account.
 
     Returns:
-        str: Success message with the new account ID.
+        str: Success message with the new account ID, or an error message if the ID number is already used.
     """
-    user_id = f"user{len(accounts_db) + 1}"
-    accounts_db[user_id] = account_details
+    password = account_details.get("password")
+    if password is not None and not is_password_hash(password.value):
+        password.value = hash_password(password.value)
+    id_number = account_details.get("id_number")
+    with structure_lock, index_lock:
+        if id_number is not None and id_number.value in id_number_index:
+            return "An account with this ID number already exists."
+        number = len(accounts_db) + 1
+        while f"user{number}" in accounts_db:   # a deleted account leaves a gap in the numbers
+            number += 1
+        user_id = f"user{number}"
+        accounts_db[user_id] = account_details
+        index_account(user_id)
     return f"Account created with ID: {user_id}"
 
 def delete_account(user_id):
@@ -217,18 +377,22 @@ def delete_account(user_id):
     Returns:
         str: Success message if deleted, otherwise an error message.
     """
-    if user_id in accounts_db:
-        del accounts_db[user_id]
-        return f"Account {user_id} deleted."
-    else:
-        return "Account not found."
+    with structure_lock, account_lock(user_id):
+        if user_id in accounts_db:
+            unindex_account(user_id)
+            del accounts_db[user_id]
+            with account_locks_lock:
+                del account_locks[user_id]
+            return f"Account {user_id} deleted."
+        else:
+            return "Account not found."
 
 # Example usage
 accounts_db["user1"] = {
     "id_number": Token("id_number", "1", 0, 0),
     "name": Token("name", "John", 0, 1),
     "surname": Token("surname", "Doe", 0, 1),
-    "password": Token("password", "password123", 0, 0),
+    "password": Token("password", hash_password("password123"), 0, 0),
     "amount_of_tokens": Token("amount_of_tokens", 100, 0, 2),
     "role": Token("role", "admin", 0, 0),
     "access_level": Token("access_level", 0, 0, 0)
@@ -238,8 +402,10 @@ accounts_db["user2"] = {
     "id_number": Token("id_number", "2", 1, 1),
     "name": Token("name", "Jane", 1, 1),
     "surname": Token("surname", "Smith", 1, 1),
-    "password": Token("password", "mypassword", 1, 1),
+    "password": Token("password", hash_password("mypassword"), 1, 1),
     "amount_of_tokens": Token("amount_of_tokens", 150, 1, 2),
     "role": Token("role", "editor", 1, 1),
     "access_level": Token("access_level", 1, 1, 1)
 }
+
+rebuild_id_number_index()
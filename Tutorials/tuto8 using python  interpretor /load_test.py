@@ -0,0 +1,198 @@
+#Load test of the session server of tuto8.
+#
+#to run the load test use:
+#python3 load_test.py [sessions]
+
+import asyncio
+import random
+import sys
+import threading
+import time
+
+from database import Token, account_lock, accounts_db, create_account, find_user_id
+from authentication import LoginRateLimiter, rate_limiter
+from passwords import hash_password
+from server import SessionServer
+
+# One cheap hash shared by the load test accounts: the test measures the sessions, not the KDF
+LOAD_PASSWORD='load'
+LOAD_HASH=hash_password(LOAD_PASSWORD, "pbkdf2_sha256", 1)
+
+########################################################################
+#  HELPERS
+# ######################################################################
+
+def percentile(values, fraction):
+    """values must be sorted"""
+    return values[min(len(values)-1, int(fraction*len(values)))]
+
+def fill_accounts(count):
+    """count accounts whose amount_of_tokens the sessions increment; returns their id_numbers"""
+    id_numbers=[]
+    for i in range(count):
+        id_number=f'L{i}'
+        if find_user_id(id_number) is None:
+            create_account({
+                "id_number": Token("id_number", id_number, 0, 0),
+                "name": Token("name", f'Load{i}', 0, 1),
+                "surname": Token("surname", 'Test', 0, 1),
+                "password": Token("password", LOAD_HASH, 0, 0),
+                "amount_of_tokens": Token("amount_of_tokens", 0, 0, 2),
+                "access_level": Token("access_level", 1, 0, 1),
+            })
+        id_numbers.append(id_number)
+    return id_numbers
+
+def start_server(idle_timeout, **options):
+    """the server runs in its own thread and event loop, the clients in the main one"""
+    loop=asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    server=asyncio.run_coroutine_threadsafe(SessionServer(port=0, idle_timeout=idle_timeout, **options).start(), loop).result()
+    return server, loop
+
+########################################################################
+#  CLIENT
+# ######################################################################
+
+async def client_session(port, id_number, commands, think_time, connecting, logged_in, latencies):
+    async with connecting:
+        reader,writer=await asyncio.open_connection('127.0.0.1', port, limit=65536)
+        await reader.readline()   # welcome
+        writer.write(f'login {id_number} {LOAD_PASSWORD}\n'.encode())
+        reply=await reader.readline()
+        assert reply.startswith(b'OK'), reply
+    await logged_in.wait()   # every session is open before the first command
+
+    for _ in range(commands):
+        await asyncio.sleep(random.uniform(0, think_time))
+        sent=time.perf_counter()
+        writer.write(b'amount_of_tokens += 1\n')
+        reply=await reader.readline()
+        latencies.append(time.perf_counter()-sent)
+        assert reply.startswith(b'OK'), reply
+    writer.write(b'exit\n')
+    await reader.readline()
+    writer.close()
+    await writer.wait_closed()
+
+async def run_clients(port, id_numbers, sessions, commands, think_time):
+    latencies=[]
+    connecting=asyncio.Semaphore(500)   # ramp up: at most 500 sessions connecting and logging in at once
+    logged_in=asyncio.Barrier(sessions)
+    clients=[client_session(port, id_numbers[i % len(id_numbers)], commands, think_time, connecting, logged_in, latencies)
+             for i in range(sessions)]
+
+    began=time.perf_counter()
+    await asyncio.gather(*clients)
+    return latencies, time.perf_counter()-began
+
+def load_test(sessions=5000, accounts=1000, commands=10, think_time=1.0):
+    print(f'{sessions} concurrent sessions on {accounts} accounts, {commands} commands each')
+    id_numbers=fill_accounts(accounts)
+    before=sum(accounts_db[find_user_id(id_number)]["amount_of_tokens"].value for id_number in id_numbers)
+    server,loop=start_server(idle_timeout=60)
+
+    latencies,elapsed=asyncio.run(run_clients(server.port, id_numbers, sessions, commands, think_time))
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+
+    after=sum(accounts_db[find_user_id(id_number)]["amount_of_tokens"].value for id_number in id_numbers)
+    assert after-before==sessions*commands, (after-before, sessions*commands)   # no update lost
+    latencies.sort()
+    print(f'{"commands":<30} {len(latencies):10d}')
+    print(f'{"commands/s":<30} {len(latencies)/elapsed:10.0f}')
+    for label,fraction in [('p50',0.5),('p90',0.9),('p99',0.99),('p99.9',0.999)]:
+        print(f'{label:<30} {percentile(latencies, fraction)*1000:10.2f} ms')
+    print(f'{"max":<30} {latencies[-1]*1000:10.2f} ms')
+
+########################################################################
+#  LOCKED ACCOUNT
+# ######################################################################
+
+async def timed_commands(port, id_number, command, count, replies=None):
+    reader,writer=await asyncio.open_connection('127.0.0.1', port)
+    await reader.readline()
+    writer.write(f'login {id_number} {LOAD_PASSWORD}\n'.encode())
+    await reader.readline()
+    latencies=[]
+    for _ in range(count):
+        sent=time.perf_counter()
+        writer.write(command.encode()+b'\n')
+        reply=await reader.readline()
+        latencies.append(time.perf_counter()-sent)
+        if replies is not None:
+            replies.append(reply)
+    writer.close()
+    return latencies
+
+def hold_lock(id_number, hold):
+    """a thread (like a scheduled power) holds the lock of an account for hold seconds"""
+    locked=threading.Event()
+    def power():
+        with account_lock(find_user_id(id_number)):
+            locked.set()
+            time.sleep(hold)
+    threading.Thread(target=power).start()
+    locked.wait()
+
+def check_locked_account(hold=1.0, waiting_sessions=40, command_workers=32):
+    """more sessions than command threads wait on a locked account: the sessions of the other accounts are still served"""
+    id_numbers=fill_accounts(2)
+    server,loop=start_server(idle_timeout=60, command_workers=command_workers)
+    before=accounts_db[find_user_id(id_numbers[0])]["amount_of_tokens"].value
+    hold_lock(id_numbers[0], hold)
+
+    replies=[]
+    async def run():
+        waiting=[timed_commands(server.port, id_numbers[0], 'amount_of_tokens += 1', 1, replies) for _ in range(waiting_sessions)]
+        return await asyncio.gather(timed_commands(server.port, id_numbers[1], 'amount_of_tokens += 1', 100), *waiting)
+    free,*waiting=asyncio.run(run())
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    waiting=[latencies[0] for latencies in waiting]
+    assert all(reply.startswith(b'OK') for reply in replies), replies
+    assert accounts_db[find_user_id(id_numbers[0])]["amount_of_tokens"].value==before+waiting_sessions
+    assert min(waiting)>=hold*0.5, min(waiting)
+    assert max(free)<hold/2, max(free)   # no command thread was left waiting for the lock
+
+    server,loop=start_server(idle_timeout=60, lock_timeout=hold/4)
+    hold_lock(id_numbers[0], hold)
+    replies=[]
+    asyncio.run(timed_commands(server.port, id_numbers[0], 'amount_of_tokens += 1', 1, replies))
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    assert replies[0].startswith(b'ERR Account busy'), replies
+    print(f'{"locked account, max of " + str(waiting_sessions):<30} {max(waiting)*1000:10.2f} ms')
+    print(f'{"other account, max of 100":<30} {max(free)*1000:10.2f} ms')
+
+########################################################################
+#  RATE LIMITER
+# ######################################################################
+
+async def wrong_login(port, id_number):
+    reader,writer=await asyncio.open_connection('127.0.0.1', port)
+    await reader.readline()
+    writer.write(f'login {id_number} wrong\n'.encode())
+    reply=await reader.readline()
+    writer.close()
+    return reply
+
+def check_rate_limiter(attempts=50, ids=10000):
+    """parallel logins to one ID number check at most max_failures passwords; the failures kept are bounded"""
+    server,loop=start_server(idle_timeout=60)
+    async def run():
+        return await asyncio.gather(*(wrong_login(server.port, 'RATE') for _ in range(attempts)))
+    replies=asyncio.run(run())
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    assert all(reply.startswith(b'ERR') for reply in replies), replies
+    assert len(rate_limiter.failures['RATE'])==rate_limiter.max_failures, rate_limiter.failures['RATE']
+
+    limiter=LoginRateLimiter(max_ids=ids//10)
+    for i in range(ids):
+        limiter.try_acquire(f'R{i}')
+    assert len(limiter.failures)==ids//10, len(limiter.failures)
+    print(f'{"parallel wrong logins":<30} {attempts:10d}')
+    print(f'{"passwords checked":<30} {len(rate_limiter.failures["RATE"]):10d}')
+
+
+if __name__ == "__main__":
+    load_test(int(sys.argv[1]) if len(sys.argv)>1 else 5000)
+    check_locked_account()
+    check_rate_limiter()
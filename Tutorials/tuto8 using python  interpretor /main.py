@@ -4,9 +4,9 @@ from visualization import read
 from database import print_database
 
 def main():
-    user_account = user_login()
-    if user_account:
-        user_session(user_account)
+    session = user_login()
+    if session:
+        user_session(session)
         read()
     print_database("Final")
 
@@ -0,0 +1,123 @@
+"""
+Password Hashing Module
+
+This module stores the passwords of the accounts as salted hashes made with a key derivation function
+of hashlib (scrypt or pbkdf2), whose cost can be tuned: the higher the cost, the slower each guess of an
+attacker who got the hashes, and the slower each login.
+
+A hash is stored as a string holding the algorithm, its cost parameters, the salt and the hash, for example:
+    scrypt$16384$8$1$<salt hex>$<hash hex>
+    pbkdf2_sha256$600000$<salt hex>$<hash hex>
+so the cost can be changed without breaking the passwords already stored.
+
+Key Features:
+- hash_password and verify_password with a constant-time comparison.
+- Cache of the verified passwords, so a user logging in again does not pay the cost of the KDF.
+"""
+import hashlib
+import hmac
+import os
+import threading
+from collections import OrderedDict
+
+# Cost used for the new hashes
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600000
+DEFAULT_ALGORITHM = "scrypt"
+
+def hash_password(password, algorithm=None, cost=None):
+    """
+    Hashes a password with a new random salt.
+
+    Args:
+        password (str): The password.
+        algorithm (str): "scrypt" or "pbkdf2_sha256" (DEFAULT_ALGORITHM if not given).
+        cost (int): N of scrypt or the number of iterations of pbkdf2 (the module settings if not given).
+
+    Returns:
+        str: The hash, with its algorithm, cost and salt.
+    """
+    algorithm = algorithm or DEFAULT_ALGORITHM
+    salt = os.urandom(16)
+    if algorithm == "scrypt":
+        n = cost or SCRYPT_N
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=SCRYPT_R, p=SCRYPT_P, maxmem=256 * n * SCRYPT_R)
+        return f"scrypt${n}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+    if algorithm == "pbkdf2_sha256":
+        iterations = cost or PBKDF2_ITERATIONS
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+        return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+    raise ValueError(f"Unknown password hashing algorithm: {algorithm}")
+
+def is_password_hash(value):
+    """
+    Args:
+        value: The value of a password token.
+
+    Returns:
+        bool: True if the value is a hash made by hash_password.
+    """
+    return isinstance(value, str) and value.split("$", 1)[0] in ("scrypt", "pbkdf2_sha256")
+
+def compute_hash(password, stored_hash):
+    """
+    Hashes a password with the algorithm, cost and salt of a stored hash.
+
+    Returns:
+        tuple: (the new hash, the stored hash) as bytes, or None if the stored hash is not valid.
+    """
+    parts = stored_hash.split("$")
+    if parts[0] == "scrypt" and len(parts) == 6:
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        salt, expected = bytes.fromhex(parts[4]), bytes.fromhex(parts[5])
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=len(expected)), expected
+    if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        salt, expected = bytes.fromhex(parts[2]), bytes.fromhex(parts[3])
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, int(parts[1])), expected
+    return None
+
+# Verified passwords: stored hash -> HMAC of the password with a key of this process.
+# The key never leaves the process, so the cache is only useful to this process.
+verified_cache_key = os.urandom(32)
+verified_cache = OrderedDict()
+verified_cache_size = 100000
+verified_cache_lock = threading.Lock()
+
+def cache_digest(password):
+    return hmac.new(verified_cache_key, password.encode(), hashlib.sha256).digest()
+
+def verify_password(password, stored_hash, use_cache=True):
+    """
+    Checks a password against a stored hash (in constant time for a given hash).
+
+    Args:
+        password (str): The password given at login.
+        stored_hash (str): The hash stored in the password token.
+        use_cache (bool): Checks first the passwords already verified for this hash.
+
+    Returns:
+        bool: True if the password matches.
+    """
+    if not isinstance(password, str) or not is_password_hash(stored_hash):
+        return False
+
+    if use_cache:
+        with verified_cache_lock:
+            cached = verified_cache.get(stored_hash)
+            if cached is not None:
+                verified_cache.move_to_end(stored_hash)
+        if cached is not None and hmac.compare_digest(cached, cache_digest(password)):
+            return True
+
+    result = compute_hash(password, stored_hash)
+    if result is None or not hmac.compare_digest(result[0], result[1]):
+        return False
+
+    if use_cache:
+        with verified_cache_lock:
+            verified_cache[stored_hash] = cache_digest(password)
+            if len(verified_cache) > verified_cache_size:
+                verified_cache.popitem(last=False)
+    return True
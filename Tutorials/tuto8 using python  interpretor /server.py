@@ -0,0 +1,198 @@
+"""
+Session Server Module
+
+This module serves the login and the session commands of main.py to many users at once, over TCP,
+with asyncio: one process holds thousands of sessions, each one waiting for its next line without
+blocking the others.
+
+Protocol (one line of UTF-8 text per message):
+    client: login <id_number> <password>      server: OK Welcome, <name> <surname>!   or   ERR <message>
+    client: <session command>                 server: OK <readable tokens as JSON>    or   ERR <message>
+    client: exit                              server: BYE Logging out.
+A session that sends nothing for idle_timeout seconds receives "BYE Idle timeout." and is closed.
+
+Key Features:
+- The passwords are verified in the login thread pool of authentication.py, not in the event loop.
+- A command reads, runs and writes the tokens of its account while holding the lock of the account
+  (database.account_lock), so two sessions of the same account (or a scheduled power) never lose an update.
+  The commands run in a thread pool: running a slow command does not stop the event loop.
+  A command whose account is locked does not wait in a thread of the pool: the event loop retries it
+  (up to lock_timeout seconds), so sessions waiting on a locked account never take all the threads.
+
+Example:
+    python3 server.py --port 8765
+    nc localhost 8765
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+
+from authentication import authenticate_user_async, rate_limiter
+from database import account_lock
+from session import CommandError, Session, run_command
+
+class SessionServer:
+    """
+    TCP server of the sessions.
+
+    Attributes:
+        host (str): The address to listen on.
+        port (int): The port to listen on (0 for any free port, see self.port after start()).
+        idle_timeout (float): Seconds a session can stay without sending a line.
+        max_line (int): Maximum length of a line in bytes.
+        command_workers (int): Number of threads running the commands.
+        lock_timeout (float): Seconds a command waits for the lock of its account before "ERR Account busy".
+        sessions (int): Number of connections open.
+    """
+    def __init__(self, host="127.0.0.1", port=8765, idle_timeout=300, max_line=4096, command_workers=32,
+                 lock_timeout=10):
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.max_line = max_line
+        self.lock_timeout = lock_timeout
+        self.sessions = 0
+        self.server = None
+        self.executor = ThreadPoolExecutor(max_workers=command_workers, thread_name_prefix="command")
+
+    async def start(self):
+        """Starts listening; the connections are served by the running event loop."""
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=self.max_line, backlog=4096)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Serving sessions on {self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=False)
+
+    async def send(self, writer, message):
+        writer.write(message.encode() + b"\n")
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        self.sessions += 1
+        session = None
+        try:
+            await self.send(writer, "Welcome to the User Account System! Log in with: login <id_number> <password>")
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    await self.send(writer, "BYE Idle timeout.")
+                    break
+                except ValueError:
+                    await self.send(writer, "BYE Line too long.")
+                    break
+                if not line:
+                    break
+
+                text = line.decode(errors="replace").strip()
+                if not text:
+                    continue
+                if text.lower() == "exit":
+                    await self.send(writer, "BYE Logging out.")
+                    break
+                if session is None:
+                    session = await self.login(text, writer)
+                else:
+                    await self.send(writer, await self.execute(session, text))
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def login(self, text, writer):
+        """
+        Returns:
+            Session: The session if the line is a successful login, otherwise None.
+        """
+        parts = text.split(" ", 2)
+        if len(parts) != 3 or parts[0].lower() != "login":
+            await self.send(writer, "ERR Log in first: login <id_number> <password>")
+            return None
+        id_number, password = parts[1], parts[2]
+        if rate_limiter.is_blocked(id_number):   # spares the password check; authenticate_user checks again
+            await self.send(writer, "ERR Too many failed logins, try again later.")
+            return None
+
+        login = await asyncio.wrap_future(authenticate_user_async(id_number, password))
+        if not login:
+            await self.send(writer, "ERR Invalid ID or password.")
+            return None
+        session = Session(*login)
+        user_vars = session.values()
+        await self.send(writer, f"OK Welcome, {user_vars.get('name')} {user_vars.get('surname')}!")
+        return session
+
+    async def execute(self, session, text):
+        """
+        Runs a session command in the executor, retrying it with a growing delay while its account is locked.
+
+        Returns:
+            str: The reply to the command.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_timeout
+        delay = 0.001
+        while True:
+            reply = await loop.run_in_executor(self.executor, self.run, session, text)
+            if reply is not None:
+                return reply
+            if loop.time() >= deadline:
+                return "ERR Account busy, try again later."
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def run(self, session, text):
+        """
+        Runs a session command on the tokens of the account, holding the lock of the account.
+        Called in a thread of the executor, never in the event loop.
+
+        Returns:
+            str: The reply to the command, or None if the account is locked (the command did not run).
+        """
+        lock = account_lock(session.user_id)
+        if not lock.acquire(blocking=False):
+            return None
+        try:
+            user_vars = session.values()
+            try:
+                run_command(session, text, user_vars)
+            except CommandError as e:
+                return f"ERR {e}"
+            except Exception as e:
+                return f"ERR An error occurred: {e}"
+            errors = [f"{name}: {result}" for name, result in session.update(user_vars).items()
+                      if result != "Token updated successfully."]
+            if errors:
+                return "ERR " + "; ".join(errors)
+            return "OK " + json.dumps(session.values(), default=str)
+        finally:
+            lock.release()
+
+def main():
+    parser = argparse.ArgumentParser(description="Session server of the User Account System")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--idle-timeout", type=float, default=300)
+    parser.add_argument("--lock-timeout", type=float, default=10)
+    args = parser.parse_args()
+    try:
+        asyncio.run(SessionServer(args.host, args.port, args.idle_timeout, lock_timeout=args.lock_timeout).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
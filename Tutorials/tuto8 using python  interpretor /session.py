@@ -1,14 +1,197 @@
-from database import update_account
+import ast
+import operator
+from functools import lru_cache
 
-def user_session(user_account):
-    user_id = [uid for uid, acc in accounts_db.items() if acc == user_account][0]
-    user_vars = {
-        "name": user_account["name"],
-        "surname": user_account["surname"],
-        "amount_of_tokens": user_account["amount_of_tokens"]
-    }
+from database import account_lock, self_update_token
 
-    print(f"Welcome, {user_vars['name']} {user_vars['surname']}!")
+# The tokens a user can change in a session (if their self_level allows it); the others are read-only
+SELF_EDITABLE_TOKENS = ("name", "surname", "amount_of_tokens")
+
+# The only builtins a session command can call
+SAFE_BUILTINS = {
+    "abs": abs, "bool": bool, "float": float, "int": int, "len": len,
+    "max": max, "min": min, "round": round, "str": str,
+}
+
+# The Python a session command can use: assignments and expressions on the tokens, without
+# attributes, subscripts, imports, lambdas or loops (a command cannot reach anything but the tokens)
+ALLOWED_NODES = (
+    ast.Module, ast.Expr, ast.Assign, ast.AugAssign,
+    ast.Name, ast.Load, ast.Store, ast.Constant, ast.Tuple,
+    ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call,
+    ast.JoinedStr, ast.FormattedValue,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.UAdd, ast.USub, ast.Not, ast.And, ast.Or,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+# Limits of a session command, so one command cannot take all the memory or CPU of the process
+MAX_COMMAND_LENGTH = 1000     # characters of a command (and of the keys of the compiled commands cache)
+MAX_VALUE_LENGTH = 10000      # characters of a string (or items of a tuple) made by a command
+MAX_INT_BITS = 4096           # bits of an integer made by a multiplication
+
+# The binary operators of ALLOWED_NODES; a command calls them through checked_binop
+BINARY_OPERATORS = {
+    "Add": operator.add, "Sub": operator.sub, "Mult": operator.mul,
+    "Div": operator.truediv, "FloorDiv": operator.floordiv, "Mod": operator.mod,
+}
+
+class CommandError(Exception):
+    """A session command that is not allowed or uses a token the user cannot read."""
+
+def checked_binop(op, lhs, rhs):
+    """
+    Runs a binary operator of a session command, refusing the results bigger than the limits
+    before making them (a string repeated a billion times, an integer of a million digits).
+    """
+    if op == "Mult":
+        for sequence, count in ((lhs, rhs), (rhs, lhs)):
+            if isinstance(sequence, (str, tuple)) and isinstance(count, int) and len(sequence) * count > MAX_VALUE_LENGTH:
+                raise CommandError(f"Values are limited to {MAX_VALUE_LENGTH} characters.")
+        if isinstance(lhs, int) and isinstance(rhs, int) and lhs.bit_length() + rhs.bit_length() > MAX_INT_BITS:
+            raise CommandError(f"Integers are limited to {MAX_INT_BITS} bits.")
+    if op == "Mod" and isinstance(lhs, str):
+        raise CommandError("String formatting with % is not allowed in a session command.")
+    result = BINARY_OPERATORS[op](lhs, rhs)
+    if isinstance(result, (str, tuple)) and len(result) > MAX_VALUE_LENGTH:
+        raise CommandError(f"Values are limited to {MAX_VALUE_LENGTH} characters.")
+    return result
+
+class CheckedOperators(ast.NodeTransformer):
+    """Turns a + b into checked_binop("Add", a, b), and x += b into x = checked_binop("Add", x, b)."""
+    def call(self, op, lhs, rhs):
+        return ast.Call(ast.Name("checked_binop", ast.Load()), [ast.Constant(type(op).__name__), lhs, rhs], [])
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        return ast.copy_location(self.call(node.op, node.left, node.right), node)
+
+    def visit_AugAssign(self, node):
+        self.generic_visit(node)
+        target = ast.Name(node.target.id, ast.Load())
+        return ast.copy_location(ast.Assign([node.target], self.call(node.op, target, node.value)), node)
+
+class Session:
+    """
+    The session of a logged in user.
+
+    Attributes:
+        user_id (str): The ID of the account, given by the login.
+        account (dict): The tokens of the account.
+        access_level (int): The value of the access_level token of the account.
+        readable (dict): The tokens of the account the user can read (self_level), by name.
+            The tokens themselves are kept, so a new value of a token is seen without reading the account again.
+        writable (dict): The readable tokens of SELF_EDITABLE_TOKENS, by name.
+    """
+    def __init__(self, user_id, account):
+        self.user_id = user_id
+        self.account = account
+        self.refresh()
+
+    def refresh(self):
+        """
+        Reads the access level and the readable tokens again (after tokens were created or deleted, or levels changed).
+        """
+        access_level = self.account.get("access_level")
+        self.access_level = access_level.value if access_level else 0
+        # The password hash is never shown in a session
+        self.readable = {
+            name: token for name, token in self.account.items()
+            if name != "password" and self.access_level <= token.self_level
+        }
+        self.writable = {name: token for name, token in self.readable.items() if name in SELF_EDITABLE_TOKENS}
+
+    def values(self):
+        """
+        Returns:
+            dict: The values of the readable tokens, by name.
+        """
+        return {name: token.value for name, token in self.readable.items()}
+
+    def update(self, new_values):
+        """
+        Updates the writable tokens whose value changed, if the user has the self level to modify them.
+
+        Args:
+            new_values (dict): New values of tokens, by name (unchanged and unknown names are ignored).
+
+        Returns:
+            dict: The result message of each update, by token name (a changed read-only token is refused).
+        """
+        results = {}
+        with account_lock(self.user_id):
+            for name, value in new_values.items():
+                token = self.readable.get(name)
+                if token is None or token.value == value:
+                    continue
+                if name in self.writable:
+                    results[name] = self_update_token(self.user_id, name, value, self.access_level)
+                else:
+                    results[name] = "Access denied: This token cannot be changed in a session."
+        return results
+
+@lru_cache(maxsize=1024)
+def compile_command(text):
+    """
+    Checks and compiles a session command. The result is cached by text, so a command typed again
+    (by any session) is not parsed again. The cache holds at most 1024 commands of MAX_COMMAND_LENGTH characters.
+
+    Args:
+        text (str): The command.
+
+    Returns:
+        tuple: (code object, names read, names assigned).
+
+    Raises:
+        CommandError: If the command is not valid or uses Python a session command cannot use.
+    """
+    if len(text) > MAX_COMMAND_LENGTH:
+        raise CommandError(f"Commands are limited to {MAX_COMMAND_LENGTH} characters.")
+    try:
+        tree = ast.parse(text, "<session>", "exec")
+    except SyntaxError as e:
+        raise CommandError(f"Invalid syntax: {e.msg}")
+    loaded, stored = set(), set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise CommandError(f"{type(node).__name__} is not allowed in a session command.")
+        if isinstance(node, ast.Call) and (node.keywords or not isinstance(node.func, ast.Name) or node.func.id not in SAFE_BUILTINS):
+            raise CommandError(f"Only {', '.join(SAFE_BUILTINS)} can be called in a session command.")
+        if isinstance(node, ast.FormattedValue) and node.format_spec is not None:
+            raise CommandError("Format specifications are not allowed in a session command.")
+        if isinstance(node, ast.Name):
+            (stored if isinstance(node.ctx, ast.Store) else loaded).add(node.id)
+    tree = ast.fix_missing_locations(CheckedOperators().visit(tree))
+    return compile(tree, "<session>", "exec"), frozenset(loaded), frozenset(stored)
+
+def run_command(session, text, user_vars):
+    """
+    Runs a session command on the values of the readable tokens of the session.
+
+    Args:
+        session (Session): The session of the user.
+        text (str): The command.
+        user_vars (dict): The values of the readable tokens (from session.values()), changed in place.
+
+    Raises:
+        CommandError: If the command is not allowed, reads a token that is not readable
+            or assigns a token that is not writable.
+    """
+    if len(text) > MAX_COMMAND_LENGTH:   # before the cache, which keeps its keys
+        raise CommandError(f"Commands are limited to {MAX_COMMAND_LENGTH} characters.")
+    code, loaded, stored = compile_command(text)
+    unknown = loaded - user_vars.keys() - SAFE_BUILTINS.keys()
+    if unknown:
+        raise CommandError(f"Unknown or unreadable tokens: {', '.join(sorted(unknown))}")
+    read_only = stored - session.writable.keys()
+    if read_only:
+        raise CommandError(f"Tokens that cannot be changed in a session: {', '.join(sorted(read_only))}")
+    exec(code, {"__builtins__": SAFE_BUILTINS, "checked_binop": checked_binop}, user_vars)
+
+def user_session(session):
+    user_vars = session.values()
+
+    print(f"Welcome, {user_vars.get('name')} {user_vars.get('surname')}!")
     print("You can modify your account details. Type 'exit' to log out.")
 
     while True:
@@ -18,9 +201,10 @@ def user_session(user_account):
             break
 
         try:
-            exec(user_input, globals(), user_vars)
+            run_command(session, user_input, user_vars)
             print("Updated account details:", user_vars)
         except Exception as e:
             print(f"An error occurred: {e}")
 
-    update_account(user_id, user_vars)
+    for name, result in session.update(user_vars).items():
+        print(f"{name}: {result}")
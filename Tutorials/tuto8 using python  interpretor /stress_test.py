@@ -0,0 +1,116 @@
+#Stress test of the locks of database.py: scheduled powers, sessions and account creations
+#and deletions change the same accounts at the same time, then the tokens are checked.
+#
+#to run the stress test use:
+#python3 stress_test.py [seconds]
+
+import random
+import sys
+import threading
+import time
+
+from database import Token, account_locks, accounts_db, create_account, delete_account, find_user_id, id_number_index, update_token
+from passwords import hash_password
+from powers import create_power, delete_power
+from server import SessionServer
+from session import Session
+
+STRESS_HASH=hash_password('stress', "pbkdf2_sha256", 1)
+
+# Scheduled power: credits one token to every stress account and counts it in its dividends token,
+# both with compare-and-set updates (retried when another thread changed the token in between)
+DIVIDEND_POWER='''
+from database import accounts_db, update_token
+for user_id in {user_ids!r}:
+    for name in ("amount_of_tokens", "dividends"):
+        while True:
+            value = accounts_db[user_id][name].value
+            if update_token(user_id, name, value + 1, 0, expected=value) == "Token updated successfully.":
+                break
+'''
+
+def fill_accounts(count):
+    user_ids=[]
+    for i in range(count):
+        result=create_account({
+            "id_number": Token("id_number", f'S{i}', 0, 0),
+            "name": Token("name", f'Stress{i}', 0, 1),
+            "surname": Token("surname", 'Test', 0, 1),
+            "password": Token("password", STRESS_HASH, 0, 0),
+            "amount_of_tokens": Token("amount_of_tokens", 0, 0, 2),
+            "dividends": Token("dividends", 0, 0, 0),   # not readable by the sessions (access level 1)
+            "access_level": Token("access_level", 1, 0, 1),
+        })
+        assert result.startswith("Account created"), result
+        user_ids.append(find_user_id(f'S{i}'))
+    return user_ids
+
+def session_worker(user_ids, commands, stop):
+    """a session runs increments on random accounts, like the commands of the session server"""
+    server=SessionServer()
+    sessions={user_id: Session(user_id, accounts_db[user_id]) for user_id in user_ids}
+    while not stop.is_set():
+        user_id=random.choice(user_ids)
+        reply=server.run(sessions[user_id], 'amount_of_tokens += 1')
+        assert reply.startswith('OK'), reply
+        commands[user_id]=commands.get(user_id, 0)+1
+
+def churn_worker(worker, stop, counts):
+    """creates, renumbers and deletes accounts: the structural lock and the id_number index"""
+    i=0
+    while not stop.is_set():
+        result=create_account({
+            "id_number": Token("id_number", f'C{worker}-{i}', 0, 0),
+            "amount_of_tokens": Token("amount_of_tokens", 0, 0, 2),
+        })
+        user_id=result.rsplit(' ', 1)[-1]
+        assert update_token(user_id, "id_number", f'R{worker}-{i}', 0) == "Token updated successfully."
+        assert delete_account(user_id) == f"Account {user_id} deleted."
+        i+=1
+    counts[worker]=i
+
+def stress_test(seconds=5.0, accounts=20, sessions=8, churners=2):
+    print(f'{seconds} s: 1 scheduled power, {sessions} session threads and {churners} account churn threads on {accounts} accounts')
+    switch_interval=sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)   # switch threads often, to interleave the updates as much as possible
+    user_ids=fill_accounts(accounts)
+
+    stop=threading.Event()
+    commands=[{} for _ in range(sessions)]
+    churned={}
+    threads=[threading.Thread(target=session_worker, args=(user_ids, commands[i], stop)) for i in range(sessions)]
+    threads+=[threading.Thread(target=churn_worker, args=(i, stop, churned)) for i in range(churners)]
+    create_power('stress_dividend', DIVIDEND_POWER.format(user_ids=user_ids), 0, schedule_interval=0.001)
+    for thread in threads: thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads: thread.join()
+    delete_power('stress_dividend')
+    sys.setswitchinterval(switch_interval)
+
+    # every increment is in the balance: nothing lost to a concurrent update
+    session_commands=0
+    dividends=0
+    for user_id in user_ids:
+        account=accounts_db[user_id]
+        run=sum(worker.get(user_id, 0) for worker in commands)
+        assert account["amount_of_tokens"].value==run+account["dividends"].value, (user_id, account["amount_of_tokens"].value, run, account["dividends"].value)
+        session_commands+=run
+        dividends+=account["dividends"].value
+    # the index matches the accounts left
+    assert id_number_index=={account["id_number"].value: user_id for user_id, account in accounts_db.items()}
+    assert not any(id_number[0] in 'CR' for id_number in id_number_index)
+    # the deleted accounts left no lock behind
+    assert set(account_locks) <= set(accounts_db), set(account_locks)-set(accounts_db)
+
+    print(f'{"session commands":<30} {session_commands:10d}')
+    print(f'{"dividends credited":<30} {dividends:10d}')
+    print(f'{"accounts created and deleted":<30} {sum(churned.values()):10d}')
+    print('OK: no lost update, index consistent, no lock left')
+
+    for user_id in user_ids:
+        delete_account(user_id)
+
+
+if __name__ == "__main__":
+    stress_test(float(sys.argv[1]) if len(sys.argv)>1 else 5.0)
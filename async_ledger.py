@@ -0,0 +1,84 @@
+"""
+Asyncio access to the online_bank schema
+
+mysql.connector blocks, so AsyncLedger runs the LedgerDAO operations in its own threads and
+gives them as coroutines. The number of operations running at the same time is bounded by
+max_concurrency (the size of the connection pool): the other ones wait in the event loop
+without taking a thread or a connection, so the pool is never exhausted.
+
+Example:
+    async def main():
+        async with create_async_ledger(pool_size=10) as ledger:
+            await ledger.deposit(account_id, 100)
+            print(await ledger.get_balance(account_id))
+    asyncio.run(main())
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from mysql_connection import create_connection, create_connection_pool, get_pooled_connection
+from ledger_dao import LedgerDAO
+
+async def create_connection_async(database=None):
+    """create_connection run outside of the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, create_connection, database)
+
+class AsyncLedger:
+    """
+    Coroutines of the LedgerDAO operations.
+
+    Attributes:
+        dao (LedgerDAO): The DAO running the operations.
+        max_concurrency (int): Number of operations running at the same time.
+    """
+    def __init__(self, dao, max_concurrency=10):
+        self.dao = dao
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="ledger")
+        self.semaphore = None
+
+    async def run(self, func, *args):
+        """Runs func(*args) in a thread of the ledger once one of the max_concurrency slots is free."""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def get_balance(self, account_id):
+        return await self.run(self.dao.get_balance, account_id)
+
+    async def get_user_level(self, user_id):
+        return await self.run(self.dao.get_user_level, user_id)
+
+    async def get_transactions(self, account_id, start_date=None, end_date=None):
+        return await self.run(self.dao.get_transactions, account_id, start_date, end_date)
+
+    async def deposit(self, account_id, amount):
+        return await self.run(self.dao.deposit, account_id, amount)
+
+    async def withdraw(self, account_id, amount):
+        return await self.run(self.dao.withdraw, account_id, amount)
+
+    async def transfer(self, from_account, to_account, amount):
+        return await self.run(self.dao.transfer, from_account, to_account, amount)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+def create_async_ledger(pool_size=10, database="online_bank"):
+    """
+    Returns:
+        AsyncLedger: A ledger on a new pool of pool_size connections, running pool_size operations at a time.
+    """
+    pool = create_connection_pool(pool_name="online_bank_async_pool", pool_size=pool_size, database=database)
+    dao = LedgerDAO(lambda: get_pooled_connection(pool))
+    return AsyncLedger(dao, max_concurrency=pool_size)
@@ -0,0 +1,284 @@
+"""
+Balance snapshots of the accounts of the online_bank schema
+
+A snapshot stores the balance of an account computed from its transactions up to as_of_transaction_id.
+The balance at a point of the history is the nearest snapshot before it plus the transactions
+made between the snapshot and that point, so it costs O(transactions since the snapshot)
+instead of O(whole history). A new snapshot is taken once an account has `cadence` transactions
+after its last snapshot.
+
+Deposits add their amount, withdrawals remove it and transfers carry the signed amount.
+The initial balance given to create_account is not a transaction, so it is not counted.
+
+Concurrent writers: a transaction id is given when the row is inserted, not when it is committed,
+so a transaction with a lower id can commit after a snapshot that records a higher one. take_snapshot
+therefore locks the row of the account in accounts (SELECT ... FOR UPDATE) before reading: the writers
+(LedgerDAO, LedgerJournal, bulk_insert_transactions) update that row before inserting their
+transactions, in the same transaction, so none of them is in flight while the snapshot is read.
+Rows inserted without updating the balance (load_transactions_infile, or update_balances=False)
+must not run while snapshots are taken.
+
+Dates: the transaction ids do not follow the dates (bulk_insert_transactions and the journal insert
+rows with older dates). The balance at a date starts from the last transaction of the account made at
+that date, then removes the transactions with a lower id made after that date.
+
+Archived partitions: maintain_partitions(..., snapshots=...) takes a snapshot of every account with
+transactions in a partition before dropping it, so the latest snapshot of an account always covers
+its archived transactions and the current balance only reads the live table. A balance as of an
+earlier point adds the archived transactions after its snapshot, read from dao.archive_dir.
+
+Example:
+    snapshots = BalanceSnapshots(dao, cadence=1000)
+    snapshots.take_snapshots()                    # from a nightly job, or snapshots.start(3600)
+    snapshots.balance_as_of(account_id, datetime(2024, 1, 31))
+"""
+import datetime
+import threading
+
+from ledger_dao import LedgerError
+from transactions_archive import read_archived_transactions, to_datetime
+
+# Signed amount of a transaction in SQL
+SIGNED_AMOUNT = "CASE WHEN transaction_type = 'withdrawal' THEN -amount ELSE amount END"
+
+class BalanceSnapshots:
+    """
+    Snapshots of the balances, stored in the balance_snapshots table.
+
+    Attributes:
+        dao (LedgerDAO): The DAO giving the connections.
+        cadence (int): Number of transactions of an account between two snapshots.
+    """
+    def __init__(self, dao, cadence=1000):
+        self.dao = dao
+        self.cadence = cadence
+
+    def _last_snapshot(self, cursor, account_id, as_of_transaction_id=None):
+        query = "SELECT as_of_transaction_id, balance FROM balance_snapshots WHERE account_id = %s"
+        params = [account_id]
+        if as_of_transaction_id is not None:
+            query += " AND as_of_transaction_id <= %s"
+            params.append(as_of_transaction_id)
+        query += " ORDER BY as_of_transaction_id DESC LIMIT 1"
+        cursor.execute(self.dao.sql(query), params)
+        return cursor.fetchone() or (0, 0)
+
+    def _delta(self, cursor, account_id, after_transaction_id, as_of_transaction_id=None):
+        # the index on account_id also holds the transaction_id (primary key), so only the delta is read
+        query = (
+            f"SELECT COALESCE(SUM({SIGNED_AMOUNT}), 0), MAX(transaction_id), COUNT(*) "
+            "FROM transactions WHERE account_id = %s AND transaction_id > %s"
+        )
+        params = [account_id, after_transaction_id]
+        if as_of_transaction_id is not None:
+            query += " AND transaction_id <= %s"
+            params.append(as_of_transaction_id)
+        cursor.execute(self.dao.sql(query), params)
+        delta, last_id, count = cursor.fetchone()
+        return self.dao.money(delta), last_id, count
+
+    def _archived_delta(self, cursor, account_id, after_transaction_id, as_of_transaction_id):
+        # the archived transactions are older than the live ones of the account
+        if self.dao.archive_dir is None:
+            return 0
+        cursor.execute(self.dao.sql("SELECT MIN(transaction_id) FROM transactions WHERE account_id = %s"), (account_id,))
+        first_live_id = cursor.fetchone()[0]
+        if first_live_id is not None and first_live_id <= after_transaction_id + 1:
+            return 0
+        return sum(
+            -transaction['amount'] if transaction['transaction_type'] == 'withdrawal' else transaction['amount']
+            for transaction in read_archived_transactions(self.dao.archive_dir, account_id)
+            if after_transaction_id < transaction['transaction_id'] <= as_of_transaction_id
+            and (first_live_id is None or transaction['transaction_id'] < first_live_id)
+        )
+
+    def last_transaction_id(self, as_of, account_id=None):
+        """
+        Returns the highest transaction_id of the transactions made at or before the date as_of
+        (of an account, or of all of them). Transactions with a lower id can have been made after as_of.
+        With account_id, the archived transactions of the account are also read (from dao.archive_dir)
+        when no live transaction is that old.
+        """
+        query = "SELECT MAX(transaction_id) FROM transactions WHERE transaction_date <= %s"
+        params = [as_of]
+        if account_id is not None:
+            query += " AND account_id = %s"
+            params.append(account_id)
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql(query), params)
+            row = cursor.fetchone()
+        if row[0] is None and account_id is not None and self.dao.archive_dir is not None:
+            end_date = to_datetime(as_of) + datetime.timedelta(microseconds=1)
+            archived = read_archived_transactions(self.dao.archive_dir, account_id, end_date=end_date)
+            return max((transaction['transaction_id'] for transaction in archived), default=0)
+        return row[0] or 0
+
+    def balance_as_of(self, account_id, as_of=None):
+        """
+        Returns the balance of an account after a transaction of the history.
+
+        Args:
+            account_id (int): The account.
+            as_of: A transaction_id, a date (balance after the last transaction made at that date)
+                or None for the current balance.
+
+        Returns:
+            The balance computed from the nearest snapshot and the transactions after it.
+        """
+        as_of_date = None
+        if as_of is not None and not isinstance(as_of, int):
+            as_of_date = as_of
+            as_of = self.last_transaction_id(as_of_date, account_id)
+        with self.dao.transaction() as cursor:
+            snapshot_id, balance = self._last_snapshot(cursor, account_id, as_of)
+            delta, _, _ = self._delta(cursor, account_id, snapshot_id, as_of)
+            if as_of is not None:
+                # the latest snapshot covers the archive (see maintain_partitions), an older one may not
+                latest_id, _ = self._last_snapshot(cursor, account_id)
+                if snapshot_id < latest_id:
+                    delta += self._archived_delta(cursor, account_id, snapshot_id, as_of)
+            if as_of_date is not None:
+                # the transactions with a lower id made after the date (read on the index (account_id, transaction_date))
+                cursor.execute(self.dao.sql(
+                    f"SELECT COALESCE(SUM({SIGNED_AMOUNT}), 0) FROM transactions "
+                    "WHERE account_id = %s AND transaction_date > %s AND transaction_id <= %s"
+                ), (account_id, as_of_date, as_of))
+                delta -= self.dao.money(cursor.fetchone()[0])
+        return balance + delta
+
+    def take_snapshot(self, account_id, force=False):
+        """
+        Stores a new snapshot of the account if it has at least `cadence` transactions since
+        its last snapshot (or at least one if force is True).
+        The row of the account is locked first, so no transaction of the account is in flight
+        while its transactions are read.
+
+        Returns:
+            int: The as_of_transaction_id of the new snapshot, or None if no snapshot was taken.
+        """
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql(
+                f"SELECT balance FROM accounts WHERE account_id = %s{self.dao.for_update}"
+            ), (account_id,))
+            cursor.fetchall()
+            snapshot_id, balance = self._last_snapshot(cursor, account_id)
+            delta, last_id, count = self._delta(cursor, account_id, snapshot_id)
+            if count == 0 or (count < self.cadence and not force):
+                return None
+            cursor.execute(self.dao.sql(
+                "INSERT INTO balance_snapshots (account_id, as_of_transaction_id, balance) VALUES (%s, %s, %s)"
+            ), (account_id, last_id, balance + delta))
+            return last_id
+
+    def due_accounts(self):
+        """
+        Returns:
+            list: The account_id of the accounts with at least `cadence` transactions since their last snapshot.
+        """
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql(
+                "SELECT t.account_id FROM transactions t "
+                "LEFT JOIN (SELECT account_id, MAX(as_of_transaction_id) AS as_of_transaction_id "
+                "FROM balance_snapshots GROUP BY account_id) s ON s.account_id = t.account_id "
+                "WHERE t.transaction_id > COALESCE(s.as_of_transaction_id, 0) "
+                "GROUP BY t.account_id HAVING COUNT(*) >= %s"
+            ), (self.cadence,))
+            return [row[0] for row in cursor.fetchall()]
+
+    def accounts_before(self, end_date):
+        """
+        Returns:
+            list: The account_id of the accounts with transactions made before end_date that their
+                last snapshot does not cover.
+        """
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql(
+                "SELECT DISTINCT t.account_id FROM transactions t "
+                "LEFT JOIN (SELECT account_id, MAX(as_of_transaction_id) AS as_of_transaction_id "
+                "FROM balance_snapshots GROUP BY account_id) s ON s.account_id = t.account_id "
+                "WHERE t.transaction_date < %s AND t.transaction_id > COALESCE(s.as_of_transaction_id, 0)"
+            ), (end_date,))
+            return [row[0] for row in cursor.fetchall()]
+
+    def cover_before(self, end_date):
+        """
+        Takes a snapshot of every account with transactions made before end_date that its last
+        snapshot does not cover. Called before the partitions older than end_date are dropped.
+
+        Returns:
+            int: The number of snapshots taken.
+        """
+        return sum(1 for account_id in self.accounts_before(end_date) if self.take_snapshot(account_id, force=True) is not None)
+
+    def take_snapshots(self):
+        """
+        Takes a snapshot of every account that is due.
+
+        Returns:
+            int: The number of snapshots taken.
+        """
+        return sum(1 for account_id in self.due_accounts() if self.take_snapshot(account_id) is not None)
+
+    def start(self, interval):
+        """
+        Takes the snapshots every interval seconds in a background thread.
+
+        Returns:
+            threading.Event: Set it to stop the thread.
+        """
+        stop = threading.Event()
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.take_snapshots()
+                except Exception as e:
+                    print(f"Error: {e}")
+        threading.Thread(target=loop, daemon=True).start()
+        return stop
+
+    def audit(self, account_id):
+        """
+        Compares the balance stored in accounts with the balance computed from the transactions.
+
+        Returns:
+            tuple: (stored balance, computed balance)
+
+        Raises:
+            LedgerError: If the account does not exist.
+        """
+        return self.dao.get_balance(account_id), self.balance_as_of(account_id)
+
+    def ud_balance_as_of(self, ud_account_id, period=None):
+        """
+        Returns the dividends credited to a ud_account up to a period (see dividend.py).
+        The dividends are one ud_dividends row per period, so they are summed without snapshots.
+
+        Args:
+            ud_account_id (int): The ud_account.
+            period (str): The last period counted, or None for all of them.
+        """
+        query = "SELECT COALESCE(SUM(amount), 0) FROM ud_dividends WHERE ud_account_id = %s"
+        params = [ud_account_id]
+        if period is not None:
+            query += " AND period <= %s"
+            params.append(period)
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql(query), params)
+            return self.dao.money(cursor.fetchone()[0])
+
+    def audit_ud(self, ud_account_id):
+        """
+        Compares the balance stored in ud_account with the dividends credited to it.
+
+        Returns:
+            tuple: (stored balance, computed balance)
+
+        Raises:
+            LedgerError: If the ud_account does not exist.
+        """
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql("SELECT balance FROM ud_account WHERE ud_account_id = %s"), (ud_account_id,))
+            row = cursor.fetchone()
+        if row is None:
+            raise LedgerError(f"UD account {ud_account_id} not found.")
+        return row[0], self.ud_balance_as_of(ud_account_id)
@@ -0,0 +1,138 @@
+#Benchmarks of the storage backends (storage_backend.py) on the same LedgerDAO operations
+#
+#SQLite always runs; MySQL runs when the server of DB_CONFIG in mysql_connection.py is reachable
+#to run the benchmarks use:
+#python3 benchmark_backends.py
+
+import datetime
+import os
+import random
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from storage_backend import MySQLBackend, SQLiteBackend
+from bulk_loader import bulk_insert_transactions
+from ledger_dao import LedgerError
+from balance_snapshots import BalanceSnapshots
+
+# share of deposits, withdrawals and transfers of each mix
+MIXES = {
+    'deposits': (1, 0, 0),
+    'withdrawals': (0, 1, 0),
+    'transfers': (0, 0, 1),
+    'mixed 40/30/30': (0.4, 0.3, 0.3),
+}
+
+# amounts of the operations, with cents: the audit checks that no cent is lost on any backend
+AMOUNTS = [Decimal('0.10'), Decimal('0.07'), Decimal('1.01'), 1]
+
+def report(label, count, elapsed):
+    print(f'{label:<50} {count/elapsed:10.0f} ops/s')
+
+def create_accounts(dao, count, balance):
+    name = uuid.uuid4().hex[:8]
+    user_id = dao.create_user(name, 'benchmark', f'{name}@example.com')
+    account_ids = [dao.create_account(user_id, f'B{name}{i}') for i in range(count)]
+    for account_id in account_ids:
+        dao.deposit(account_id, balance)
+    return account_ids
+
+def make_operation(dao, account_ids, mix):
+    deposits, withdrawals, _ = mix
+    def operation(_):
+        draw = random.random()
+        try:
+            if draw < deposits:
+                dao.deposit(random.choice(account_ids), random.choice(AMOUNTS))
+            elif draw < deposits + withdrawals:
+                dao.withdraw(random.choice(account_ids), random.choice(AMOUNTS))
+            else:
+                from_account, to_account = random.sample(account_ids, 2)
+                dao.transfer(from_account, to_account, random.choice(AMOUNTS))
+        except LedgerError:
+            pass
+    return operation
+
+def run_mix(dao, account_ids, mix, count, threads):
+    operation = make_operation(dao, account_ids, mix)
+    start = time.perf_counter()
+    if threads == 1:
+        for i in range(count):
+            operation(i)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(operation, range(count)))
+    return time.perf_counter() - start
+
+def bench_backend(name, backend, count=5000, accounts=20, threads=(1, 8)):
+    print(f'{name}: {count} operations on {accounts} accounts')
+    backend.create_schema()
+    dao = backend.dao()
+    account_ids = create_accounts(dao, accounts, 10 * count)
+
+    for label, mix in MIXES.items():
+        for workers in threads:
+            report(f'{name}: {label}, {workers} threads', count, run_mix(dao, account_ids, mix, count, workers))
+        if hasattr(backend, 'batch'):
+            start = time.perf_counter()
+            operation = make_operation(dao, account_ids, mix)
+            for first in range(0, count, 100):
+                with backend.batch():
+                    for i in range(first, min(first + 100, count)):
+                        operation(i)
+            report(f'{name}: {label}, batches of 100', count, time.perf_counter() - start)
+
+    # every balance is still the sum of the transactions of its account
+    snapshots = BalanceSnapshots(dao)
+    for account_id in account_ids:
+        stored, computed = snapshots.audit(account_id)
+        assert stored == computed, (account_id, stored, computed)
+    check_money(name, dao, snapshots)
+    check_dates(name, dao)
+    backend.close()
+
+def check_money(name, dao, snapshots):
+    """The amounts are exact Decimal and the dates datetime, whatever the backend."""
+    account_id = create_accounts(dao, 1, Decimal('0.10'))[0]
+    for _ in range(9):
+        dao.deposit(account_id, Decimal('0.10'))
+    assert dao.get_balance(account_id) == Decimal('1.00'), dao.get_balance(account_id)
+    dao.withdraw(account_id, Decimal('1.00'))
+    assert snapshots.audit(account_id) == (0, 0), snapshots.audit(account_id)
+    transaction = dao.get_transactions(account_id)[0]
+    assert isinstance(transaction['amount'], Decimal) and isinstance(transaction['transaction_date'], datetime.datetime), transaction
+    print(f'{name}: exact cents ok (10 deposits of 0.10, then a withdrawal of 1.00)')
+def check_dates(name, dao, rows=2000):
+    """The balance at a date is exact when the rows are loaded out of the order of their dates."""
+    account_id = create_accounts(dao, 1, 1)[0]
+    start = datetime.datetime(2024, 1, 1)
+    records = [(account_id, random.choice(['deposit', 'withdrawal']), random.choice(AMOUNTS),
+                start + datetime.timedelta(hours=random.randrange(24 * 365))) for _ in range(rows)]
+    bulk_insert_transactions(dao, records, batch_size=100)
+    snapshots = BalanceSnapshots(dao, cadence=100)
+    snapshots.take_snapshots()
+    for day in range(0, 365, 30):
+        date = start + datetime.timedelta(days=day)
+        expected = sum((-amount if kind == 'withdrawal' else amount) for _, kind, amount, made in records if made <= date)
+        assert snapshots.balance_as_of(account_id, date) == expected, (date, snapshots.balance_as_of(account_id, date), expected)
+    print(f'{name}: balances at a date ok ({rows} rows loaded out of date order)')
+
+def mysql_available():
+    from mysql_connection import create_connection
+    connection = create_connection()
+    if connection is None:
+        return False
+    connection.close()
+    return True
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+    bench_backend('sqlite', SQLiteBackend(os.path.join(directory, 'online_bank.db')))
+    if mysql_available():
+        bench_backend('mysql', MySQLBackend(pool_size=8))
+    else:
+        print('mysql: skipped (no server for DB_CONFIG)')
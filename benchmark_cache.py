@@ -0,0 +1,111 @@
+#Benchmarks of the read-through cache of ledger_cache.py, with checks of its results under concurrent writers
+#
+#runs on SQLite, and on MySQL when the server of DB_CONFIG in mysql_connection.py is reachable
+#to run the benchmarks use:
+#python3 benchmark_cache.py
+
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from storage_backend import MySQLBackend, SQLiteBackend
+from ledger_cache import CachedLedgerDAO
+from benchmark_backends import create_accounts, mysql_available
+
+def report(label, count, elapsed):
+    print(f'{label:<50} {count/elapsed:10.0f} reads/s')
+
+def hot_account(account_ids):
+    """80% of the reads on the first 2 accounts (the merchants), the others spread on the rest"""
+    if random.random() < 0.8:
+        return account_ids[random.randrange(2)]
+    return random.choice(account_ids)
+
+########################################################################
+#  HOT READS
+# ######################################################################
+
+def bench_hot_reads(name, dao, account_ids, count=20000, threads=8):
+    print(f'{name}: {count} balance reads, 80% of them on 2 merchant accounts')
+    cached = CachedLedgerDAO(dao, ttl=1.0, max_size=10)
+
+    for label, reader in (('no cache', dao), ('read-through cache', cached)):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda _: reader.get_balance(hot_account(account_ids)), range(count)))
+        report(f'{name}: {label}', count, time.perf_counter() - start)
+
+    # the merchants also receive deposits: each one invalidates their balance
+    start = time.perf_counter()
+    def read_or_write(i):
+        if i % 50 == 0:
+            cached.deposit(account_ids[i % 2], 1)
+        else:
+            cached.get_balance(hot_account(account_ids))
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(read_or_write, range(count)))
+    report(f'{name}: read-through cache, 2% deposits', count, time.perf_counter() - start)
+    stats = cached.cache.stats()
+    print(f'{name}: hit rate {stats["hit_rate"]:.1%}, {stats["evictions"]} evictions, {stats["invalidations"]} invalidations')
+
+########################################################################
+#  CONCURRENT WRITERS
+# ######################################################################
+
+def check_concurrent_writers(name, dao, account_ids, writes=2000, threads=8):
+    """
+    Writers deposit, withdraw and transfer through the cache while readers read through it:
+    a writer reads its own write, and no old balance stays in the cache at the end.
+    """
+    cached = CachedLedgerDAO(dao, ttl=60.0)
+    accounts = account_ids[:4]
+    deposit_only = account_ids[4:6]
+
+    def write(i):
+        if i % 4 == 0:
+            # only deposits on these accounts: a writer must see its deposit in the balance it reads next
+            account_id = deposit_only[i % 2]
+            before = cached.get_balance(account_id)
+            cached.deposit(account_id, 1)
+            after = cached.get_balance(account_id)
+            assert after >= before + 1, (account_id, before, after)
+            return
+        account_id = accounts[i % len(accounts)]
+        if i % 4 == 1:
+            cached.deposit(account_id, 1)
+        elif i % 4 == 2:
+            cached.withdraw(account_id, 1)
+        else:
+            cached.transfer(account_id, accounts[(i + 1) % len(accounts)], 1)
+
+    def read(_):
+        for account_id in accounts + deposit_only:
+            cached.get_balance(account_id)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(write, i) for i in range(writes)]
+        futures += [executor.submit(read, i) for i in range(writes)]
+        for future in futures:
+            future.result()
+
+    for account_id in accounts + deposit_only:
+        assert cached.get_balance(account_id) == dao.get_balance(account_id), account_id
+    print(f'{name}: concurrent writers ok ({cached.cache.stats()["hit_rate"]:.1%} hit rate)')
+
+def bench_backend(name, backend):
+    backend.create_schema()
+    dao = backend.dao()
+    account_ids = create_accounts(dao, 20, 100000)
+    bench_hot_reads(name, dao, account_ids)
+    check_concurrent_writers(name, dao, account_ids)
+    backend.close()
+
+
+if __name__ == "__main__":
+    bench_backend('sqlite', SQLiteBackend(os.path.join(tempfile.mkdtemp(), 'online_bank.db')))
+    if mysql_available():
+        bench_backend('mysql', MySQLBackend(pool_size=8))
+    else:
+        print('mysql: skipped (no server for DB_CONFIG)')
@@ -0,0 +1,102 @@
+#Benchmarks of the streaming statement export of statement_export.py
+#
+#each export runs in a new process, so its peak RSS is the memory of the export alone
+#runs on SQLite, and on MySQL (50M rows) when the server of DB_CONFIG in mysql_connection.py is reachable
+#to run the benchmarks use:
+#python3 benchmark_export.py
+
+import csv
+import datetime
+import gzip
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from storage_backend import MySQLBackend, SQLiteBackend
+from bulk_loader import bulk_insert_transactions
+from statement_export import export_transactions, iter_statement_lines, peak_rss_mb, STATEMENT_COLUMNS
+from transactions_archive import ARCHIVE_COLUMNS
+from benchmark_backends import create_accounts, mysql_available
+
+def open_backend(kind, path):
+    return SQLiteBackend(path) if kind == 'sqlite' else MySQLBackend(pool_size=1)
+
+def export_in_process(kind, path, output, buffered):
+    """run in a new process: the export, streamed or with every row fetched first (default buffered cursor)"""
+    backend = open_backend(kind, path)
+    dao = backend.dao()
+    if not buffered:
+        return export_transactions(dao, output)
+
+    start = time.perf_counter()
+    with dao.transaction() as cursor:
+        cursor.execute(f"SELECT {', '.join(STATEMENT_COLUMNS)} FROM transactions ORDER BY account_id, transaction_date, transaction_id")
+        rows = cursor.fetchall()
+    with open(output, 'w', newline='') as file:
+        file.writelines(iter_statement_lines(rows, 'csv'))
+    seconds = time.perf_counter() - start
+    return {'rows': len(rows), 'seconds': seconds, 'rows_per_second': len(rows) / seconds, 'peak_rss_mb': peak_rss_mb()}
+
+def seed(dao, rows, accounts=1000):
+    with dao.transaction() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM transactions")
+        existing = cursor.fetchone()[0]
+    if existing >= rows:
+        return
+    account_ids = create_accounts(dao, accounts, 1)
+    records = ((random.choice(account_ids), 'deposit', 1) for _ in range(rows - existing))
+    bulk_insert_transactions(dao, records, batch_size=10000, update_balances=False)
+
+def bench_backend(name, kind, path, rows, buffered_rows):
+    print(f'{name}: export of {rows} transactions')
+    backend = open_backend(kind, path)
+    backend.create_schema()
+    seed(backend.dao(), rows)
+    backend.close()
+
+    directory = tempfile.mkdtemp()
+    context = multiprocessing.get_context('spawn')
+    runs = [('streamed to csv.gz', False, 'statement.csv.gz'), ('streamed to jsonl.gz', False, 'statement.jsonl.gz')]
+    if buffered_rows >= rows:
+        runs.append(('fetchall then csv (buffered)', True, 'statement.csv'))
+    for label, buffered, output in runs:
+        with context.Pool(1) as pool:
+            report = pool.apply(export_in_process, (kind, path, os.path.join(directory, output), buffered))
+        os.remove(os.path.join(directory, output))
+        print(f'{name}: {label:<30} {report["rows_per_second"]:10.0f} rows/s, peak RSS {report["peak_rss_mb"]:.0f} MB')
+
+def check_archive(name, kind, path, rows=1000):
+    """The export of an account also streams its archived months, before its live rows."""
+    backend = open_backend(kind, path)
+    archive_dir = tempfile.mkdtemp()
+    dao = backend.dao(archive_dir=archive_dir)
+    account_id = create_accounts(dao, 1, 1)[0]   # and its live deposit
+    start = datetime.datetime(2000, 1, 1)
+    with gzip.open(os.path.join(archive_dir, 'transactions_200001_p200001.csv.gz'), 'wt', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(ARCHIVE_COLUMNS)
+        writer.writerows((i, account_id, None, 'deposit', '1.00', start + datetime.timedelta(minutes=i)) for i in range(1, rows + 1))
+
+    output = os.path.join(archive_dir, 'statement.csv')
+    assert export_transactions(dao, output, account_id=account_id)['rows'] == rows + 1
+    with open(output, newline='') as file:
+        ids = [int(row[0]) for row in list(csv.reader(file))[1:]]
+    assert ids[:rows] == list(range(1, rows + 1)), ids[:10]
+    report = export_transactions(dao, output, account_id=account_id, start_date=start + datetime.timedelta(minutes=11),
+                                 end_date=start + datetime.timedelta(minutes=21))
+    assert report['rows'] == 10, report
+    backend.close()
+    print(f'{name}: export of the archived months ok ({rows} archived rows)')
+
+
+if __name__ == "__main__":
+    sqlite_path = os.path.join(tempfile.mkdtemp(), 'online_bank.db')
+    bench_backend('sqlite', 'sqlite', sqlite_path, 2_000_000, 2_000_000)
+    check_archive('sqlite', 'sqlite', sqlite_path)
+    if mysql_available():
+        bench_backend('mysql', 'mysql', None, 50_000_000, 0)
+        check_archive('mysql', 'mysql', None)
+    else:
+        print('mysql: skipped (no server for DB_CONFIG)')
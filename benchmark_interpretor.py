@@ -0,0 +1,134 @@
+#Benchmarks of the simple interpretor of interpretor.py
+#
+#to run the benchmarks use:
+#python3 benchmark_interpretor.py
+
+import contextlib
+import io
+import os
+import time
+
+from interpretor import ExecutionLimitError, Interpretor, run_batch
+
+def time_it(label, func, repeat=5):
+    best=None
+    for _ in range(repeat):
+        start=time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):   # ev() prints the variables at the end
+            func()
+        elapsed=time.perf_counter()-start
+        if best is None or elapsed<best: best=elapsed
+    print(f'{label:<45} {best*1000:10.2f} ms')
+    return best
+
+def factorial_program(n, padding=0):
+    """
+    the factorial sample of interpretor.py, with n given
+    and 'padding' extra lines in the loop to make the loop longer
+    """
+    text=f"n = {n}  \n"
+    text=text+"r = 1  \n"
+    text=text+"while n 1 >= \n"
+    text=text+"r = r n * \n"
+    for _ in range(padding):
+        text=text+"p = n 1 + \n"
+    text=text+"n =  n 1 - \n"
+    text=text+"end \n"
+    return text
+
+########################################################################
+#  COMPILED PROGRAM
+# ######################################################################
+
+class LinearScanInterpretor(Interpretor):
+    """
+    Interpretor re-splitting each line at each visit and finding the 'end' / 'while' lines
+    by scanning the lines one by one, like before the compile step.
+    Only used as a reference point for the benchmark.
+    """
+
+    def ev(self,text):
+        self.vars={}
+        lines=[x for x in text.split("\n") if x.strip() != ""]
+        pc=0
+        while pc< len(lines):
+            line=lines[pc]
+            match line.split(maxsplit=1)[0]:
+                case 'while':
+                    if self.ev_expr_text(line.split(maxsplit=1)[1])==1: pc+=1
+                    else:
+                        while lines[pc].split(maxsplit=1)[0] != 'end' : pc +=1
+                        pc +=1
+                case 'end':
+                    while lines[pc].split(maxsplit=1)[0] != 'while': pc -=1
+                case _:
+                    (name,_,expr)=line.split(maxsplit=2)
+                    self.vars[name]=self.ev_expr_text(expr)
+                    pc+=1
+        print(self.vars)
+
+    def ev_expr_text(self,text):
+        toks=text.split()
+        stack=[]
+        for tok in toks:
+            if tok.isdigit(): stack.append(int(tok))
+            elif tok in self.vars: stack.append(self.vars[tok])
+            else:
+                rhs=stack.pop()
+                lhs=stack.pop()
+                if tok=="+":    stack.append(lhs+rhs)
+                elif tok=="-":    stack.append(lhs-rhs)
+                elif tok=="*":    stack.append(lhs*rhs)
+                elif tok=="<":    stack.append(1 if lhs < rhs else 0)
+                elif tok==">":    stack.append(1 if lhs > rhs else 0)
+                elif tok=="<=":   stack.append(1 if lhs <= rhs else 0)
+                elif tok==">=":   stack.append(1 if lhs >= rhs else 0)
+                elif tok=="==":   stack.append(1 if lhs == rhs else 0)
+        return(stack[0])
+
+def bench_compiled():
+    print('linear scan versus compiled program (jump table, pre-decoded lines) on the factorial sample')
+    for n,padding in ((1000,0),(1000,50)):
+        text=factorial_program(n,padding)
+        scan=time_it(f'linear scan   n={n} loop of {padding+3} lines', lambda: LinearScanInterpretor().ev(text))
+        compiled=time_it(f'compiled      n={n} loop of {padding+3} lines', lambda: Interpretor().ev(text))
+        print(f'{"speed-up":<45} {scan/compiled:10.1f} x')
+
+########################################################################
+#  BATCH MODE
+# ######################################################################
+
+def bench_batch(count=5000):
+    print(f'batch of {count} account programs on 1 to {os.cpu_count()} processes')
+    programs=[(f'account{i}', factorial_program(20+i%20, padding=10)) for i in range(count)]
+
+    sequential=time_it('sequential (one process, no pool)',
+                       lambda: [Interpretor().run(text) for _,text in programs], repeat=1)
+    cores=sorted({2**i for i in range(os.cpu_count().bit_length())} | {os.cpu_count()})
+    for workers in cores:
+        elapsed=time_it(f'run_batch max_workers={workers}', lambda: run_batch(programs, max_workers=workers), repeat=1)
+        print(f'{"speed-up":<45} {sequential/elapsed:10.1f} x')
+
+    # a runaway program and a broken one only stop themselves
+    results=run_batch(programs[:100]+[('runaway', 'n = 1\nwhile 1 1 ==\nn = n 1 +\nend\n'), ('broken', 'n = x 1 +\n')],
+                      max_workers=2, max_steps=10000)
+    assert isinstance(results['runaway'], ExecutionLimitError) and results['runaway'].reason=='steps', results['runaway']
+    assert isinstance(results['broken'], Exception)
+    assert all(isinstance(results[program_id], dict) for program_id,_ in programs[:100])
+
+########################################################################
+#  STEP BUDGET AND TIMEOUT
+# ######################################################################
+
+def bench_limits():
+    print('overhead of the step budget and timeout checks on the factorial sample')
+    text=factorial_program(1000, padding=10)
+    free=time_it('no limits', lambda: Interpretor().ev(text))
+    limited=time_it('max_steps and timeout', lambda: Interpretor().ev(text, max_steps=10**9, timeout=60))
+    print(f'{"overhead":<45} {(limited/free-1)*100:10.1f} %')
+
+
+if __name__ == "__main__":
+    bench_compiled()
+    bench_batch()
+    bench_limits()
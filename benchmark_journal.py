@@ -0,0 +1,114 @@
+#Benchmarks of the write-ahead journal of ledger_journal.py, with a check of its crash recovery
+#
+#runs on SQLite, and on MySQL when the server of DB_CONFIG in mysql_connection.py is reachable
+#to run the benchmarks use:
+#python3 benchmark_journal.py
+
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from storage_backend import MySQLBackend, SQLiteBackend
+from ledger_dao import LedgerError
+from ledger_journal import LedgerJournal
+from benchmark_backends import create_accounts, mysql_available
+
+def report(label, count, elapsed):
+    print(f'{label:<50} {count/elapsed:10.0f} acknowledged tx/s')
+
+def run_deposits(deposit, account_ids, count, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda i: deposit(account_ids[i % len(account_ids)], 1), range(count)))
+    return time.perf_counter() - start
+
+########################################################################
+#  ACKNOWLEDGED DEPOSITS
+# ######################################################################
+
+def bench_journal(name, dao, account_ids, directory, count=20000, threads=(1, 16, 64)):
+    print(f'{name}: {count} deposits committed one by one and through the journal')
+    for workers in threads:
+        report(f'{name}: LedgerDAO.deposit, {workers} threads', count, run_deposits(dao.deposit, account_ids, count, workers))
+
+    for workers in threads:
+        journal = LedgerJournal(dao, os.path.join(directory, f'{name}-{workers}.journal'))
+        elapsed = run_deposits(journal.deposit, account_ids, count, workers)
+        report(f'{name}: LedgerJournal.deposit, {workers} threads', count, elapsed)
+        start = time.perf_counter()
+        journal.close()
+        print(f'{name}: applied to the tables {time.perf_counter() - start:.2f} s after the last acknowledgment')
+
+########################################################################
+#  CRASH RECOVERY
+# ######################################################################
+
+def check_recovery(name, dao, account_ids, directory, count=1000):
+    """Deposits acknowledged by a journal that never applies them are applied by the next journal on the file."""
+    account_id = account_ids[0]
+    before = dao.get_balance(account_id)
+    path = os.path.join(directory, f'{name}-crash.journal')
+
+    crashed = LedgerJournal(dao, path, apply_interval=3600)
+    time.sleep(0.1)   # the applier has started its first (empty) round and sleeps
+    for _ in range(count):
+        crashed.deposit(account_id, 1)
+    with open(path, 'ab') as file:
+        file.write(b'{"seq": ')   # an entry cut by the crash, never acknowledged
+    assert dao.get_balance(account_id) == before
+
+    recovered = LedgerJournal(dao, path)
+    recovered.close()
+    assert dao.get_balance(account_id) == before + count, (dao.get_balance(account_id), before + count)
+    recovered = LedgerJournal(dao, path)   # nothing is applied twice
+    recovered.close()
+    assert dao.get_balance(account_id) == before + count
+    print(f'{name}: crash recovery ok ({count} entries replayed)')
+
+def check_rejection(name, dao, account_ids, directory, count=100):
+    """A deposit to an unknown account is refused; an entry the database refuses does not block the others."""
+    account_id = account_ids[0]
+    before = dao.get_balance(account_id)
+    path = os.path.join(directory, f'{name}-rejected.journal')
+
+    journal = LedgerJournal(dao, path)
+    try:
+        journal.deposit(-1, 1)
+        raise AssertionError("a deposit to an unknown account was acknowledged")
+    except LedgerError:
+        pass
+    journal.close()
+
+    # a journal holding an entry the database refuses, between acknowledged deposits
+    entries = [{'seq': seq, 'account_id': account_id, 'amount': '1', 'date': '2026-01-01 00:00:00'} for seq in range(1, count + 1)]
+    entries[count // 2]['account_id'] = -1
+    with open(path, 'wb') as file:
+        file.write(b''.join(json.dumps(entry).encode() + b'\n' for entry in entries))
+    recovered = LedgerJournal(dao, path)
+    recovered.close()
+    assert dao.get_balance(account_id) == before + count - 1, (dao.get_balance(account_id), before + count - 1)
+    assert recovered.rejected == 1 and recovered.apply_error is None
+    with open(recovered.rejected_path) as file:
+        assert json.loads(file.readline())['seq'] == entries[count // 2]['seq']
+    print(f'{name}: rejected entry ok (1 of {count} entries moved to {os.path.basename(recovered.rejected_path)})')
+
+def bench_backend(name, backend):
+    backend.create_schema()
+    dao = backend.dao()
+    account_ids = create_accounts(dao, 20, 1)
+    directory = tempfile.mkdtemp()
+    bench_journal(name, dao, account_ids, directory)
+    check_recovery(name, dao, account_ids, directory)
+    check_rejection(name, dao, account_ids, directory)
+    backend.close()
+
+
+if __name__ == "__main__":
+    # synchronous=FULL: a deposit committed one by one is as durable as a journaled one
+    bench_backend('sqlite', SQLiteBackend(os.path.join(tempfile.mkdtemp(), 'online_bank.db'), synchronous="FULL"))
+    if mysql_available():
+        bench_backend('mysql', MySQLBackend(pool_size=16))
+    else:
+        print('mysql: skipped (no server for DB_CONFIG)')
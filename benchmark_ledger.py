@@ -0,0 +1,334 @@
+#Benchmarks of the ledger (mysql_connection.py and ledger_dao.py)
+#
+#needs a local MySQL server with the credentials of DB_CONFIG in mysql_connection.py
+#to run the benchmarks use:
+#python3 benchmark_ledger.py
+
+import asyncio
+import contextlib
+import csv
+import datetime
+import io
+import os
+import random
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+from mysql_connection import (
+    DB_CONFIG, create_connection, create_database, create_tables, close_connection,
+    create_connection_pool, get_pooled_connection, migrate_tables, schema_object_exists, MIGRATIONS
+)
+from ledger_dao import LedgerDAO, rows_as_dicts
+from bulk_loader import bulk_insert_transactions, load_transactions_infile
+from balance_snapshots import BalanceSnapshots
+from transactions_archive import list_partitions
+from dividend import DividendEngine
+from async_ledger import create_async_ledger
+
+def report(label, count, elapsed):
+    print(f'{label:<45} {count/elapsed:10.0f} tx/s')
+
+def setup_schema():
+    connection = create_connection()
+    create_database(connection)
+    create_tables(connection)
+    close_connection(connection)
+
+def create_test_account(dao):
+    name = uuid.uuid4().hex[:12]
+    user_id = dao.create_user(name, 'benchmark', f'{name}@example.com')
+    return dao.create_account(user_id, f'ACC{name}')
+
+def run_deposits(dao, account_id, count, threads):
+    start = time.perf_counter()
+    if threads == 1:
+        for _ in range(count):
+            dao.deposit(account_id, 1)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda _: dao.deposit(account_id, 1), range(count)))
+    return time.perf_counter() - start
+
+########################################################################
+#  CONNECTION POOL
+# ######################################################################
+
+def bench_pool(count=1000, threads=8):
+    print(f'{count} deposits with and without the connection pool')
+    pool = create_connection_pool(pool_size=threads)
+    pooled_dao = LedgerDAO(lambda: get_pooled_connection(pool))
+    unpooled_dao = LedgerDAO(lambda: create_connection('online_bank'))
+    account_id = create_test_account(pooled_dao)
+
+    for workers in (1, threads):
+        report(f'new connection per transaction, {workers} threads', count, run_deposits(unpooled_dao, account_id, count, workers))
+        report(f'pool of {threads} connections, {workers} threads', count, run_deposits(pooled_dao, account_id, count, workers))
+
+########################################################################
+#  BULK LOADER
+# ######################################################################
+
+def bench_bulk(count=100000, batch_sizes=(100, 1000, 10000)):
+    print(f'{count} deposits loaded row by row and by batches')
+    pool = create_connection_pool(pool_size=2)
+    dao = LedgerDAO(lambda: get_pooled_connection(pool))
+    account_id = create_test_account(dao)
+
+    single = min(count, 2000)
+    report('row by row (LedgerDAO.deposit)', single, run_deposits(dao, account_id, single, 1))
+
+    for batch_size in batch_sizes:
+        records = ((account_id, 'deposit', 1) for _ in range(count))
+        with contextlib.redirect_stdout(io.StringIO()):
+            load = bulk_insert_transactions(dao, records, batch_size=batch_size)
+        report(f'bulk_insert_transactions batch_size={batch_size}', load['rows'], load['seconds'])
+
+    # half of the rows with a date, half without (loaded at CURRENT_TIMESTAMP), in a new account to check the dates
+    infile_account_id = create_test_account(dao)
+    dated = datetime.datetime(2024, 1, 31, 12, 30, 45)
+    path = os.path.join(tempfile.mkdtemp(), 'deposits.csv')
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)   # lines ended by \r\n
+        writer.writerow(['account_id', 'transaction_type', 'amount', 'transaction_date'])
+        for i in range(count):
+            writer.writerow([infile_account_id, 'deposit', 1, dated.isoformat(' ') if i % 2 else ''])
+    connection = mysql.connector.connect(**DB_CONFIG, database='online_bank', allow_local_infile=True)
+    try:
+        loaded_at = datetime.datetime.now().replace(microsecond=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            load = load_transactions_infile(connection, path)
+        report('LOAD DATA LOCAL INFILE', load['rows'], load['seconds'])
+        with dao.transaction() as cursor:
+            cursor.execute(
+                "SELECT SUM(transaction_date = %s), SUM(transaction_date >= %s) FROM transactions WHERE account_id = %s",
+                (dated, loaded_at, infile_account_id))
+            with_date, without_date = cursor.fetchone()
+        assert (with_date, without_date) == (count // 2, count - count // 2), (with_date, without_date)   # dates round-trip
+    except mysql.connector.Error as e:
+        print(f"LOAD DATA LOCAL INFILE skipped: {e}")
+    finally:
+        connection.close()
+        os.remove(path)
+
+########################################################################
+#  TRANSFERS
+# ######################################################################
+
+def bench_transfers(count=2000, accounts=10, threads=(1, 4, 16)):
+    print(f'{count} transfers between {accounts} accounts on several threads')
+    pool = create_connection_pool(pool_size=max(threads))
+    dao = LedgerDAO(lambda: get_pooled_connection(pool))
+    account_ids = [create_test_account(dao) for _ in range(accounts)]
+    for account_id in account_ids:
+        dao.deposit(account_id, 10 * count)
+    total = sum(dao.get_balance(account_id) for account_id in account_ids)
+
+    for workers in threads:
+        pairs = [random.sample(account_ids, 2) for _ in range(count)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda pair: dao.transfer(pair[0], pair[1], 1), pairs))
+        report(f'transfer, {workers} threads', count, time.perf_counter() - start)
+
+    assert sum(dao.get_balance(account_id) for account_id in account_ids) == total
+
+########################################################################
+#  INDEXES
+# ######################################################################
+
+def seed_transactions(dao, account_ids, rows, days=730):
+    """rows random transactions spread over the last days days, a third of them transfers"""
+    now = datetime.datetime.now()
+    def records():
+        for _ in range(rows):
+            account_id = random.choice(account_ids)
+            date = now - datetime.timedelta(seconds=random.randrange(days * 86400))
+            transaction_type = random.choice(('deposit', 'withdrawal', 'transfer'))
+            counterparty = random.choice(account_ids) if transaction_type == 'transfer' else None
+            yield (account_id, transaction_type, 1, date, counterparty)
+    bulk_insert_transactions(dao, records(), batch_size=10000, update_balances=False)
+
+def time_queries(label, query, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        query()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<45} {elapsed / count * 1000:10.2f} ms/query')
+
+def bench_indexes(rows=10_000_000, accounts=1000, queries=50):
+    print(f'statement queries on {rows} transactions without and with the indexes of migrate_tables')
+    pool = create_connection_pool(pool_size=2)
+    dao = LedgerDAO(lambda: get_pooled_connection(pool))
+
+    with dao.transaction() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM transactions")
+        existing = cursor.fetchone()[0]
+        cursor.execute("SELECT account_id FROM accounts")
+        account_ids = [row[0] for row in cursor.fetchall()]
+    if existing < rows:
+        account_ids += [create_test_account(dao) for _ in range(max(0, accounts - len(account_ids)))]
+        seed_transactions(dao, account_ids, rows - existing)
+
+    end_date = datetime.datetime.now()
+    start_date = end_date - datetime.timedelta(days=30)
+    def statement():
+        dao.get_transactions(random.choice(account_ids), start_date, end_date)
+    def transfers():
+        dao.get_transfers_between(random.choice(account_ids), random.choice(account_ids))
+
+    # the foreign key of transactions.account_id needs an index starting with account_id: InnoDB dropped
+    # its own one when the composite indexes were created, so the plain index of the schema before the
+    # migrations is created again first (error 1553 otherwise), and it is the baseline of the benchmark
+    with dao.transaction() as cursor:
+        if not schema_object_exists(cursor, 'index', 'transactions', 'idx_transactions_account'):
+            cursor.execute("CREATE INDEX idx_transactions_account ON transactions (account_id)")
+        for kind, table, name, _ in MIGRATIONS:
+            if kind == 'index' and schema_object_exists(cursor, kind, table, name):
+                cursor.execute(f"DROP INDEX {name} ON {table}")
+    time_queries('before: statement of 30 days', statement, queries)
+    time_queries('before: transfers between two accounts', transfers, queries)
+
+    connection = create_connection()
+    migrate_tables(connection)
+    close_connection(connection)
+    with dao.transaction() as cursor:
+        cursor.execute("DROP INDEX idx_transactions_account ON transactions")   # the composite indexes serve the foreign key
+    time_queries('after: statement of 30 days', statement, queries)
+    time_queries('after: transfers between two accounts', transfers, queries)
+
+########################################################################
+#  BALANCE SNAPSHOTS
+# ######################################################################
+
+def bench_snapshots(rows=1_000_000, cadence=1000, queries=50):
+    print(f'balance as of a transaction of an account of {rows} transactions, without and with snapshots')
+    pool = create_connection_pool(pool_size=2)
+    dao = LedgerDAO(lambda: get_pooled_connection(pool))
+    account_id = create_test_account(dao)
+    with contextlib.redirect_stdout(io.StringIO()):
+        bulk_insert_transactions(dao, ((account_id, random.choice(('deposit', 'withdrawal')), 1) for _ in range(rows)),
+                                 batch_size=10000)
+    transaction_ids = [row['transaction_id'] for row in dao.get_transactions(account_id)]
+
+    full_history = BalanceSnapshots(dao, cadence=rows + 1)
+    snapshots = BalanceSnapshots(dao, cadence=cadence)
+    time_queries('whole history', lambda: full_history.balance_as_of(account_id, random.choice(transaction_ids)), queries)
+    # snapshots every `cadence` transactions, as a periodic job would have taken them
+    for transaction_id in transaction_ids[cadence - 1::cadence]:
+        with dao.transaction() as cursor:
+            cursor.execute("INSERT INTO balance_snapshots (account_id, as_of_transaction_id, balance) VALUES (%s, %s, %s)",
+                           (account_id, transaction_id, snapshots.balance_as_of(account_id, transaction_id)))
+    time_queries(f'snapshot every {cadence} transactions', lambda: snapshots.balance_as_of(account_id, random.choice(transaction_ids)), queries)
+
+########################################################################
+#  PARTITIONS
+# ######################################################################
+
+def bench_partitions(queries=50):
+    print('recent history on the partitioned transactions table (create_tables(connection, partitioned=True))')
+    pool = create_connection_pool(pool_size=2)
+    dao = LedgerDAO(lambda: get_pooled_connection(pool))
+    with dao.transaction() as cursor:
+        if not list_partitions(cursor):
+            print('skipped: the transactions table is not partitioned')
+            return
+        cursor.execute("SELECT account_id FROM accounts")
+        account_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT COUNT(*) FROM transactions")
+        rows = cursor.fetchone()[0]
+
+    end_date = datetime.datetime.now()
+    start_date = end_date - datetime.timedelta(days=7)
+    with dao.transaction() as cursor:
+        cursor.execute("EXPLAIN SELECT * FROM transactions WHERE account_id = %s AND transaction_date >= %s",
+                       (account_ids[0], start_date))
+        explain = rows_as_dicts(cursor)[0]
+    print(f"partitions read by a 7 days statement: {explain['partitions']}")
+    time_queries(f'statement of 7 days ({rows} transactions)',
+                 lambda: dao.get_transactions(random.choice(account_ids), start_date, end_date), queries)
+
+########################################################################
+#  UNIVERSAL DIVIDEND
+# ######################################################################
+
+def seed_members(dao, members, batch_size=10000):
+    """users with a ud_account up to members members"""
+    with dao.transaction() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM ud_account")
+        existing = cursor.fetchone()[0]
+    prefix = uuid.uuid4().hex[:8]
+    for start in range(existing, members, batch_size):
+        names = [f'{prefix}{i}' for i in range(start, min(start + batch_size, members))]
+        with dao.transaction() as cursor:
+            cursor.executemany("INSERT INTO users (username, password, email) VALUES (%s, %s, %s)",
+                               [(name, 'benchmark', f'{name}@example.com') for name in names])
+    with dao.transaction() as cursor:
+        cursor.execute("INSERT INTO ud_account (user_id, account_number) "
+                       "SELECT u.user_id, CONCAT('UD', u.user_id) FROM users u "
+                       "LEFT JOIN ud_account d ON d.user_id = u.user_id WHERE d.user_id IS NULL")
+
+def bench_dividend(members=1_000_000, loop_sample=10000):
+    print(f'universal dividend credited to {members} members')
+    pool = create_connection_pool(pool_size=2)
+    dao = LedgerDAO(lambda: get_pooled_connection(pool))
+    seed_members(dao, members)
+
+    # per-member loop, like a python loop over the users would do it, on a sample
+    start = time.perf_counter()
+    with dao.transaction() as cursor:
+        cursor.execute("SELECT ud_account_id FROM ud_account LIMIT %s", (loop_sample,))
+        for (ud_account_id,) in cursor.fetchall():
+            cursor.execute("UPDATE ud_account SET balance = balance + 0 WHERE ud_account_id = %s", (ud_account_id,))
+    elapsed = time.perf_counter() - start
+    print(f'{"per-member loop (one UPDATE per member)":<45} {loop_sample / elapsed:10.0f} members/s')
+
+    for chunk_size in (1000, 10000, 100000):
+        engine = DividendEngine(dao, chunk_size=chunk_size)
+        with contextlib.redirect_stdout(io.StringIO()):
+            credit = engine.credit(f'bench-{uuid.uuid4().hex[:8]}')
+        print(f'{f"DividendEngine chunk_size={chunk_size}":<45} {credit["members_per_second"]:10.0f} members/s')
+
+########################################################################
+#  ASYNC LEDGER
+# ######################################################################
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def bench_async(reads=10000, pool_size=20):
+    print(f'{reads} concurrent balance reads through AsyncLedger (pool of {pool_size} connections)')
+    ledger = create_async_ledger(pool_size=pool_size)
+    account_id = create_test_account(ledger.dao)
+
+    async def read():
+        start = time.perf_counter()
+        await ledger.get_balance(account_id)
+        return time.perf_counter() - start
+
+    async def load():
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(read() for _ in range(reads)))
+        return latencies, time.perf_counter() - start
+
+    latencies, elapsed = asyncio.run(load())
+    ledger.close()
+    print(f'{"throughput":<45} {reads / elapsed:10.0f} reads/s')
+    print(f'{"latency p50":<45} {percentile(latencies, 0.50) * 1000:10.2f} ms')
+    print(f'{"latency p99":<45} {percentile(latencies, 0.99) * 1000:10.2f} ms')
+
+
+if __name__ == "__main__":
+    setup_schema()
+    bench_pool()
+    bench_bulk()
+    bench_transfers()
+    bench_indexes()
+    bench_snapshots()
+    bench_partitions()
+    bench_dividend()
+    bench_async()
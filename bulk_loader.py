@@ -0,0 +1,153 @@
+"""
+Bulk ingestion of transactions into the online_bank schema
+
+The records are read from any iterable (a list, a generator, a CSV file read line by line...)
+and written by batches: each batch is one executemany INSERT (mysql.connector sends it as a
+multi-row INSERT) and one commit, so the input is never loaded whole in memory.
+
+A record is (account_id, transaction_type, amount), optionally followed by transaction_date
+and counterparty_account_id (None for the default date / no counterparty).
+
+Example:
+    pool = create_connection_pool(pool_size=4)
+    dao = LedgerDAO(lambda: get_pooled_connection(pool))
+    report = bulk_insert_transactions(dao, read_transactions_csv("deposits.csv"), batch_size=5000)
+    print(report["rows_per_second"])
+"""
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from ledger_dao import to_money
+
+# Sign applied to the amount on the balance of the account; transfer rows carry the signed amount
+BALANCE_SIGNS = {'deposit': 1, 'withdrawal': -1, 'transfer': 1}
+
+def parse_amount(text, path, line):
+    try:
+        amount = Decimal(text.strip())
+    except InvalidOperation:
+        amount = None
+    if amount is None or not amount.is_finite() or amount.as_tuple().exponent < -2:
+        raise ValueError(f"{path}, line {line}: invalid amount {text!r} (a number with at most two decimals).")
+    return amount
+
+def read_transactions_csv(path):
+    """
+    Reads a CSV file of transactions line by line.
+    The file has a header line and the columns account_id, transaction_type, amount and optionally
+    transaction_date and counterparty_account_id.
+
+    Args:
+        path (str): The path of the CSV file.
+
+    Yields:
+        tuple: (account_id, transaction_type, amount as a Decimal, transaction_date or None, counterparty_account_id or None)
+
+    Raises:
+        ValueError: If an amount is not a number with at most two decimals.
+    """
+    with open(path, newline='') as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        for row in reader:
+            transaction_date = row[3] if len(row) > 3 and row[3] else None
+            counterparty_account_id = int(row[4]) if len(row) > 4 and row[4] else None
+            yield (int(row[0]), row[1], parse_amount(row[2], path, reader.line_num), transaction_date, counterparty_account_id)
+
+def bulk_insert_transactions(dao, records, batch_size=1000, update_balances=True):
+    """
+    Inserts transactions by batches of batch_size rows, with one commit per batch.
+
+    Args:
+        dao (LedgerDAO): The DAO giving the connections.
+        records: Iterable of (account_id, transaction_type, amount[, transaction_date[, counterparty_account_id]]).
+        batch_size (int): Number of rows inserted and committed at once.
+        update_balances (bool): Also applies the amounts to the balances of the accounts,
+            with one UPDATE per account and per batch.
+
+    Returns:
+        dict: rows, batches, seconds and rows_per_second of the load.
+    """
+    insert_query = dao.sql(
+        "INSERT INTO transactions (account_id, transaction_type, amount, transaction_date, counterparty_account_id) "
+        "VALUES (%s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP), %s)"
+    )
+    update_query = dao.sql("UPDATE accounts SET balance = balance + %s WHERE account_id = %s")
+
+    rows = 0
+    batches = 0
+    start = time.perf_counter()
+    iterator = iter(records)
+    while True:
+        batch = [(record[0], record[1], to_money(record[2]), *record[3:], *(None,) * (5 - len(record)))
+                 for record in islice(iterator, batch_size)]
+        if not batch:
+            break
+
+        with dao.transaction() as cursor:
+            # the accounts are locked before the rows are inserted (see balance_snapshots.py)
+            if update_balances:
+                deltas = {}
+                for account_id, transaction_type, amount, _, _ in batch:
+                    deltas[account_id] = deltas.get(account_id, 0) + BALANCE_SIGNS[transaction_type] * amount
+                cursor.executemany(update_query, [(delta, account_id) for account_id, delta in sorted(deltas.items())])
+            cursor.executemany(insert_query, batch)
+
+        rows += len(batch)
+        batches += 1
+
+    seconds = time.perf_counter() - start
+    report = {
+        'rows': rows,
+        'batches': batches,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds > 0 else 0.0,
+    }
+    print(f"Loaded {rows} transactions in {batches} batches ({report['rows_per_second']:.0f} rows/s)")
+    return report
+
+def load_transactions_infile(connection, path):
+    """
+    Loads a CSV file of transactions with LOAD DATA LOCAL INFILE (MySQL only).
+    The connection must be created with allow_local_infile=True and the server must have local_infile enabled.
+    The balances of the accounts are not updated.
+
+    Args:
+        connection: A MySQL connection to the online_bank database.
+        path (str): The CSV file (header line, then account_id, transaction_type, amount, transaction_date),
+            with CRLF line ends (the default of csv.writer) or LF line ends.
+
+    Returns:
+        dict: rows, seconds and rows_per_second of the load.
+    """
+    # csv.writer ends the lines with \r\n by default: the end of line of the header is used for the whole file,
+    # otherwise the \r stays at the end of transaction_date and gives invalid dates
+    with open(path, 'rb') as file:
+        line_terminator = '\\r\\n' if file.readline().endswith(b'\r\n') else '\\n'
+
+    start = time.perf_counter()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "LOAD DATA LOCAL INFILE %s INTO TABLE transactions "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+            f"LINES TERMINATED BY '{line_terminator}' IGNORE 1 LINES "
+            "(account_id, transaction_type, amount, @transaction_date) "
+            "SET transaction_date = COALESCE(NULLIF(@transaction_date, ''), CURRENT_TIMESTAMP)",
+            (path,)
+        )
+        rows = cursor.rowcount
+        connection.commit()
+    finally:
+        cursor.close()
+
+    seconds = time.perf_counter() - start
+    report = {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds > 0 else 0.0,
+    }
+    print(f"Loaded {rows} transactions from {path} ({report['rows_per_second']:.0f} rows/s)")
+    return report
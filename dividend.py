@@ -0,0 +1,150 @@
+"""
+Universal dividend of the online_bank schema
+
+At each period every member (every ud_account) is credited the same dividend:
+    dividend = growth_rate * money_supply / members
+where money_supply is the sum of the balances of the accounts and ud_accounts (initial_dividend
+when there is no money yet). The dividend is rounded down to the cent.
+
+The members are credited by chunks of ud_account_id: each chunk is one transaction that inserts
+the ud_dividends rows of the chunk with one INSERT ... SELECT, credits the balances with one UPDATE
+and moves credited_up_to in ud_periods. Running credit() again for a period (after a crash or twice
+by mistake) only credits the chunks that are not done yet, so each member gets the dividend once.
+
+The dividends are credited to the ud_account table, not to accounts, so they are not rows of the
+transactions table (whose account_id references accounts): ud_dividends is the history of the
+ud_accounts, one row per member and per period. The queries of the ud_accounts read it:
+LedgerDAO.get_ud_dividends (history), BalanceSnapshots.ud_balance_as_of and audit_ud (balance,
+without snapshots: one row per period) and statement_export.export_ud_dividends (statement).
+
+Example:
+    engine = DividendEngine(dao, growth_rate=Decimal("0.008"))
+    engine.credit("2024-01")
+"""
+import time
+from decimal import Decimal, ROUND_DOWN
+
+from ledger_dao import rows_as_dicts
+
+class DividendEngine:
+    """
+    Computes and credits the universal dividend.
+
+    Attributes:
+        dao (LedgerDAO): The DAO giving the connections.
+        growth_rate (Decimal): Part of the money supply created at each period.
+        initial_dividend (Decimal): Dividend of the periods without money supply.
+        chunk_size (int): Number of ud_account_id credited in one transaction.
+    """
+    def __init__(self, dao, growth_rate=Decimal("0.008"), initial_dividend=Decimal("10"), chunk_size=10000):
+        self.dao = dao
+        self.growth_rate = Decimal(growth_rate)
+        self.initial_dividend = Decimal(initial_dividend)
+        self.chunk_size = chunk_size
+
+    def compute_dividend(self, cursor):
+        """
+        Returns:
+            tuple: (dividend, members, money_supply, last_ud_account_id)
+        """
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(balance), 0), COALESCE(MAX(ud_account_id), 0) FROM ud_account")
+        members, ud_supply, last_ud_account_id = cursor.fetchone()
+        cursor.execute("SELECT COALESCE(SUM(balance), 0) FROM accounts")
+        money_supply = self.dao.money(ud_supply) + self.dao.money(cursor.fetchone()[0])
+        if members == 0:
+            return Decimal("0"), 0, money_supply, last_ud_account_id
+        if money_supply == 0:
+            return self.initial_dividend, members, money_supply, last_ud_account_id
+        dividend = (self.growth_rate * money_supply / members).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+        return dividend, members, money_supply, last_ud_account_id
+
+    def get_period(self, period):
+        """
+        Returns:
+            dict: The ud_periods row of the period, or None if it has not been started.
+        """
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql("SELECT * FROM ud_periods WHERE period = %s"), (period,))
+            rows = rows_as_dicts(cursor)
+        return rows[0] if rows else None
+
+    def start_period(self, period):
+        """
+        Computes the dividend of the period and records it in ud_periods (only the first time).
+
+        Returns:
+            dict: The ud_periods row of the period.
+        """
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql("SELECT 1 FROM ud_periods WHERE period = %s"), (period,))
+            if cursor.fetchone() is None:
+                dividend, members, money_supply, last_ud_account_id = self.compute_dividend(cursor)
+                cursor.execute(self.dao.sql(
+                    "INSERT INTO ud_periods (period, amount, members, money_supply, last_ud_account_id) "
+                    "VALUES (%s, %s, %s, %s, %s)"
+                ), (period, dividend, members, money_supply, last_ud_account_id))
+        return self.get_period(period)
+
+    def credit_chunk(self, period):
+        """
+        Credits the next chunk of members of the period.
+
+        Returns:
+            int: The number of members credited, or None when the period is complete.
+        """
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql(
+                "SELECT amount, last_ud_account_id, credited_up_to FROM ud_periods WHERE period = %s"
+                + self.dao.for_update
+            ), (period,))
+            amount, last_ud_account_id, credited_up_to = cursor.fetchone()
+            if credited_up_to >= last_ud_account_id:
+                cursor.execute(self.dao.sql(
+                    "UPDATE ud_periods SET completed_at = CURRENT_TIMESTAMP WHERE period = %s AND completed_at IS NULL"
+                ), (period,))
+                return None
+
+            low = credited_up_to + 1
+            high = min(credited_up_to + self.chunk_size, last_ud_account_id)
+            cursor.execute(self.dao.sql(
+                "INSERT INTO ud_dividends (period, ud_account_id, amount) "
+                "SELECT %s, ud_account_id, %s FROM ud_account WHERE ud_account_id BETWEEN %s AND %s"
+            ), (period, amount, low, high))
+            credited = cursor.rowcount
+            cursor.execute(self.dao.sql(
+                "UPDATE ud_account SET balance = balance + %s WHERE ud_account_id BETWEEN %s AND %s"
+            ), (amount, low, high))
+            cursor.execute(self.dao.sql(
+                "UPDATE ud_periods SET credited_up_to = %s WHERE period = %s"
+            ), (high, period))
+            return credited
+
+    def credit(self, period):
+        """
+        Credits the dividend of the period to every member that has not received it yet.
+
+        Returns:
+            dict: period, amount, members credited, chunks, seconds and members_per_second.
+        """
+        start = time.perf_counter()
+        row = self.start_period(period)
+        members = 0
+        chunks = 0
+        while True:
+            credited = self.credit_chunk(period)
+            if credited is None:
+                break
+            members += credited
+            chunks += 1
+
+        seconds = time.perf_counter() - start
+        report = {
+            'period': period,
+            'amount': row['amount'],
+            'members': members,
+            'chunks': chunks,
+            'seconds': seconds,
+            'members_per_second': members / seconds if seconds > 0 else 0.0,
+        }
+        print(f"Dividend {period}: {row['amount']} credited to {members} members in {chunks} chunks")
+        return report
@@ -2,70 +2,174 @@
 
 # inspiring from https://www.youtube.com/watch?v=Q2UDHY5as90
 #
+import operator
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# operators of the postfix expressions: they pop rhs then lhs and push the result
+OPERATORS={
+    "+":  operator.add,
+    "-":  operator.sub,
+    "*":  operator.mul,
+    "<":  lambda lhs,rhs: 1 if lhs < rhs else 0,
+    ">":  lambda lhs,rhs: 1 if lhs > rhs else 0,
+    "<=": lambda lhs,rhs: 1 if lhs <= rhs else 0,
+    ">=": lambda lhs,rhs: 1 if lhs >= rhs else 0,
+    "==": lambda lhs,rhs: 1 if lhs == rhs else 0,
+}
+
+# kinds of the pre-decoded tokens of a postfix expression
+CONST=0
+VAR=1
+OP=2
+
+class ExecutionLimitError(Exception):
+    """
+    raised when a program runs more steps than its budget or goes past its deadline
+    reason: 'steps' or 'timeout'
+    line: number of the (non empty) line reached, text: the text of this line
+    steps: number of steps counted when the program was stopped
+    all the arguments go to Exception, so the error can be pickled back from a worker process of run_batch
+    """
+    def __init__(self,reason,line,text,steps):
+        super().__init__(reason,line,text,steps)
+        self.reason=reason
+        self.line=line
+        self.text=text
+        self.steps=steps
+
+    def __str__(self):
+        return f"{self.reason} limit exceeded after {self.steps} steps at line {self.line}: {self.text.strip()}"
+
 class Interpretor():
-    def ev(self,text):
+    def ev(self,text,max_steps=None,timeout=None):
+        print(self.run(text,max_steps,timeout))
+
+    def run(self,text,max_steps=None,timeout=None):
+        """
+        run the program and return its variables
+        max_steps: maximum number of instructions executed by the loops
+        timeout: maximum duration of the program in seconds
+        the limits are only checked when an 'end' jumps back to its 'while' (the only way to run forever),
+        the steps of a loop iteration are the lines between its 'while' and its 'end'
+        """
         self.vars={}
-        lines=[x for x in text.split("\n") if x.strip() != ""]
-#        print(lines)
+        program=self.compile(text)
+        steps=0
+        if max_steps is None: max_steps=float('inf')
+        deadline=time.monotonic()+timeout if timeout else None
+#        print(program)
         pc=0
-        while pc< len(lines):
-            line=lines[pc]
-  #          print("line:  ",line)
-            match line.split(maxsplit=1)[0]:
+        while pc< len(program):
+            opcode,name,expr,jump=program[pc]
+            match opcode:
                 case 'while':
-              #      print("res:",self.ev_expr(line.split(maxsplit=1)[1]))
-                    if self.ev_expr(line.split(maxsplit=1)[1])==1: pc+=1
-                    else:
-                        while lines[pc].split(maxsplit=1)[0] != 'end' : pc +=1
-                        pc +=1
+                    if self.run_expr(expr)==1: pc+=1
+                    else: pc=jump+1
                 case 'end':
-                    while lines[pc].split(maxsplit=1)[0] != 'while': pc -=1
+                    steps+=pc-jump+1
+                    if steps>max_steps:
+                        raise ExecutionLimitError('steps',pc+1,self.lines[pc],steps)
+                    if deadline and time.monotonic()>deadline:
+                        raise ExecutionLimitError('timeout',pc+1,self.lines[pc],steps)
+                    pc=jump
                 case _:
-                    (name,_,expr)=line.split(maxsplit=2)
- #                   print("actions   name:",name,"   expr:", expr, "\n")
-                    self.vars[name]=self.ev_expr(expr)
+                    self.vars[name]=self.run_expr(expr)
                     pc+=1
 #            print(self.vars)
 
-        print(self.vars)
-    def ev_expr(self,text):
-        toks=text.split()
+        return self.vars
+
+    def compile(self,text):
+        """
+        turn each line of the program once into an instruction (opcode, name, expr, jump):
+            opcode: 'while', 'end' or '=' for an assignment
+            name:   the assigned variable
+            expr:   the pre-decoded postfix expression (see compile_expr)
+            jump:   for 'while' the pc of its 'end', for 'end' the pc of its 'while' (loops can be nested)
+        """
+        lines=[x for x in text.split("\n") if x.strip() != ""]
+        self.lines=lines
+        program=[]
         stack=[]
-        for tok in toks:
-            if tok.isdigit(): stack.append(int(tok))
-            elif tok in self.vars: stack.append(self.vars[tok])
+        for pc,line in enumerate(lines):
+            words=line.split(maxsplit=1)
+            match words[0]:
+                case 'while':
+                    stack.append(pc)
+                    program.append(['while',None,self.compile_expr(words[1]),None])
+                case 'end':
+                    if not stack: raise Exception(f"'end' without 'while' at line {pc+1}")
+                    start=stack.pop()
+                    program[start][3]=pc
+                    program.append(['end',None,None,start])
+                case _:
+                    (name,_,expr)=line.split(maxsplit=2)
+                    program.append(['=',name,self.compile_expr(expr),None])
+        if stack: raise Exception(f"'while' without 'end' at line {stack[-1]+1}")
+        return [tuple(instruction) for instruction in program]
+
+    def compile_expr(self,text):
+        """
+        split the postfix expression once into (kind, value) tokens:
+        (CONST, int), (VAR, name) or (OP, operator function)
+        """
+        code=[]
+        for tok in text.split():
+            if tok.isdigit(): code.append((CONST,int(tok)))
+            elif tok in OPERATORS: code.append((OP,OPERATORS[tok]))
+            else: code.append((VAR,tok))
+        return code
+
+    def run_expr(self,code):
+        stack=[]
+        variables=self.vars
+        for kind,value in code:
+            if kind==CONST: stack.append(value)
+            elif kind==VAR:
+                if value not in variables: raise Exception(f"'{value}' is not defined")
+                stack.append(variables[value])
             else:
                 rhs=stack.pop()
                 lhs=stack.pop()
-#                print("var:",self.vars,"  rhs: ", rhs, "lhs:",lhs)
-
-                if tok=="+":    stack.append(lhs+rhs)
-                elif tok=="-":    stack.append(lhs-rhs)
-                elif tok=="*":    stack.append(lhs*rhs)
-                elif tok=="<":
-                    if lhs < rhs: stack.append(1)
-                    else: stack.append(0)
-                elif tok==">":
-                    if lhs > rhs: stack.append(1)
-                    else: stack.append(0)
-                elif tok=="<=":
-                    if lhs <= rhs: stack.append(1)
-                    else: stack.append(0)
-                elif tok==">=":
-                    if lhs >= rhs: stack.append(1)
-                    else: stack.append(0)
-                elif tok=="==":
-                    if lhs == rhs: stack.append(1)
-                    else: stack.append(0)
-
+                stack.append(value(lhs,rhs))
 
         return(stack[0])
 
-text="n = 13  \n"
-text=text+"r = 1  \n"
-text=text+"while n 1 >= \n"
-text=text+"r = r n * \n"
-text=text+"n =  n 1 - \n"
-text=text+"end \n"
+    def ev_expr(self,text):
+        return self.run_expr(self.compile_expr(text))
+
+def run_program(item,max_steps=None,timeout=None):
+    """
+    run one program of a batch
+    returns (id, variables of the program), or (id, exception) if the program failed or went past a limit,
+    so one program cannot stop the other programs of the batch
+    """
+    program_id,text=item
+    try:
+        return program_id, Interpretor().run(text,max_steps,timeout)
+    except Exception as e:
+        return program_id, e
+
+def run_batch(programs, max_workers=None, chunksize=64, max_steps=None, timeout=None):
+    """
+    run many programs in a pool of processes
+    programs: iterable of (id, program) pairs
+    max_workers: number of processes (default: number of cores)
+    chunksize: number of programs sent at once to a process
+    max_steps, timeout: limits of each program (see Interpretor.run)
+    returns a dict {id: variables of the program, or the exception that stopped it}
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(partial(run_program, max_steps=max_steps, timeout=timeout), programs, chunksize=chunksize))
+
+if __name__ == "__main__":
+    text="n = 13  \n"
+    text=text+"r = 1  \n"
+    text=text+"while n 1 >= \n"
+    text=text+"r = r n * \n"
+    text=text+"n =  n 1 - \n"
+    text=text+"end \n"
 
-Interpretor().ev(text)
+    Interpretor().ev(text)
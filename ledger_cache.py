@@ -0,0 +1,155 @@
+"""
+Read-through cache of the balances and user levels in front of a LedgerDAO
+
+    dao = CachedLedgerDAO(backend.dao(), ttl=5.0, max_size=10000)
+    dao.get_balance(account_id)         # read from the database, then from the cache for ttl seconds
+    dao.deposit(account_id, 100)        # invalidates the balance of the account
+    dao.cache.stats()                   # hits, misses, hit_rate...
+
+The deposits, withdrawals and transfers made through the CachedLedgerDAO invalidate the balances
+they change. The cache is in the process: a write made by another process, or with the DAO given to
+another module (bulk_loader, dividend...), is seen after at most ttl seconds unless invalidate_account
+or cache.clear() is called.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Dictionary whose entries expire after ttl seconds, with the least recently used entries
+    evicted beyond max_size entries. Thread safe.
+
+    A value loaded while the key is invalidated is not stored, so a read that started before
+    a write cannot put the old value back in the cache.
+    """
+    def __init__(self, ttl=5.0, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()   # key -> (expires_at, value), least recently used first
+        self.pending = {}              # key -> [loads in progress, generation]
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key, load):
+        """
+        Returns the value of key, calling load() to get it from the database when it is not cached.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            pending = self.pending.setdefault(key, [0, 0])
+            pending[0] += 1
+            generation = pending[1]
+
+        try:
+            value = load()
+        except Exception:
+            with self.lock:
+                self.finish_load(key)
+            raise
+
+        with self.lock:
+            if self.pending[key][1] == generation:
+                self.entries[key] = (time.monotonic() + self.ttl, value)
+                self.entries.move_to_end(key)
+                if len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+            self.finish_load(key)
+        return value
+
+    def finish_load(self, key):
+        pending = self.pending[key]
+        pending[0] -= 1
+        if pending[0] == 0:
+            del self.pending[key]
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+            if key in self.pending:
+                self.pending[key][1] += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            for pending in self.pending.values():
+                pending[1] += 1
+
+    def stats(self):
+        """
+        Returns:
+            dict: size, hits, misses, hit_rate, evictions, expirations and invalidations.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+class CachedLedgerDAO:
+    """
+    LedgerDAO whose get_balance and get_user_level are cached.
+    The other operations are the ones of the wrapped DAO.
+
+    Attributes:
+        dao (LedgerDAO): The wrapped DAO.
+        cache (TTLCache): The cache of the balances and levels.
+    """
+    def __init__(self, dao, ttl=5.0, max_size=10000):
+        self.dao = dao
+        self.cache = TTLCache(ttl, max_size)
+
+    def __getattr__(self, name):
+        return getattr(self.dao, name)
+
+    def get_balance(self, account_id):
+        return self.cache.get_or_load(('balance', account_id), lambda: self.dao.get_balance(account_id))
+
+    def get_user_level(self, user_id):
+        return self.cache.get_or_load(('level', user_id), lambda: self.dao.get_user_level(user_id))
+
+    def invalidate_account(self, account_id):
+        self.cache.invalidate(('balance', account_id))
+
+    def invalidate_user(self, user_id):
+        """To call after changing the level of a user outside of this DAO."""
+        self.cache.invalidate(('level', user_id))
+
+    def deposit(self, account_id, amount):
+        try:
+            return self.dao.deposit(account_id, amount)
+        finally:
+            self.invalidate_account(account_id)
+
+    def withdraw(self, account_id, amount):
+        try:
+            return self.dao.withdraw(account_id, amount)
+        finally:
+            self.invalidate_account(account_id)
+
+    def transfer(self, from_account, to_account, amount):
+        try:
+            return self.dao.transfer(from_account, to_account, amount)
+        finally:
+            self.invalidate_account(from_account)
+            self.invalidate_account(to_account)
@@ -0,0 +1,404 @@
+"""
+Data access layer for the online_bank schema created by mysql_connection.py
+
+LedgerDAO gives the operations on the users, accounts, ud_account and transactions tables.
+It takes a function giving a connection (for example a connection of a pool of mysql_connection.py).
+Each operation gets a connection, runs in one transaction and closes the connection,
+which gives it back to the pool.
+
+The queries only use SQL understood by MySQL and SQLite, so the same DAO can run on a
+sqlite3 connection (with placeholder="?" and lock_rows=False) for local tests.
+The amounts are Decimal on both: SQLiteBackend stores them as integer cents (money_in_cents=True),
+converted from and to Decimal by the sqlite3 adapters of storage_backend.py; the money computed
+by SQL (SUM, ...) is given back by dao.money().
+
+Example:
+    pool = create_connection_pool(pool_size=10)
+    dao = LedgerDAO(lambda: get_pooled_connection(pool))
+    user_id = dao.create_user("john_doe", "password123", "john@example.com", "Premium")
+    account_id = dao.create_account(user_id, "ACC123456789")
+    dao.deposit(account_id, 500)
+"""
+import random
+import time
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+
+from transactions_archive import read_archived_transactions
+
+# MySQL errors after which the whole transaction can be retried (deadlock, lock wait timeout)
+RETRYABLE_ERRNOS = (1213, 1205)
+
+class LedgerError(Exception):
+    """Raised when a ledger operation is refused (unknown account, invalid amount, insufficient funds)."""
+
+def is_retryable(error):
+    """Returns True if the transaction failed on a deadlock or a lock timeout and can be run again."""
+    if getattr(error, 'errno', None) in RETRYABLE_ERRNOS:
+        return True
+    return 'database is locked' in str(error)   # sqlite3
+
+def to_money(amount):
+    """
+    Returns an amount as a Decimal (a float through its shortest repr, so 0.1 stays 0.1).
+
+    Raises:
+        LedgerError: If the amount is not a finite number.
+    """
+    if isinstance(amount, Decimal):
+        money = amount
+    else:
+        try:
+            money = Decimal(str(amount))
+        except InvalidOperation:
+            raise LedgerError(f"Invalid amount {amount!r}.") from None
+    if not money.is_finite():
+        raise LedgerError(f"Invalid amount {amount!r}.")
+    return money
+
+def rows_as_dicts(cursor):
+    """
+    Returns the rows of the last query as dictionaries.
+
+    Args:
+        cursor: A cursor on which a SELECT has been executed.
+
+    Returns:
+        list: One dictionary {column: value} per row.
+    """
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+class LedgerDAO:
+    """
+    Operations on the online_bank schema.
+
+    Attributes:
+        get_connection (callable): Returns a connection to the online_bank database.
+        placeholder (str): Parameter placeholder of the driver ("%s" for mysql.connector, "?" for sqlite3).
+        lock_rows (bool): Locks the rows read before an update with SELECT ... FOR UPDATE
+            (False for SQLite, which locks the whole database on write).
+        max_retries (int): Number of times a transfer is run again after a deadlock.
+        archive_dir (str): Directory of the archived months (see transactions_archive.py), read by the
+            history queries in addition to the transactions table (optional).
+        money_in_cents (bool): The money columns hold integer cents (SQLiteBackend), so the money
+            computed by SQL comes back in cents.
+    """
+    def __init__(self, get_connection, placeholder="%s", lock_rows=True, max_retries=5, archive_dir=None,
+                 money_in_cents=False):
+        self.get_connection = get_connection
+        self.placeholder = placeholder
+        self.for_update = " FOR UPDATE" if lock_rows else ""
+        self.max_retries = max_retries
+        self.archive_dir = archive_dir
+        self.money_in_cents = money_in_cents
+
+    def sql(self, query):
+        """Writes the query (written with %s) with the placeholder of the driver."""
+        if self.placeholder == "%s":
+            return query
+        return query.replace("%s", self.placeholder)
+
+    def money(self, value):
+        """Returns money computed by a query (SUM, ...) as a Decimal."""
+        if self.money_in_cents:
+            return Decimal(value).scaleb(-2)
+        return Decimal(value)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Gives a cursor on a connection, commits when the block succeeds and rolls back otherwise.
+        The connection is closed at the end (given back to its pool).
+        """
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        try:
+            yield cursor
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    # Users
+
+    def create_user(self, username, password, email, level='Basic'):
+        """
+        Creates a user.
+
+        Returns:
+            int: The user_id of the new user.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                "INSERT INTO users (username, password, email, level) VALUES (%s, %s, %s, %s)"
+            ), (username, password, email, level))
+            return cursor.lastrowid
+
+    def get_user(self, user_id):
+        """
+        Returns:
+            dict: user_id, username, email, level and created_at of the user, or None if not found.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                "SELECT user_id, username, email, level, created_at FROM users WHERE user_id = %s"
+            ), (user_id,))
+            rows = rows_as_dicts(cursor)
+        return rows[0] if rows else None
+
+    def get_user_level(self, user_id):
+        """
+        Returns:
+            str: The level of the user ('Basic', 'Premium' or 'VIP'), or None if not found.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(self.sql("SELECT level FROM users WHERE user_id = %s"), (user_id,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    # Accounts
+
+    def create_account(self, user_id, account_number, balance=0):
+        """
+        Creates an account for a user.
+
+        Returns:
+            int: The account_id of the new account.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                "INSERT INTO accounts (user_id, account_number, balance) VALUES (%s, %s, %s)"
+            ), (user_id, account_number, to_money(balance)))
+            return cursor.lastrowid
+
+    def get_account(self, account_id):
+        """
+        Returns:
+            dict: account_id, user_id, account_number, balance and created_at, or None if not found.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                "SELECT account_id, user_id, account_number, balance, created_at FROM accounts WHERE account_id = %s"
+            ), (account_id,))
+            rows = rows_as_dicts(cursor)
+        return rows[0] if rows else None
+
+    def get_balance(self, account_id):
+        """
+        Returns:
+            The balance of the account.
+
+        Raises:
+            LedgerError: If the account does not exist.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(self.sql("SELECT balance FROM accounts WHERE account_id = %s"), (account_id,))
+            row = cursor.fetchone()
+        if row is None:
+            raise LedgerError(f"Account {account_id} not found.")
+        return row[0]
+
+    # UD accounts
+
+    def create_ud_account(self, user_id, account_number, balance=0):
+        """
+        Creates the universal-dividend account of a user (one per user).
+
+        Returns:
+            int: The ud_account_id of the new account.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                "INSERT INTO ud_account (user_id, account_number, balance) VALUES (%s, %s, %s)"
+            ), (user_id, account_number, to_money(balance)))
+            return cursor.lastrowid
+
+    def get_ud_balance(self, user_id):
+        """
+        Returns:
+            The balance of the universal-dividend account of the user, or None if the user has none.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(self.sql("SELECT balance FROM ud_account WHERE user_id = %s"), (user_id,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def get_ud_dividends(self, user_id):
+        """
+        Returns the dividends credited to the universal-dividend account of the user (see dividend.py).
+
+        Returns:
+            list: One dictionary per period (period, ud_account_id, amount), oldest first.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                "SELECT d.period, d.ud_account_id, d.amount FROM ud_dividends d "
+                "JOIN ud_account u ON u.ud_account_id = d.ud_account_id WHERE u.user_id = %s ORDER BY d.period"
+            ), (user_id,))
+            return rows_as_dicts(cursor)
+
+    # Transactions
+
+    def deposit(self, account_id, amount):
+        """
+        Adds amount to the balance of the account and records the deposit.
+
+        Returns:
+            int: The transaction_id of the deposit.
+
+        Raises:
+            LedgerError: If the amount is not positive or the account does not exist.
+        """
+        amount = to_money(amount)
+        if amount <= 0:
+            raise LedgerError("The amount of a deposit must be positive.")
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                "UPDATE accounts SET balance = balance + %s WHERE account_id = %s"
+            ), (amount, account_id))
+            if cursor.rowcount == 0:
+                raise LedgerError(f"Account {account_id} not found.")
+            cursor.execute(self.sql(
+                "INSERT INTO transactions (account_id, transaction_type, amount) VALUES (%s, 'deposit', %s)"
+            ), (account_id, amount))
+            return cursor.lastrowid
+
+    def withdraw(self, account_id, amount):
+        """
+        Removes amount from the balance of the account and records the withdrawal.
+        The balance check and the update are done by the same UPDATE statement.
+
+        Returns:
+            int: The transaction_id of the withdrawal.
+
+        Raises:
+            LedgerError: If the amount is not positive, the account does not exist or the balance is too low.
+        """
+        amount = to_money(amount)
+        if amount <= 0:
+            raise LedgerError("The amount of a withdrawal must be positive.")
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                "UPDATE accounts SET balance = balance - %s WHERE account_id = %s AND balance >= %s"
+            ), (amount, account_id, amount))
+            if cursor.rowcount == 0:
+                cursor.execute(self.sql("SELECT 1 FROM accounts WHERE account_id = %s"), (account_id,))
+                if cursor.fetchone() is None:
+                    raise LedgerError(f"Account {account_id} not found.")
+                raise LedgerError(f"Insufficient funds on account {account_id}.")
+            cursor.execute(self.sql(
+                "INSERT INTO transactions (account_id, transaction_type, amount) VALUES (%s, 'withdrawal', %s)"
+            ), (account_id, amount))
+            return cursor.lastrowid
+
+    def transfer(self, from_account, to_account, amount):
+        """
+        Moves amount from one account to another in one transaction.
+        The two rows are locked in the order of their account_id, so two opposite transfers
+        cannot deadlock each other; a deadlock with other transactions is retried with an
+        exponential backoff.
+        Two 'transfer' transactions are recorded: -amount on from_account and +amount on to_account.
+
+        Returns:
+            int: The transaction_id of the debit on from_account.
+
+        Raises:
+            LedgerError: If the amount is not positive, the accounts are the same or do not exist,
+                or the balance of from_account is too low.
+        """
+        amount = to_money(amount)
+        if amount <= 0:
+            raise LedgerError("The amount of a transfer must be positive.")
+        if from_account == to_account:
+            raise LedgerError("Cannot transfer to the same account.")
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._transfer(from_account, to_account, amount)
+            except LedgerError:
+                raise
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                time.sleep(0.01 * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def _transfer(self, from_account, to_account, amount):
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                "SELECT account_id, balance FROM accounts WHERE account_id IN (%s, %s) ORDER BY account_id"
+                + self.for_update
+            ), (from_account, to_account))
+            balances = dict(cursor.fetchall())
+            for account_id in (from_account, to_account):
+                if account_id not in balances:
+                    raise LedgerError(f"Account {account_id} not found.")
+            if balances[from_account] < amount:
+                raise LedgerError(f"Insufficient funds on account {from_account}.")
+
+            cursor.execute(self.sql(
+                "UPDATE accounts SET balance = balance + CASE WHEN account_id = %s THEN -%s ELSE %s END "
+                "WHERE account_id IN (%s, %s)"
+            ), (from_account, amount, amount, from_account, to_account))
+            insert_query = self.sql(
+                "INSERT INTO transactions (account_id, counterparty_account_id, transaction_type, amount) "
+                "VALUES (%s, %s, 'transfer', %s)"
+            )
+            cursor.execute(insert_query, (from_account, to_account, -amount))
+            transaction_id = cursor.lastrowid
+            cursor.execute(insert_query, (to_account, from_account, amount))
+            return transaction_id
+
+    def get_transactions(self, account_id, start_date=None, end_date=None):
+        """
+        Returns the transactions of an account, oldest first (archived months included).
+
+        Args:
+            account_id (int): The account.
+            start_date: Only the transactions made from this date (optional).
+            end_date: Only the transactions made before this date (optional).
+
+        Returns:
+            list: One dictionary per transaction.
+        """
+        query = (
+            "SELECT transaction_id, account_id, counterparty_account_id, transaction_type, amount, transaction_date "
+            "FROM transactions WHERE account_id = %s"
+        )
+        params = [account_id]
+        return self._select_in_range(query, params, start_date, end_date, account_id)
+
+    def get_transfers_between(self, account_id, counterparty_account_id, start_date=None, end_date=None):
+        """
+        Returns the transfers of account_id to and from counterparty_account_id, oldest first.
+        Amounts are seen from account_id: negative when money went to counterparty_account_id.
+
+        Returns:
+            list: One dictionary per transfer.
+        """
+        query = (
+            "SELECT transaction_id, account_id, counterparty_account_id, transaction_type, amount, transaction_date "
+            "FROM transactions WHERE account_id = %s AND counterparty_account_id = %s"
+        )
+        params = [account_id, counterparty_account_id]
+        return self._select_in_range(query, params, start_date, end_date, account_id, counterparty_account_id)
+
+    def _select_in_range(self, query, params, start_date, end_date, account_id, counterparty_account_id=None):
+        if start_date is not None:
+            query += " AND transaction_date >= %s"
+            params.append(start_date)
+        if end_date is not None:
+            query += " AND transaction_date < %s"
+            params.append(end_date)
+        query += " ORDER BY transaction_date, transaction_id"
+
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(query), params)
+            rows = rows_as_dicts(cursor)
+        if self.archive_dir is None:
+            return rows
+        # the archived months are all older than the months still in the table
+        return read_archived_transactions(self.archive_dir, account_id, start_date, end_date, counterparty_account_id) + rows
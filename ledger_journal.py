@@ -0,0 +1,299 @@
+"""
+Write-ahead journal of the deposits of the online_bank schema
+
+In journal mode a deposit is acknowledged as soon as it is written and fsync'ed in a local
+append-only file, instead of after its commit in the database:
+    - the deposits of all the threads waiting at the same time are written and fsync'ed together
+      (group commit), so one fsync acknowledges many deposits,
+    - a background thread applies the journaled deposits to the transactions and accounts tables
+      by batches, one database transaction per batch,
+    - each batch also stores the sequence number of its last entry in ledger_journal_state, so after
+      a crash the journal is read again and only the entries after that number are applied.
+
+Only deposits go through the journal: a withdrawal or a transfer cannot be acknowledged before
+its balance has been checked in the database, so they stay on LedgerDAO. The account of a deposit
+is checked before the deposit is acknowledged; an entry the database still refuses (a constraint or
+data error) is moved to the rejected journal (path + ".rejected") instead of blocking the ones after it.
+
+Example:
+    journal = LedgerJournal(dao, "ledger.journal")
+    journal.deposit(account_id, 100)    # returns once the deposit is durable in the journal
+    journal.close()                     # applies what is left and stops the threads
+"""
+import datetime
+import json
+import os
+import threading
+import time
+from decimal import Decimal
+
+from ledger_dao import LedgerError
+
+def is_rejected(error):
+    """Returns True if the database refused the data itself (running it again would fail again)."""
+    return type(error).__name__ in ('IntegrityError', 'DataError')   # DB-API names, sqlite3 and mysql.connector
+
+class LedgerJournal:
+    """
+    Journal of deposits applied in the background to the database of dao.
+
+    Attributes:
+        dao (LedgerDAO): The DAO of the database the deposits are applied to.
+        path (str): The journal file.
+        name (str): Name of the journal in ledger_journal_state.
+        apply_interval (float): Seconds between two batches of the applier.
+        apply_batch (int): Maximum number of entries applied in one database transaction.
+        max_journal_bytes (int): The journal file is emptied when it is bigger and all its entries are applied.
+        rejected_path (str): The file of the entries the database refused.
+        apply_error (Exception): The last error of the applier (the entries are applied again at its next try), or None.
+    """
+    def __init__(self, dao, path, name=None, apply_interval=0.05, apply_batch=10000, max_journal_bytes=64 * 1024 * 1024):
+        self.dao = dao
+        self.path = path
+        self.name = name or os.path.basename(path)
+        self.apply_interval = apply_interval
+        self.apply_batch = apply_batch
+        self.max_journal_bytes = max_journal_bytes
+        self.rejected_path = path + ".rejected"
+        self.known_accounts = set()   # accounts already checked: accounts are never deleted
+
+        self.lock = threading.Lock()
+        self.written = threading.Condition(self.lock)   # notified when entries are durable
+        self.queued = threading.Condition(self.lock)    # notified when entries are waiting to be written
+        self.queue = []            # entries waiting to be written
+        self.unapplied = []        # durable entries not applied yet
+        self.last_seq = 0          # last sequence number given
+        self.durable_seq = 0       # last sequence number fsync'ed
+        self.applied_seq = 0       # last sequence number applied to the database
+        self.writing = False
+        self.closing = False
+        self.error = None
+        self.apply_error = None
+        self.rejected = 0
+
+        self.recover()
+        self.file = open(path, 'ab', buffering=0)
+        self.writer = threading.Thread(target=self.write_loop, name="journal-writer", daemon=True)
+        self.applier = threading.Thread(target=self.apply_loop, name="journal-applier", daemon=True)
+        self.writer.start()
+        self.applier.start()
+
+    # Recovery
+
+    def recover(self):
+        """Reads the journal file and keeps the entries that the database has not applied yet."""
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql(
+                "SELECT applied_seq FROM ledger_journal_state WHERE journal = %s"
+            ), (self.name,))
+            row = cursor.fetchone()
+        self.applied_seq = row[0] if row else 0
+        self.durable_seq = self.last_seq = self.applied_seq
+
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        complete = data.rfind(b'\n') + 1
+        for line in data[:complete].splitlines():
+            entry = json.loads(line)
+            if entry['seq'] > self.applied_seq:
+                self.unapplied.append(entry)
+            self.durable_seq = max(self.durable_seq, entry['seq'])
+        if complete < len(data):
+            # the last line was not fully written before the crash, so it was never acknowledged
+            with open(self.path, 'r+b') as file:
+                file.truncate(complete)
+                os.fsync(file.fileno())
+        self.last_seq = self.durable_seq
+        if self.unapplied:
+            print(f"Journal {self.name}: {len(self.unapplied)} entries to apply after recovery")
+
+    # Group commit
+
+    def deposit(self, account_id, amount):
+        """
+        Journals a deposit and returns once it is durable (fsync'ed) in the journal file.
+
+        Returns:
+            int: The sequence number of the deposit in the journal.
+
+        Raises:
+            LedgerError: If the amount is not positive or the account does not exist.
+        """
+        if amount <= 0:
+            raise LedgerError("The amount of a deposit must be positive.")
+        self.check_account(account_id)
+        with self.lock:
+            if self.error is not None:
+                raise self.error
+            if self.closing:
+                raise LedgerError("The journal is closed.")
+            self.last_seq += 1
+            seq = self.last_seq
+            entry = {
+                'seq': seq,
+                'account_id': account_id,
+                'amount': str(amount),
+                'date': datetime.datetime.now().isoformat(" ", "seconds"),
+            }
+            self.queue.append(entry)
+            self.queued.notify()
+            while self.durable_seq < seq:
+                if self.error is not None:
+                    raise self.error
+                self.written.wait()
+        return seq
+
+    def check_account(self, account_id):
+        if account_id in self.known_accounts:
+            return
+        with self.dao.transaction() as cursor:
+            cursor.execute(self.dao.sql("SELECT 1 FROM accounts WHERE account_id = %s"), (account_id,))
+            if cursor.fetchone() is None:
+                raise LedgerError(f"Account {account_id} not found.")
+        self.known_accounts.add(account_id)
+
+    def write_loop(self):
+        while True:
+            with self.lock:
+                while not self.queue and not self.closing:
+                    self.queued.wait()
+                if not self.queue:
+                    return
+                entries, self.queue = self.queue, []
+                self.writing = True
+            try:
+                self.file.write(b''.join(json.dumps(entry).encode() + b'\n' for entry in entries))
+                os.fsync(self.file.fileno())
+            except OSError as e:
+                with self.lock:
+                    self.error = e
+                    self.writing = False
+                    self.written.notify_all()
+                return
+            with self.lock:
+                self.writing = False
+                self.durable_seq = entries[-1]['seq']
+                self.unapplied.extend(entries)
+                self.written.notify_all()
+
+    # Applier
+
+    def apply_pending(self):
+        """
+        Applies the durable entries not applied yet, by batches of apply_batch entries.
+        When the database refuses a batch, its entries are applied one at a time and the
+        ones refused alone are moved to the rejected journal.
+
+        Returns:
+            int: The number of entries applied.
+        """
+        applied = 0
+        while True:
+            with self.lock:
+                entries = self.unapplied[:self.apply_batch]
+            if not entries:
+                return applied
+            try:
+                self.apply(entries)
+                applied += len(entries)
+            except Exception as e:
+                if not is_rejected(e):
+                    raise   # the database is not reachable, locked...: the batch is applied at the next try
+                applied += self.apply_one_by_one(entries)
+            with self.lock:
+                del self.unapplied[:len(entries)]
+                self.applied_seq = entries[-1]['seq']
+
+    def apply_one_by_one(self, entries):
+        applied = 0
+        for entry in entries:
+            try:
+                self.apply([entry])
+                applied += 1
+            except Exception as e:
+                if not is_rejected(e):
+                    raise
+                self.reject(entry, e)
+        return applied
+
+    def reject(self, entry, error):
+        """
+        Writes an entry refused by the database to the rejected journal, then marks it applied.
+        After a crash between the two the entry is refused again and written twice.
+        """
+        with open(self.rejected_path, 'ab') as file:
+            file.write(json.dumps(dict(entry, error=str(error))).encode() + b'\n')
+            file.flush()
+            os.fsync(file.fileno())
+        with self.dao.transaction() as cursor:
+            self.save_applied_seq(cursor, entry['seq'])
+        with self.lock:
+            self.rejected += 1
+
+    def save_applied_seq(self, cursor, seq):
+        cursor.execute(self.dao.sql(
+            "UPDATE ledger_journal_state SET applied_seq = %s WHERE journal = %s"
+        ), (seq, self.name))
+        if cursor.rowcount == 0:
+            cursor.execute(self.dao.sql(
+                "INSERT INTO ledger_journal_state (journal, applied_seq) VALUES (%s, %s)"
+            ), (self.name, seq))
+
+    def apply(self, entries):
+        deltas = {}
+        for entry in entries:
+            deltas[entry['account_id']] = deltas.get(entry['account_id'], 0) + Decimal(entry['amount'])
+        with self.dao.transaction() as cursor:
+            # the accounts are locked before the rows are inserted (see balance_snapshots.py)
+            cursor.executemany(self.dao.sql(
+                "UPDATE accounts SET balance = balance + %s WHERE account_id = %s"
+            ), [(delta, account_id) for account_id, delta in sorted(deltas.items())])
+            cursor.executemany(self.dao.sql(
+                "INSERT INTO transactions (account_id, transaction_type, amount, transaction_date) "
+                "VALUES (%s, 'deposit', %s, %s)"
+            ), [(entry['account_id'], Decimal(entry['amount']), entry['date']) for entry in entries])
+            self.save_applied_seq(cursor, entries[-1]['seq'])
+
+    def apply_loop(self):
+        while True:
+            with self.lock:
+                closing = self.closing and not self.writer.is_alive()
+            try:
+                self.apply_pending()
+                self.checkpoint()
+                self.apply_error = None
+            except Exception as e:
+                self.apply_error = e   # the entries stay in the journal and are applied at the next try
+            if closing:
+                return
+            time.sleep(self.apply_interval)
+
+    def checkpoint(self):
+        """Empties the journal file when it is bigger than max_journal_bytes and all its entries are applied."""
+        if self.file.tell() < self.max_journal_bytes:
+            return
+        with self.lock:
+            if self.queue or self.writing or self.unapplied:
+                return
+            self.file.truncate(0)
+            self.file.seek(0)
+            os.fsync(self.file.fileno())
+
+    def pending(self):
+        """
+        Returns:
+            int: The number of acknowledged deposits not applied to the database yet.
+        """
+        with self.lock:
+            return len(self.unapplied) + len(self.queue)
+
+    def close(self):
+        """Writes and applies the remaining entries, then stops the threads."""
+        with self.lock:
+            self.closing = True
+            self.queued.notify()
+        self.writer.join()
+        self.applier.join()
+        self.file.close()
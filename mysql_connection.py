@@ -1,19 +1,52 @@
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector import pooling
 
-def create_connection():
+from transactions_archive import partition_clause
+
+DB_CONFIG = {
+    'host': 'localhost',        # Replace with your host
+    'user': 'yourusername',     # Replace with your MySQL username
+    'password': 'yourpassword'  # Replace with your MySQL password
+}
+
+def create_connection(database=None):
     try:
-        connection = mysql.connector.connect(
-            host='localhost',        # Replace with your host
-            user='yourusername',     # Replace with your MySQL username
-            password='yourpassword'  # Replace with your MySQL password
-        )
+        if database:
+            connection = mysql.connector.connect(database=database, **DB_CONFIG)
+        else:
+            connection = mysql.connector.connect(**DB_CONFIG)
         if connection.is_connected():
             return connection
     except Error as e:
         print(f"Error: {e}")
         return None
 
+def create_connection_pool(pool_name="online_bank_pool", pool_size=5, database="online_bank"):
+    """
+    Creates a pool of pool_size connections to the database.
+    Closing a connection given by the pool gives it back to the pool instead of closing it.
+    """
+    try:
+        return pooling.MySQLConnectionPool(
+            pool_name=pool_name,
+            pool_size=pool_size,
+            pool_reset_session=True,
+            database=database,
+            **DB_CONFIG
+        )
+    except Error as e:
+        print(f"Error: {e}")
+        return None
+
+def get_pooled_connection(pool):
+    """
+    Gets a connection from the pool after checking it is still alive (reconnects it otherwise).
+    """
+    connection = pool.get_connection()
+    connection.ping(reconnect=True, attempts=3, delay=1)
+    return connection
+
 def create_database(connection):
     try:
         cursor = connection.cursor()
@@ -22,7 +55,13 @@ def create_database(connection):
     except Error as e:
         print(f"Error: {e}")
 
-def create_tables(connection):
+def create_tables(connection, migrate=True, partitioned=False, months_ahead=3):
+    """
+    Creates the tables of online_bank.
+    With partitioned=True the transactions table is created with one partition per month
+    (see transactions_archive.py); MySQL does not allow foreign keys on a partitioned table,
+    so it then has no foreign key to accounts.
+    """
     try:
         cursor = connection.cursor()
         cursor.execute("USE online_bank")
@@ -64,21 +103,122 @@ def create_tables(connection):
         ''')
 
         # Create Transactions Table
+        if partitioned:
+            cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS transactions (
+                transaction_id INT AUTO_INCREMENT,
+                account_id INT,
+                transaction_type ENUM('deposit', 'withdrawal', 'transfer') NOT NULL,
+                amount DECIMAL(10, 2) NOT NULL,
+                transaction_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (transaction_id, transaction_date),
+                KEY (account_id)
+            )
+            {partition_clause(months_ahead)}
+            ''')
+        else:
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                transaction_id INT AUTO_INCREMENT PRIMARY KEY,
+                account_id INT,
+                transaction_type ENUM('deposit', 'withdrawal', 'transfer') NOT NULL,
+                amount DECIMAL(10, 2) NOT NULL,
+                transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (account_id) REFERENCES accounts(account_id)
+            )
+            ''')
+
+        # Create Balance_snapshots Table (balance of an account computed from its transactions up to as_of_transaction_id)
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            transaction_id INT AUTO_INCREMENT PRIMARY KEY,
-            account_id INT,
-            transaction_type ENUM('deposit', 'withdrawal', 'transfer') NOT NULL,
-            amount DECIMAL(10, 2) NOT NULL,
-            transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        CREATE TABLE IF NOT EXISTS balance_snapshots (
+            account_id INT NOT NULL,
+            as_of_transaction_id INT NOT NULL,
+            balance DECIMAL(10, 2) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (account_id, as_of_transaction_id),
             FOREIGN KEY (account_id) REFERENCES accounts(account_id)
         )
         ''')
 
+        # Create UD_periods Table (one row per universal-dividend period, see dividend.py)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ud_periods (
+            period VARCHAR(20) PRIMARY KEY,
+            amount DECIMAL(10, 2) NOT NULL,
+            members INT NOT NULL,
+            money_supply DECIMAL(20, 2) NOT NULL,
+            last_ud_account_id INT NOT NULL,
+            credited_up_to INT NOT NULL DEFAULT 0,
+            completed_at TIMESTAMP NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+        # Create UD_dividends Table (the dividends credited to each ud_account)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ud_dividends (
+            period VARCHAR(20) NOT NULL,
+            ud_account_id INT NOT NULL,
+            amount DECIMAL(10, 2) NOT NULL,
+            PRIMARY KEY (period, ud_account_id),
+            FOREIGN KEY (period) REFERENCES ud_periods(period),
+            FOREIGN KEY (ud_account_id) REFERENCES ud_account(ud_account_id)
+        )
+        ''')
+
+        # Create Ledger_journal_state Table (last entry of each journal applied to the tables, see ledger_journal.py)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_journal_state (
+            journal VARCHAR(100) PRIMARY KEY,
+            applied_seq BIGINT NOT NULL
+        )
+        ''')
+
         print("Tables created successfully")
     except Error as e:
         print(f"Error: {e}")
 
+    if migrate:
+        migrate_tables(connection)
+
+# Changes made to the tables after their creation, applied in order by migrate_tables.
+# Each one is (kind, table, name, statement): the statement is only run if the column / index does not exist yet.
+MIGRATIONS = [
+    # Other account of a transfer
+    ('column', 'transactions', 'counterparty_account_id',
+     "ALTER TABLE transactions ADD COLUMN counterparty_account_id INT NULL AFTER account_id"),
+    # History of an account in a date range (statements)
+    ('index', 'transactions', 'idx_transactions_account_date',
+     "CREATE INDEX idx_transactions_account_date ON transactions (account_id, transaction_date)"),
+    # Transfers between two accounts (reconciliation)
+    ('index', 'transactions', 'idx_transactions_account_counterparty',
+     "CREATE INDEX idx_transactions_account_counterparty ON transactions (account_id, counterparty_account_id, transaction_date)"),
+]
+
+def schema_object_exists(cursor, kind, table, name):
+    if kind == 'column':
+        query = "SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s"
+    else:
+        query = "SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s"
+    cursor.execute(query, (table, name))
+    return cursor.fetchone() is not None
+
+def migrate_tables(connection):
+    """
+    Applies the MIGRATIONS missing from the online_bank tables.
+    Can be run any number of times: the columns and indexes already there are skipped.
+    """
+    try:
+        cursor = connection.cursor()
+        cursor.execute("USE online_bank")
+        for kind, table, name, statement in MIGRATIONS:
+            if not schema_object_exists(cursor, kind, table, name):
+                cursor.execute(statement)
+                print(f"Migration applied: {kind} {name} on {table}")
+        print("Tables migrated successfully")
+    except Error as e:
+        print(f"Error: {e}")
+
 def insert_sample_data(connection):
     try:
         cursor = connection.cursor()
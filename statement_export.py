@@ -0,0 +1,198 @@
+"""
+Streaming export of the transactions of the online_bank schema (account statements)
+
+The rows are read with fetchmany from an unbuffered cursor (the default cursor of mysql.connector:
+the server sends the rows as they are fetched, and SQLite cursors are lazy too), turned into lines
+by a generator and written as they come, so the memory used does not depend on the number of rows.
+The generator must be read to the end: an unbuffered MySQL cursor cannot be closed with rows left.
+
+With LedgerDAO(..., archive_dir=...) the archived months (see transactions_archive.py) are exported
+too, streamed from their files before the rows of the table: they are older than the live rows, so
+the statement of an account stays in date order. An export of all the accounts gives the archived
+rows ordered by date, then the live rows ordered by account.
+
+Example:
+    report = export_transactions(dao, "statement_42.csv.gz", account_id=42)
+    export_transactions(dao, "all.jsonl.gz", format="jsonl")
+    export_ud_dividends(dao, "dividends.csv.gz")   # the statement of the ud_accounts (see dividend.py)
+    print(report["rows_per_second"], report["peak_rss_mb"])
+"""
+import csv
+import datetime
+import functools
+import gzip
+import io
+import json
+import sys
+import time
+from decimal import Decimal
+
+from transactions_archive import iter_archived_transactions
+
+try:
+    import resource
+except ImportError:   # not on Windows
+    resource = None
+
+STATEMENT_COLUMNS = ['transaction_id', 'account_id', 'counterparty_account_id', 'transaction_type', 'amount', 'transaction_date']
+UD_STATEMENT_COLUMNS = ['period', 'ud_account_id', 'amount']
+
+def iter_transactions(dao, account_id=None, start_date=None, end_date=None, chunk_size=10000):
+    """
+    Yields the transactions of an account (or of all the accounts) ordered by account, date and id.
+    The order follows the index (account_id, transaction_date), so the rows come without a sort.
+    The archived transactions of dao.archive_dir come first, ordered by date and id.
+
+    Yields:
+        tuple: One row with the STATEMENT_COLUMNS.
+    """
+    query = f"SELECT {', '.join(STATEMENT_COLUMNS)} FROM transactions"
+    conditions = []
+    params = []
+    if account_id is not None:
+        conditions.append("account_id = %s")
+        params.append(account_id)
+    if start_date is not None:
+        conditions.append("transaction_date >= %s")
+        params.append(start_date)
+    if end_date is not None:
+        conditions.append("transaction_date < %s")
+        params.append(end_date)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY account_id, transaction_date, transaction_id"
+
+    if dao.archive_dir is not None:
+        yield from iter_archived_transactions(dao.archive_dir, account_id, start_date, end_date)
+    with dao.transaction() as cursor:
+        cursor.execute(dao.sql(query), params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+
+def iter_ud_dividends(dao, ud_account_id=None, chunk_size=10000):
+    """
+    Yields the dividends credited to a ud_account (or to all of them) ordered by ud_account and period.
+
+    Yields:
+        tuple: One row with the UD_STATEMENT_COLUMNS.
+    """
+    query = f"SELECT {', '.join(UD_STATEMENT_COLUMNS)} FROM ud_dividends"
+    params = []
+    if ud_account_id is not None:
+        query += " WHERE ud_account_id = %s"
+        params.append(ud_account_id)
+    query += " ORDER BY ud_account_id, period"
+
+    with dao.transaction() as cursor:
+        cursor.execute(dao.sql(query), params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+
+def to_json(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat(" ")
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def iter_statement_lines(rows, format="csv", columns=STATEMENT_COLUMNS):
+    """
+    Turns rows of iter_transactions (or of iter_ud_dividends with UD_STATEMENT_COLUMNS) into the lines
+    of a CSV file (header first) or of a JSONL file.
+
+    Yields:
+        str: One line, with its end of line.
+    """
+    if format == "jsonl":
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), default=to_json) + "\n"
+        return
+    if format != "csv":
+        raise ValueError(f"Unknown format {format} (csv or jsonl).")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def peak_rss_mb():
+    """Returns the peak resident memory of the process in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def write_statement(path, rows, format=None, columns=STATEMENT_COLUMNS):
+    """
+    Writes rows to a CSV or JSONL file, gzip'd when path ends with .gz.
+
+    Returns:
+        dict: rows, seconds, rows_per_second and peak_rss_mb of the export.
+    """
+    if format is None:
+        format = "jsonl" if ".jsonl" in path else "csv"
+    # gzip level 6: close to the size of level 9 (the default) at a much lower cost
+    opener = functools.partial(gzip.open, compresslevel=6) if path.endswith(".gz") else open
+
+    count = 0
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    start = time.perf_counter()
+    with opener(path, 'wt', newline='') as file:
+        file.writelines(iter_statement_lines(counted(rows), format, columns))
+    seconds = time.perf_counter() - start
+    return {
+        'rows': count,
+        'seconds': seconds,
+        'rows_per_second': count / seconds if seconds > 0 else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def export_transactions(dao, path, format=None, account_id=None, start_date=None, end_date=None, chunk_size=10000):
+    """
+    Writes the transactions to a CSV or JSONL file, gzip'd when path ends with .gz.
+
+    Args:
+        dao (LedgerDAO): The DAO giving the connection.
+        path (str): The file to write.
+        format (str): "csv" or "jsonl" (found from path by default).
+        account_id (int): Only the transactions of this account (optional).
+        start_date, end_date: Only the transactions of this date range (optional).
+        chunk_size (int): Number of rows fetched at once.
+
+    Returns:
+        dict: rows, seconds, rows_per_second and peak_rss_mb of the export.
+    """
+    return write_statement(path, iter_transactions(dao, account_id, start_date, end_date, chunk_size), format)
+
+def export_ud_dividends(dao, path, format=None, ud_account_id=None, chunk_size=10000):
+    """
+    Writes the dividends credited to the ud_accounts (see dividend.py) to a CSV or JSONL file,
+    gzip'd when path ends with .gz.
+
+    Args:
+        dao (LedgerDAO): The DAO giving the connection.
+        path (str): The file to write.
+        format (str): "csv" or "jsonl" (found from path by default).
+        ud_account_id (int): Only the dividends of this ud_account (optional).
+        chunk_size (int): Number of rows fetched at once.
+
+    Returns:
+        dict: rows, seconds, rows_per_second and peak_rss_mb of the export.
+    """
+    return write_statement(path, iter_ud_dividends(dao, ud_account_id, chunk_size), format, UD_STATEMENT_COLUMNS)
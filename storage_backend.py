@@ -0,0 +1,290 @@
+"""
+Storage backends of the online_bank schema
+
+A backend creates the schema and gives the connections of a LedgerDAO, so the same DAO
+(and the modules built on it: bulk_loader, balance_snapshots, dividend, async_ledger)
+runs on MySQL or on an embedded SQLite file.
+
+    backend = SQLiteBackend("online_bank.db")      # or MySQLBackend(pool_size=10)
+    backend.create_schema()
+    dao = backend.dao()
+
+SQLiteBackend is tuned for throughput:
+    - WAL journal (readers do not block the writer) with synchronous=NORMAL,
+    - one connection per thread kept open, so the statements stay prepared in its statement cache,
+    - backend.batch(): the DAO operations of the block are committed together (each one in a savepoint).
+
+SQLite has no DECIMAL: a NUMERIC column keeps 0.10 as a binary float. The money columns of
+SQLITE_SCHEMA are integer cents (declared CENTS INTEGER), so the sums and the balance checks are
+exact; a Decimal parameter is written in cents and a CENTS column is read back as a Decimal, and a
+TIMESTAMP column is read back as a datetime, as with MySQL.
+"""
+import datetime
+import sqlite3
+import threading
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
+
+from ledger_dao import LedgerDAO
+
+def decimal_to_cents(amount):
+    # rounded to the cent like a DECIMAL(10, 2) column of MySQL
+    return int(amount.scaleb(2).to_integral_value(ROUND_HALF_UP))
+
+sqlite3.register_adapter(Decimal, decimal_to_cents)
+sqlite3.register_adapter(datetime.datetime, lambda date: date.isoformat(" "))
+sqlite3.register_converter("CENTS", lambda value: Decimal(int(value)).scaleb(-2))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.datetime.fromisoformat(value.decode()))
+
+class StorageBackend:
+    """
+    Base class of the backends.
+
+    Attributes:
+        placeholder (str): Parameter placeholder of the driver.
+    """
+    placeholder = "%s"
+    money_in_cents = False
+
+    def connect(self):
+        """Returns a connection to the online_bank database (closing it gives it back)."""
+        raise NotImplementedError
+
+    def create_schema(self):
+        """Creates the tables if they do not exist."""
+        raise NotImplementedError
+
+    def dao(self, **kwargs):
+        """Returns a LedgerDAO on this backend."""
+        return LedgerDAO(self.connect, placeholder=self.placeholder, money_in_cents=self.money_in_cents, **kwargs)
+
+    def close(self):
+        pass
+
+########################################################################
+#  MYSQL
+# ######################################################################
+
+class MySQLBackend(StorageBackend):
+    """
+    The online_bank database of mysql_connection.py, through a connection pool.
+    """
+    def __init__(self, pool_size=10, database="online_bank", partitioned=False):
+        self.pool_size = pool_size
+        self.database = database
+        self.partitioned = partitioned
+        self.pool = None
+
+    def create_schema(self):
+        from mysql_connection import create_connection, create_database, create_tables, close_connection
+        connection = create_connection()
+        create_database(connection)
+        create_tables(connection, partitioned=self.partitioned)
+        close_connection(connection)
+
+    def connect(self):
+        from mysql_connection import create_connection_pool, get_pooled_connection
+        if self.pool is None:
+            self.pool = create_connection_pool(pool_size=self.pool_size, database=self.database)
+        return get_pooled_connection(self.pool)
+
+########################################################################
+#  SQLITE
+# ######################################################################
+
+# The online_bank schema of mysql_connection.py (with its migrations) in SQLite:
+# ENUM become CHECK constraints, AUTO_INCREMENT becomes INTEGER PRIMARY KEY, DECIMAL becomes integer cents.
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    email VARCHAR(100) NOT NULL UNIQUE,
+    level TEXT DEFAULT 'Basic' CHECK (level IN ('Basic', 'Premium', 'VIP')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS accounts (
+    account_id INTEGER PRIMARY KEY,
+    user_id INT REFERENCES users(user_id),
+    account_number VARCHAR(20) NOT NULL UNIQUE,
+    balance CENTS INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ud_account (
+    ud_account_id INTEGER PRIMARY KEY,
+    user_id INT UNIQUE REFERENCES users(user_id),
+    account_number VARCHAR(20) NOT NULL UNIQUE,
+    balance CENTS INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id INTEGER PRIMARY KEY,
+    account_id INT REFERENCES accounts(account_id),
+    counterparty_account_id INT NULL,
+    transaction_type TEXT NOT NULL CHECK (transaction_type IN ('deposit', 'withdrawal', 'transfer')),
+    amount CENTS INTEGER NOT NULL,
+    transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions (account_id, transaction_date);
+CREATE INDEX IF NOT EXISTS idx_transactions_account_counterparty ON transactions (account_id, counterparty_account_id, transaction_date);
+
+CREATE TABLE IF NOT EXISTS balance_snapshots (
+    account_id INT NOT NULL REFERENCES accounts(account_id),
+    as_of_transaction_id INT NOT NULL,
+    balance CENTS INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, as_of_transaction_id)
+);
+
+CREATE TABLE IF NOT EXISTS ud_periods (
+    period VARCHAR(20) PRIMARY KEY,
+    amount CENTS INTEGER NOT NULL,
+    members INT NOT NULL,
+    money_supply CENTS INTEGER NOT NULL,
+    last_ud_account_id INT NOT NULL,
+    credited_up_to INT NOT NULL DEFAULT 0,
+    completed_at TIMESTAMP NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ud_dividends (
+    period VARCHAR(20) NOT NULL REFERENCES ud_periods(period),
+    ud_account_id INT NOT NULL REFERENCES ud_account(ud_account_id),
+    amount CENTS INTEGER NOT NULL,
+    PRIMARY KEY (period, ud_account_id)
+);
+
+CREATE TABLE IF NOT EXISTS ledger_journal_state (
+    journal VARCHAR(100) PRIMARY KEY,
+    applied_seq BIGINT NOT NULL
+);
+'''
+
+class SQLiteCursor:
+    """
+    Cursor of a SQLiteConnection: starts the transaction at the first statement
+    (BEGIN IMMEDIATE if it writes or locks rows with FOR UPDATE, BEGIN otherwise)
+    and removes the FOR UPDATE that SQLite does not know.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.raw.cursor()
+
+    def begin(self, query):
+        if not self.connection.raw.in_transaction:
+            reads = query.lstrip().upper().startswith("SELECT") and "FOR UPDATE" not in query
+            self.cursor.execute("BEGIN" if reads else "BEGIN IMMEDIATE")
+        return query.replace(" FOR UPDATE", "")
+
+    def execute(self, query, params=()):
+        self.cursor.execute(self.begin(query), params)
+        return self
+
+    def executemany(self, query, params):
+        self.cursor.executemany(self.begin(query), params)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+class SQLiteConnection:
+    """
+    The connection of a thread, given to the DAO for one operation.
+    In a batch the operation runs in a savepoint of the batch transaction instead of its own transaction.
+    """
+    def __init__(self, raw):
+        self.raw = raw
+        self.batch = False
+
+    def open(self):
+        if self.batch:
+            self.raw.execute("SAVEPOINT operation")
+        return self
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        if self.batch:
+            self.raw.execute("RELEASE operation")
+        elif self.raw.in_transaction:
+            self.raw.execute("COMMIT")
+
+    def rollback(self):
+        if self.batch:
+            self.raw.execute("ROLLBACK TO operation")
+            self.raw.execute("RELEASE operation")
+        elif self.raw.in_transaction:
+            self.raw.execute("ROLLBACK")
+
+    def close(self):
+        pass   # the connection stays open for the next operation of the thread
+
+class SQLiteBackend(StorageBackend):
+    """
+    The online_bank schema in a SQLite file.
+
+    Attributes:
+        path (str): The database file.
+        synchronous (str): PRAGMA synchronous ("NORMAL": a commit is durable after the next checkpoint
+            if the machine crashes, "FULL": durable at once).
+    """
+    placeholder = "?"
+    money_in_cents = True
+
+    def __init__(self, path, synchronous="NORMAL", busy_timeout=5.0, cached_statements=512):
+        self.path = path
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def thread_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            raw = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                  cached_statements=self.cached_statements, check_same_thread=False,
+                                  detect_types=sqlite3.PARSE_DECLTYPES)
+            raw.execute("PRAGMA journal_mode=WAL")
+            raw.execute(f"PRAGMA synchronous={self.synchronous}")
+            raw.execute("PRAGMA foreign_keys=ON")
+            connection = self.local.connection = SQLiteConnection(raw)
+            with self.lock:
+                self.connections.append(raw)
+        return connection
+
+    def connect(self):
+        return self.thread_connection().open()
+
+    def create_schema(self):
+        self.thread_connection().raw.executescript(SQLITE_SCHEMA)
+
+    @contextmanager
+    def batch(self):
+        """
+        Commits all the DAO operations of the block (in this thread) at once at the end of the block.
+        An operation that fails is rolled back alone; an exception leaving the block rolls back the whole batch.
+        """
+        connection = self.thread_connection()
+        connection.raw.execute("BEGIN IMMEDIATE")
+        connection.batch = True
+        try:
+            yield
+            connection.batch = False
+            connection.raw.execute("COMMIT")
+        except Exception:
+            connection.batch = False
+            connection.raw.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        with self.lock:
+            for raw in self.connections:
+                raw.close()
+            self.connections.clear()
+        self.local = threading.local()
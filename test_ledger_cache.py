@@ -0,0 +1,165 @@
+#Tests of the read-through cache of ledger_cache.py, on SQLite
+#
+#to run the tests use:
+#python3 -m pytest -q test_ledger_cache.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import pytest
+
+import ledger_cache
+from ledger_cache import CachedLedgerDAO, TTLCache
+from storage_backend import SQLiteBackend
+
+@pytest.fixture
+def dao(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'online_bank.db'))
+    backend.create_schema()
+    yield backend.dao()
+    backend.close()
+
+@pytest.fixture
+def account_ids(dao):
+    user_id = dao.create_user('cache', 'test', 'cache@example.com')
+    account_ids = [dao.create_account(user_id, f'C{i}') for i in range(4)]
+    for account_id in account_ids:
+        dao.deposit(account_id, 100)
+    return account_ids
+
+class Clock:
+    """time.monotonic of ledger_cache, moved by the tests"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ledger_cache.time, 'monotonic', clock)
+    return clock
+
+########################################################################
+#  STALE READS
+# ######################################################################
+
+def test_load_racing_an_invalidation_is_not_cached():
+    cache = TTLCache(ttl=60)
+    loading = threading.Event()
+    invalidated = threading.Event()
+
+    def old_load():
+        loading.set()
+        invalidated.wait(5)
+        return 'old'
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        reader = executor.submit(cache.get_or_load, 'key', old_load)
+        loading.wait(5)
+        cache.invalidate('key')   # a write committed while the old value was being read
+        invalidated.set()
+        assert reader.result() == 'old'
+
+    assert cache.get_or_load('key', lambda: 'new') == 'new'
+    assert cache.stats()['size'] == 1
+
+def test_balance_read_racing_a_deposit(dao, account_ids):
+    account_id = account_ids[0]
+    cached = CachedLedgerDAO(dao, ttl=60)
+    read = threading.Event()
+    deposited = threading.Event()
+
+    def slow_balance():
+        balance = dao.get_balance(account_id)
+        read.set()
+        deposited.wait(5)
+        return balance
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        reader = executor.submit(cached.cache.get_or_load, ('balance', account_id), slow_balance)
+        read.wait(5)
+        cached.deposit(account_id, Decimal('0.10'))
+        deposited.set()
+        assert reader.result() == 100
+
+    assert cached.get_balance(account_id) == Decimal('100.10')
+
+########################################################################
+#  READ YOUR WRITES
+# ######################################################################
+
+def test_read_your_writes_after_a_transfer(dao, account_ids):
+    cached = CachedLedgerDAO(dao, ttl=60)
+    from_account, to_account = account_ids[:2]
+    assert cached.get_balance(from_account) == 100
+    assert cached.get_balance(to_account) == 100
+
+    cached.transfer(from_account, to_account, Decimal('25.50'))
+    assert cached.get_balance(from_account) == Decimal('74.50')
+    assert cached.get_balance(to_account) == Decimal('125.50')
+
+def test_failed_write_invalidates_too(dao, account_ids):
+    cached = CachedLedgerDAO(dao, ttl=60)
+    account_id = account_ids[0]
+    assert cached.get_balance(account_id) == 100
+    with pytest.raises(Exception):
+        cached.withdraw(account_id, 1000)
+    assert cached.cache.stats()['size'] == 0
+    assert cached.get_balance(account_id) == 100
+
+def test_concurrent_writers(dao, account_ids, writes=400, threads=8):
+    cached = CachedLedgerDAO(dao, ttl=60)
+    deposit_only, mixed = account_ids[:2], account_ids[2:]
+
+    def write(i):
+        if i % 3 == 0:
+            # only deposits on these accounts: a writer sees its deposit in the balance it reads next
+            account_id = deposit_only[i % 2]
+            before = cached.get_balance(account_id)
+            cached.deposit(account_id, 1)
+            assert cached.get_balance(account_id) >= before + 1
+        elif i % 3 == 1:
+            cached.withdraw(mixed[i % 2], Decimal('0.50'))
+        else:
+            cached.transfer(mixed[i % 2], mixed[(i + 1) % 2], Decimal('0.25'))
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(write, i) for i in range(writes)]
+        futures += [executor.submit(cached.get_balance, account_ids[i % len(account_ids)]) for i in range(writes)]
+        for future in futures:
+            future.result()
+
+    for account_id in account_ids:
+        assert cached.get_balance(account_id) == dao.get_balance(account_id)
+
+########################################################################
+#  EXPIRATION AND EVICTION
+# ######################################################################
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(ttl=5, max_size=10)
+    loads = []
+    def load():
+        loads.append(1)
+        return len(loads)
+
+    assert cache.get_or_load('key', load) == 1
+    clock.now += 4.9
+    assert cache.get_or_load('key', load) == 1
+    clock.now += 0.2
+    assert cache.get_or_load('key', load) == 2
+    assert cache.stats()['expirations'] == 1
+
+def test_least_recently_used_is_evicted(clock):
+    cache = TTLCache(ttl=60, max_size=2)
+    cache.get_or_load('a', lambda: 'a')
+    cache.get_or_load('b', lambda: 'b')
+    cache.get_or_load('a', lambda: 'reloaded')   # a is now the most recently used
+    cache.get_or_load('c', lambda: 'c')
+
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.get_or_load('b', lambda: 'b2') == 'b2'
+    assert cache.stats()['evictions'] == 2
@@ -0,0 +1,206 @@
+"""
+Monthly partitions of the transactions table and archives of the old months
+
+With create_tables(connection, partitioned=True) the transactions table is partitioned by month
+on transaction_date: partition pYYYYMM holds the month YYYY-MM (the first one also holds everything
+before it) and pfuture everything after the last month. A query on a date range only reads the
+partitions of that range.
+
+maintain_partitions, run once a month (or more often), creates the partitions of the next months
+and moves the partitions older than keep_months to gzip'd CSV files, one per month:
+    <archive_dir>/transactions_YYYYMM_<partition>.csv.gz
+read_archived_transactions reads them back; LedgerDAO(..., archive_dir=...) adds them to the history.
+
+Example:
+    connection = create_connection("online_bank")
+    maintain_partitions(connection, months_ahead=3, keep_months=12, archive_dir="archive")
+"""
+import csv
+import datetime
+import glob
+import gzip
+import os
+from decimal import Decimal
+
+ARCHIVE_COLUMNS = ['transaction_id', 'account_id', 'counterparty_account_id', 'transaction_type', 'amount', 'transaction_date']
+
+def month_start(date):
+    return datetime.datetime(date.year, date.month, 1)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+def partition_definition(month):
+    """Partition holding the month (and everything before it if it is the first partition)."""
+    bound = add_months(month, 1)
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN (UNIX_TIMESTAMP('{bound:%Y-%m-%d %H:%M:%S}'))"
+
+def partition_clause(months_ahead=3, now=None):
+    """
+    Returns:
+        str: The PARTITION BY clause of the transactions table, from the current month to months_ahead months later.
+    """
+    first = month_start(now or datetime.datetime.now())
+    partitions = [partition_definition(add_months(first, i)) for i in range(months_ahead + 1)]
+    partitions.append("PARTITION pfuture VALUES LESS THAN MAXVALUE")
+    return "PARTITION BY RANGE (UNIX_TIMESTAMP(transaction_date)) (\n    " + ",\n    ".join(partitions) + "\n)"
+
+def list_partitions(cursor):
+    """
+    Returns:
+        list: The months of the partitions of the transactions table, oldest first (without pfuture).
+    """
+    cursor.execute(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'transactions' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    )
+    names = [row[0] for row in cursor.fetchall()]
+    return [datetime.datetime.strptime(name[1:], "%Y%m") for name in names if name != 'pfuture']
+
+def archive_partition(connection, month, archive_dir):
+    """
+    Writes the rows of the partition of month to gzip'd CSV files (one per month of transaction_date).
+    The files are written under a temporary name and renamed when complete, so running it again
+    after a failure rewrites the same files.
+
+    Returns:
+        int: The number of rows archived.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    name = partition_name(month)
+    cursor = connection.cursor()
+    files = {}
+    rows = 0
+    try:
+        cursor.execute(
+            f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM transactions PARTITION ({name}) "
+            "ORDER BY transaction_date, transaction_id"
+        )
+        while True:
+            batch = cursor.fetchmany(10000)
+            if not batch:
+                break
+            for row in batch:
+                row_month = month_start(row[-1])
+                if row_month not in files:
+                    path = os.path.join(archive_dir, f"transactions_{row_month:%Y%m}_{name}.csv.gz")
+                    file = gzip.open(path + ".tmp", 'wt', newline='')
+                    writer = csv.writer(file)
+                    writer.writerow(ARCHIVE_COLUMNS)
+                    files[row_month] = (path, file, writer)
+                files[row_month][2].writerow(row)
+                rows += 1
+    finally:
+        cursor.close()
+        for path, file, _ in files.values():
+            file.close()
+
+    for path, _, _ in files.values():
+        os.replace(path + ".tmp", path)
+    return rows
+
+def maintain_partitions(connection, months_ahead=3, keep_months=12, archive_dir="transactions_archive", now=None,
+                        snapshots=None):
+    """
+    Creates the partitions of the months_ahead next months and archives then drops the partitions
+    of the months older than keep_months. At least one partition is always kept.
+    With snapshots (a BalanceSnapshots), every account with transactions in a partition gets a snapshot
+    before the partition is dropped, so the balances never need the archived rows.
+
+    Returns:
+        dict: The months 'created' and 'archived'.
+    """
+    current = month_start(now or datetime.datetime.now())
+    cursor = connection.cursor()
+    cursor.execute("USE online_bank")
+    months = list_partitions(cursor)
+    if not months:
+        raise ValueError("The transactions table is not partitioned (create_tables(connection, partitioned=True)).")
+
+    created = []
+    month = add_months(months[-1], 1)
+    while month <= add_months(current, months_ahead):
+        created.append(month)
+        month = add_months(month, 1)
+    if created:
+        definitions = ", ".join(partition_definition(month) for month in created)
+        cursor.execute(
+            f"ALTER TABLE transactions REORGANIZE PARTITION pfuture INTO "
+            f"({definitions}, PARTITION pfuture VALUES LESS THAN MAXVALUE)"
+        )
+
+    archived = []
+    oldest_kept = add_months(current, -keep_months)
+    for month in months[:-1]:
+        if month >= oldest_kept:
+            break
+        archive_partition(connection, month, archive_dir)
+        if snapshots is not None:
+            snapshots.cover_before(add_months(month, 1))
+        cursor.execute(f"ALTER TABLE transactions DROP PARTITION {partition_name(month)}")
+        archived.append(month)
+
+    cursor.close()
+    print(f"Partitions created: {len(created)}, archived: {len(archived)}")
+    return {'created': created, 'archived': archived}
+
+def to_datetime(date):
+    if isinstance(date, str):
+        return datetime.datetime.fromisoformat(date)
+    if not isinstance(date, datetime.datetime):
+        return datetime.datetime(date.year, date.month, date.day)
+    return date
+
+def iter_archived_transactions(archive_dir, account_id=None, start_date=None, end_date=None):
+    """
+    Yields the archived transactions (of an account, or of all the accounts) month by month,
+    one row at a time, ordered by date and id (only the files of the months in the date range are read).
+
+    Yields:
+        tuple: One row with the ARCHIVE_COLUMNS, with the types of the rows of the transactions table.
+    """
+    start_date = to_datetime(start_date) if start_date is not None else None
+    end_date = to_datetime(end_date) if end_date is not None else None
+    # the names start with the month, and each month is in one partition
+    for path in sorted(glob.glob(os.path.join(archive_dir, "transactions_*.csv.gz"))):
+        month = datetime.datetime.strptime(os.path.basename(path).split('_')[1], "%Y%m")
+        if start_date is not None and add_months(month, 1) <= start_date:
+            continue
+        if end_date is not None and month >= end_date:
+            continue
+        with gzip.open(path, 'rt', newline='') as file:
+            reader = csv.reader(file)
+            next(reader)
+            for transaction_id, row_account_id, counterparty, transaction_type, amount, date in reader:
+                if account_id is not None and int(row_account_id) != account_id:
+                    continue
+                date = datetime.datetime.fromisoformat(date)
+                if (start_date is not None and date < start_date) or (end_date is not None and date >= end_date):
+                    continue
+                yield (int(transaction_id), int(row_account_id), int(counterparty) if counterparty else None,
+                       transaction_type, Decimal(amount), date)
+
+def read_archived_transactions(archive_dir, account_id, start_date=None, end_date=None, counterparty_account_id=None):
+    """
+    Reads the archived transactions of an account (only the files of the months in the date range).
+
+    Args:
+        archive_dir (str): The directory of the archives.
+        account_id (int): The account.
+        start_date: Only the transactions made from this date (optional).
+        end_date: Only the transactions made before this date (optional).
+        counterparty_account_id (int): Only the transfers with this account (optional).
+
+    Returns:
+        list: One dictionary per transaction (same keys as LedgerDAO.get_transactions), oldest first.
+    """
+    return [
+        dict(zip(ARCHIVE_COLUMNS, row))
+        for row in iter_archived_transactions(archive_dir, account_id, start_date, end_date)
+        if counterparty_account_id is None or row[2] == counterparty_account_id
+    ]